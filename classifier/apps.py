@@ -1,6 +1,32 @@
+import gc
+
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class ClassifierConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'classifier'
+
+    def ready(self):
+        from classifier.metrics import metrics
+        options = getattr(settings, 'FOODLENS_METRICS', {})
+        metrics.configure(enabled=options.get('ENABLED', False), server_timing=options.get('SERVER_TIMING', False))
+
+        # The model is loaded lazily on the first prediction. Deployments that
+        # would rather pay that cost at worker boot can turn this on.
+        if getattr(settings, 'FOODLENS_WARMUP_ON_STARTUP', False):
+            from classifier.ml_models.predict import registry
+            registry.warmup()
+
+        # Load the weights once in a WSGI master that forks its workers
+        # (gunicorn --preload, uwsgi without lazy-apps) so they share them
+        # copy-on-write. The only forward here is static_int8's calibration,
+        # which registry.preload() runs single-threaded: an OpenMP pool started
+        # before fork can deadlock the children. Freezing the GC keeps its
+        # bookkeeping from writing to (and so un-sharing) the preloaded objects.
+        if getattr(settings, 'FOODLENS_PRELOAD_MODEL', False):
+            from classifier.ml_models.predict import registry
+            registry.preload()
+            gc.collect()
+            gc.freeze()
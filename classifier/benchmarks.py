@@ -0,0 +1,290 @@
+import os
+import platform
+import random
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timezone
+from io import BytesIO
+
+from django.conf import settings
+from PIL import Image
+
+# -----------------------------
+# Prediction path benchmarks
+# -----------------------------
+# preprocess: decode_image() of an encoded upload plus preprocess.pixels()
+# predict / segmented_predict: the ml_models entry points on a decoded photo
+# view: POST /predict/ through the Django test client (parsing, inference,
+#       database insert, file storage), against a throwaway test database
+# writes: only the rows one /predict/ writes (Produce lookup, Image insert,
+#       status updates, AnalysisResult), inline, to measure the database
+#       profile (settings.DATABASES) under concurrent writers; size-independent
+BENCHMARKS = ('preprocess', 'predict', 'segmented_predict', 'view', 'writes')
+DATABASE_BENCHMARKS = ('view', 'writes')
+
+DEFAULT_SIZES = ((224, 224), (640, 480), (1920, 1080), (4032, 3024))
+DEFAULT_CONCURRENCY = (1, 4)
+
+
+def percentile(sorted_samples, q: float):
+    """Nearest-rank q-quantile (0 < q <= 1) of an already sorted list."""
+    if not sorted_samples:
+        return None
+    rank = max(1, round(q * len(sorted_samples)))
+    return sorted_samples[min(rank, len(sorted_samples)) - 1]
+
+
+def summarize(latencies, elapsed: float, errors: int = 0) -> dict:
+    """
+    latencies: seconds per call
+    elapsed: wall time of the whole run
+    returns: count, errors, mean/p50/p95/p99/max in milliseconds and calls per second
+    """
+    samples = sorted(latencies)
+    ms = lambda seconds: None if seconds is None else round(seconds * 1000, 3)  # noqa: E731
+    return {
+        'count': len(samples),
+        'errors': errors,
+        'mean_ms': ms(sum(samples) / len(samples)) if samples else None,
+        'p50_ms': ms(percentile(samples, 0.50)),
+        'p95_ms': ms(percentile(samples, 0.95)),
+        'p99_ms': ms(percentile(samples, 0.99)),
+        'max_ms': ms(samples[-1]) if samples else None,
+        'throughput': round(len(samples) / elapsed, 2) if elapsed else None,
+    }
+
+
+def sample_image(size, seed: int = 0, fmt: str = 'JPEG') -> bytes:
+    """
+    An encoded photo-like image of the given (width, height): smooth random
+    colour blobs, so it compresses (and decodes) like a photo rather than noise.
+    """
+    width, height = size
+    rng = random.Random(seed)
+    coarse = (max(1, width // 32), max(1, height // 32))
+    img = Image.frombytes('RGB', coarse, rng.randbytes(coarse[0] * coarse[1] * 3))
+    buf = BytesIO()
+    img.resize(size, Image.Resampling.BICUBIC).save(buf, format=fmt, quality=85)
+    return buf.getvalue()
+
+
+def run(call, concurrency: int, iterations: int, warmup: int = 0) -> dict:
+    """
+    Time call() from `concurrency` threads, `iterations` times each.
+    call() returns a falsy value (or raises) to count as an error.
+    """
+    for _ in range(warmup):
+        call()
+
+    latencies, errors, lock = [], [0], threading.Lock()
+
+    def worker(_):
+        timings, failed = [], 0
+        for _ in range(iterations):
+            start = time.perf_counter()
+            try:
+                ok = call()
+            except Exception:
+                ok = False
+            timings.append(time.perf_counter() - start)
+            failed += not ok
+        with lock:
+            latencies.extend(timings)
+            errors[0] += failed
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    return summarize(latencies, time.perf_counter() - start, errors[0])
+
+
+@contextmanager
+def stub_model(seed: int = 0):
+    """Serve the tiny random stand-in model (classifier.ml_models.stub) for the duration."""
+    from classifier.ml_models.labels import GROUPS
+    from classifier.ml_models.predict import registry
+    from classifier.ml_models.stub import build_stub_model
+
+    labels = [label for pair in GROUPS.values() for label in pair]
+    registry.set_model(build_stub_model(labels, seed=seed), revision='stub')
+    try:
+        yield registry
+    finally:
+        registry.reset()
+
+
+@contextmanager
+def view_environment():
+    """
+    What the database benchmarks need: a throwaway test database (a file for
+    SQLite, so request threads share it), a temporary MEDIA_ROOT and no
+    prediction cache, so every request runs the model.
+    """
+    from django.db import connections
+    from django.test.utils import (
+        override_settings, setup_databases, setup_test_environment, teardown_databases, teardown_test_environment,
+    )
+    from classifier.cache import prediction_cache
+
+    workdir = tempfile.mkdtemp(prefix='foodlens-bench-')
+    for alias in connections:
+        test_settings = connections[alias].settings_dict.setdefault('TEST', {})
+        if 'sqlite' in connections[alias].settings_dict['ENGINE'] and not test_settings.get('NAME'):
+            test_settings['NAME'] = os.path.join(workdir, f'{alias}.sqlite3')
+
+    cache_state = prediction_cache.max_entries, prediction_cache.backend
+    prediction_cache.max_entries, prediction_cache.backend = 0, None
+    setup_test_environment()
+    databases = setup_databases(verbosity=0, interactive=False)
+    media = override_settings(MEDIA_ROOT=os.path.join(workdir, 'media'))
+    media.enable()
+    try:
+        yield
+    finally:
+        from classifier.persistence import results, writer
+
+        writer.wait()
+        results.flush()
+        media.disable()
+        teardown_databases(databases, verbosity=0)
+        teardown_test_environment()
+        prediction_cache.max_entries, prediction_cache.backend = cache_state
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _calls(benchmark, image_bytes):
+    """call() for one benchmark on one encoded image."""
+    from classifier.ml_models import predict
+    from classifier.ml_models.labels import GROUPS
+    from classifier.ml_models.preprocessing import decode_image
+
+    if benchmark == 'preprocess':
+        input_size = predict.registry.input_size
+        return lambda: predict.preprocess.pixels(decode_image(image_bytes, target_size=input_size)) is not None
+
+    if benchmark in ('predict', 'segmented_predict'):
+        img = Image.open(BytesIO(image_bytes)).convert('RGB')
+        if benchmark == 'predict':
+            return lambda: bool(predict.predict(img))
+        produce = next(iter(GROUPS))
+        return lambda: bool(predict.segmented_predict(img, produce))
+
+    if benchmark == 'writes':
+        return _write_path
+
+    from django.test import Client
+    from django.urls import reverse
+
+    url, clients = reverse('predict'), threading.local()
+
+    def post():
+        if not hasattr(clients, 'client'):
+            clients.client = Client()
+        upload = BytesIO(image_bytes)
+        upload.name = 'bench.jpg'
+        return clients.client.post(url, {'image': upload}).status_code == 200
+    return post
+
+
+def _write_path():
+    """The database writes of one /predict/ request and its background jobs, minus the file."""
+    from classifier.persistence import analysis_result
+    from ui.models import Image as ImageModel, Produce as ProduceModel
+
+    produce, _ = ProduceModel.objects.get_or_create(name='unspecified', defaults={'category': 'unknown'})
+    image_obj = ImageModel.objects.create(produce=produce, status='pending')
+    ImageModel.objects.filter(pk=image_obj.pk).update(status='processing')
+    ImageModel.objects.filter(pk=image_obj.pk).update(status='analyzed')
+    analysis_result(image_obj.pk, [{'label': 'Fresh Apple', 'prob': 0.9}], None, 'bench').save()
+    return True
+
+
+def environment(stub: bool) -> dict:
+    """What a run's numbers depend on, stored with the results."""
+    import torch
+    from classifier.ml_models import predict
+
+    return {
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'torch': torch.__version__,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'torch_threads': torch.get_num_threads(),
+        'model': 'stub' if stub else predict.registry.revision,
+        'backend': predict.registry.backend,
+        'batch_max_size': predict.BATCH_MAX_SIZE,
+        'batch_max_wait_ms': predict.BATCH_MAX_WAIT_MS,
+        'async_persistence': getattr(settings, 'FOODLENS_ASYNC_PERSISTENCE', True),
+        'database': settings.DATABASES['default']['ENGINE'].rsplit('.', 1)[-1],
+    }
+
+
+def run_suite(benchmarks=BENCHMARKS, sizes=DEFAULT_SIZES, concurrency=DEFAULT_CONCURRENCY,
+              iterations: int = 20, warmup: int = 3, stub: bool = True, progress=None):
+    """
+    Run every benchmark for every image size and concurrency level.
+    stub: use the stand-in model (offline, measures everything but the real network)
+    progress: optional callable receiving each result as it is produced
+    returns: {'environment': {...}, 'results': [{'benchmark', 'size', 'concurrency', ...summarize()}]}
+    """
+    from classifier.ml_models.predict import registry
+
+    report = {'results': []}
+    with (stub_model() if stub else nullcontext()):
+        registry.get()
+        report['environment'] = environment(stub)
+        report['environment'].update(iterations=iterations, warmup=warmup)
+        with (view_environment() if set(benchmarks) & set(DATABASE_BENCHMARKS) else nullcontext()):
+            for benchmark in benchmarks:
+                for size in (sizes[:1] if benchmark == 'writes' else sizes):
+                    call = _calls(benchmark, sample_image(size))
+                    for level in concurrency:
+                        result = {
+                            'benchmark': benchmark,
+                            'size': f'{size[0]}x{size[1]}',
+                            'concurrency': level,
+                            **run(call, level, iterations, warmup),
+                        }
+                        report['results'].append(result)
+                        if progress:
+                            progress(result)
+    return report
+
+
+def compare(baseline: dict, current: dict, threshold: float = 0.10):
+    """
+    Match the results of two runs by (benchmark, size, concurrency).
+    A result regressed when its p50 latency grew, or its throughput fell, by
+    more than threshold (a fraction).
+    returns: list of {'benchmark', 'size', 'concurrency', 'baseline_p50_ms',
+             'current_p50_ms', 'p50_change', 'throughput_change', 'regression'}
+    """
+    key = lambda result: (result['benchmark'], result['size'], result['concurrency'])  # noqa: E731
+    before = {key(result): result for result in baseline['results']}
+
+    def change(old, new):
+        return None if not old or new is None else round((new - old) / old, 4)
+
+    rows = []
+    for result in current['results']:
+        old = before.get(key(result))
+        if old is None:
+            continue
+        p50_change = change(old['p50_ms'], result['p50_ms'])
+        throughput_change = change(old['throughput'], result['throughput'])
+        rows.append({
+            'benchmark': result['benchmark'],
+            'size': result['size'],
+            'concurrency': result['concurrency'],
+            'baseline_p50_ms': old['p50_ms'],
+            'current_p50_ms': result['p50_ms'],
+            'p50_change': p50_change,
+            'throughput_change': throughput_change,
+            'regression': (p50_change or 0) > threshold or (throughput_change or 0) < -threshold,
+        })
+    return rows
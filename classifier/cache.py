@@ -0,0 +1,128 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+class PredictionCache:
+    """
+    Remembers model output per uploaded image so re-uploads of the same photo
+    (retries, double taps) skip decoding and inference.
+
+    Keys are a SHA-256 of the uploaded bytes plus the model revision and the
+    selected produce type. Lookups go to an in-process LRU first and then to an
+    optional Django cache backend shared between workers.
+
+    max_entries: size of the in-process LRU (0 disables it)
+    backend: alias of a CACHES entry used as the shared tier, or None
+    timeout: TTL in seconds for entries in the shared tier
+    """
+
+    key_prefix = 'foodlens:predict:'
+
+    def __init__(self, max_entries: int = 256, backend: str = None, timeout: int = 3600):
+        self.max_entries = max_entries
+        self.backend = backend
+        self.timeout = timeout
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_settings(cls):
+        options = getattr(settings, 'FOODLENS_PREDICTION_CACHE', {})
+        return cls(
+            max_entries=options.get('MAX_ENTRIES', 256),
+            backend=options.get('BACKEND'),
+            timeout=options.get('TIMEOUT', 3600),
+        )
+
+    @classmethod
+    def key(cls, data, revision: str, produce_type: str = None) -> str:
+        """data: uploaded bytes (or any buffer); returns the cache key for this request."""
+        return cls.digest_key(hashlib.sha256(data).hexdigest(), revision, produce_type)
+
+    @staticmethod
+    def digest_key(digest: str, revision: str, produce_type: str = None) -> str:
+        """key() for an upload whose SHA-256 hex digest is already known."""
+        return f'{revision}:{produce_type or "-"}:{digest}'
+
+    def get(self, key: str):
+        """Return the cached result for key, or None (counted as a miss)."""
+        value = self._lookup(key)
+        if value is None and self.backend:
+            value = self._shared_hit(key, caches[self.backend].get(self.key_prefix + key))
+        if value is None:
+            self._miss()
+        return value
+
+    async def aget(self, key: str):
+        """get() for async views; the shared tier is awaited."""
+        value = self._lookup(key)
+        if value is None and self.backend:
+            value = self._shared_hit(key, await caches[self.backend].aget(self.key_prefix + key))
+        if value is None:
+            self._miss()
+        return value
+
+    def set(self, key: str, value):
+        self._remember(key, value)
+        if self.backend:
+            caches[self.backend].set(self.key_prefix + key, value, self.timeout)
+
+    async def aset(self, key: str, value):
+        self._remember(key, value)
+        if self.backend:
+            await caches[self.backend].aset(self.key_prefix + key, value, self.timeout)
+
+    def clear(self):
+        """Empty the in-process tier and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.shared_hits = self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'shared_hits': self.shared_hits,
+                'misses': self.misses,
+            }
+
+    def _lookup(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            return value
+
+    def _shared_hit(self, key, value):
+        if value is not None:
+            self._remember(key, value)
+            with self._lock:
+                self.hits += 1
+                self.shared_hits += 1
+        return value
+
+    def _miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def _remember(self, key, value):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+prediction_cache = PredictionCache.from_settings()
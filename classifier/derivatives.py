@@ -0,0 +1,116 @@
+import logging
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db.models import Q
+from PIL import Image, ImageOps
+
+from classifier.ml_models.decoding import load_pixels
+from ui.models import Image as ImageModel
+
+logger = logging.getLogger(__name__)
+
+# Image fields filled in by create_derivatives()
+DERIVATIVE_FIELDS = ('display_path', 'thumbnail_path', 'model_input_path')
+
+EXTENSIONS = {'WEBP': '.webp', 'AVIF': '.avif'}
+
+
+def options() -> dict:
+    """FOODLENS_IMAGE_DERIVATIVES with defaults filled in."""
+    return {
+        'ENABLED': True,
+        'FORMAT': 'WEBP',
+        'QUALITY': 80,
+        'DISPLAY_SIZE': 1600,
+        'THUMBNAIL_SIZE': 256,
+        'MODEL_SIZE': 224,
+        **getattr(settings, 'FOODLENS_IMAGE_DERIVATIVES', {}),
+    }
+
+
+def _encode(img, fmt, **params) -> bytes:
+    buf = BytesIO()
+    img.save(buf, format=fmt, **params)
+    return buf.getvalue()
+
+
+def render(source, opts: dict = None) -> dict:
+    """
+    Encode the derivatives of one original.
+    source: path or seekable file of the stored original
+    opts: options() (read from settings when not given)
+    returns: {Image field name: (file extension, encoded bytes)}
+    raises: whatever PIL raises for an unreadable image
+
+    The display copy and thumbnail are upright (EXIF orientation applied)
+    and lossy. The model copy is exactly what load_pixels() feeds the model
+    (no orientation fix, bilinear resize), stored losslessly, so scoring it
+    gives the same result as scoring the original.
+    """
+    opts = opts or options()
+    fmt = opts['FORMAT'].upper()
+    extension = EXTENSIONS[fmt]
+    display_size, thumbnail_size = opts['DISPLAY_SIZE'], opts['THUMBNAIL_SIZE']
+
+    with Image.open(source) as original:
+        if original.format == 'JPEG':
+            original.draft('RGB', (display_size, display_size))  # let libjpeg downscale while decoding
+        img = ImageOps.exif_transpose(original)
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+
+        img.thumbnail((display_size, display_size), Image.LANCZOS, reducing_gap=3.0)
+        display = _encode(img, fmt, quality=opts['QUALITY'])
+        img.thumbnail((thumbnail_size, thumbnail_size), Image.LANCZOS, reducing_gap=3.0)
+        thumbnail = _encode(img, fmt, quality=opts['QUALITY'])
+
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    size = opts['MODEL_SIZE']
+    pixels = load_pixels(source, size=size)
+    if pixels is None:
+        raise ValueError("Could not decode image for the model copy")
+    model_input = _encode(Image.frombytes('RGB', (size, size), pixels), fmt, lossless=True)
+
+    return {
+        'display_path': (extension, display),
+        'thumbnail_path': (f'.thumb{extension}', thumbnail),
+        'model_input_path': (f'.{size}{extension}', model_input),
+    }
+
+
+def create_derivatives(image_ids, force: bool = False) -> int:
+    """
+    Render and store the derivatives of Image rows whose original is stored.
+    image_ids: Image primary keys
+    force: also redo images that already have them
+    returns: number of images given derivatives
+    """
+    opts = options()
+    images = ImageModel.objects.filter(pk__in=image_ids).exclude(image_path='').exclude(image_path__isnull=True)
+    if not force:
+        images = images.filter(Q(display_path='') | Q(display_path__isnull=True))
+
+    done = []
+    for image in images:
+        try:
+            with image.image_path.open('rb') as f:
+                rendered = render(f, opts)
+        except Exception:
+            logger.warning('Could not make derivatives of image %s', image.pk, exc_info=True)
+            continue
+
+        stem = os.path.splitext(os.path.basename(image.image_path.name))[0]
+        for field_name, (suffix, data) in rendered.items():
+            field = getattr(image, field_name)
+            previous = field.name
+            field.save(f'{stem}{suffix}', ContentFile(data), save=False)
+            if previous:  # a forced redo; drops the old file (or reference)
+                field.storage.delete(previous)
+        done.append(image)
+
+    ImageModel.objects.bulk_update(done, DERIVATIVE_FIELDS)
+    return len(done)
@@ -0,0 +1,387 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import socketserver
+import struct
+import threading
+
+from django.conf import settings
+
+from classifier.metrics import metrics
+from classifier.uploads import max_image_pixels
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------
+# Wire protocol
+# -----------------------------
+# Every message is a 4-byte big-endian length followed by that many bytes.
+# A request is two messages: a JSON header and the concatenated image bytes
+# (header['sizes'] gives each image's length). The reply is one JSON message
+# whose 'status' is 'ok', 'busy' or 'error'.
+_LENGTH = struct.Struct('>I')
+
+
+class InferenceError(Exception):
+    pass
+
+
+class InferenceBusy(InferenceError):
+    """The server already has as many requests in flight as it accepts."""
+
+
+class InferenceUnavailable(InferenceError):
+    """The server could not be reached or did not answer in time."""
+
+
+def _frame(data: bytes) -> bytes:
+    return _LENGTH.pack(len(data)) + data
+
+
+def _send(sock, data: bytes):
+    sock.sendall(_LENGTH.pack(len(data)))
+    # no empty write: the server may already have answered and hung up
+    if data:
+        sock.sendall(data)
+
+
+def _recv_exactly(sock, size: int) -> bytes:
+    buf = bytearray(size)
+    view = memoryview(buf)
+    while size:
+        received = sock.recv_into(view, size)
+        if not received:
+            raise ConnectionError("Connection closed mid-message")
+        view, size = view[received:], size - received
+    return bytes(buf)
+
+
+def _recv(sock) -> bytes:
+    (size,) = _LENGTH.unpack(_recv_exactly(sock, _LENGTH.size))
+    return _recv_exactly(sock, size)
+
+
+# -----------------------------
+# Client (used by the web workers; never imports torch)
+# -----------------------------
+class InferenceClient:
+    """
+    Talks to a `manage.py run_inference_server` process over its Unix socket.
+    One short-lived connection per request.
+
+    path: socket path
+    timeout: seconds to wait for a reply before giving up
+    """
+
+    def __init__(self, path: str, timeout: float = 10.0):
+        self.path = path
+        self.timeout = timeout
+        # model revision the server last reported
+        self.revision = None
+
+    def info(self) -> dict:
+        """returns: {'revision', 'input_size'} of the model the server runs"""
+        reply = self._request({'op': 'info'})
+        self.revision = reply['revision']
+        return reply
+
+    def analyze(self, images, top_k: int = 3, selected_label: str = None):
+        """
+        images: list of encoded image bytes
+        returns: one {'predictions', 'segmented_result'} (or {'error'}) dict per image
+        """
+        reply = self._request(*self._analyze_request(images, top_k, selected_label))
+        self.revision = reply['revision']
+        return reply['results']
+
+    async def info_async(self) -> dict:
+        """info() without blocking the event loop."""
+        reply = await self._request_async({'op': 'info'})
+        self.revision = reply['revision']
+        return reply
+
+    async def analyze_async(self, images, top_k: int = 3, selected_label: str = None):
+        """analyze() without blocking the event loop."""
+        reply = await self._request_async(*self._analyze_request(images, top_k, selected_label))
+        self.revision = reply['revision']
+        return reply['results']
+
+    @staticmethod
+    def _analyze_request(images, top_k, selected_label):
+        header = {'op': 'analyze', 'top_k': top_k, 'selected_label': selected_label,
+                  'sizes': [len(data) for data in images]}
+        return header, b''.join(images)
+
+    def _request(self, header, payload=b''):
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.settimeout(self.timeout)
+                sock.connect(self.path)
+                _send(sock, json.dumps(header).encode())
+                _send(sock, payload)
+                reply = json.loads(_recv(sock))
+        except (OSError, ConnectionError) as exc:  # includes refused, missing socket and timeouts
+            raise InferenceUnavailable(f"Inference server at {self.path}: {exc}") from exc
+        return self._check(reply)
+
+    async def _request_async(self, header, payload=b''):
+        async def exchange():
+            reader, writer = await asyncio.open_unix_connection(self.path)
+            try:
+                writer.write(_frame(json.dumps(header).encode()))
+                writer.write(_LENGTH.pack(len(payload)))
+                writer.write(payload)
+                await writer.drain()
+                (size,) = _LENGTH.unpack(await reader.readexactly(_LENGTH.size))
+                return json.loads(await reader.readexactly(size))
+            finally:
+                writer.close()
+
+        try:
+            reply = await asyncio.wait_for(exchange(), self.timeout)
+        except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError) as exc:
+            raise InferenceUnavailable(f"Inference server at {self.path}: {exc!r}") from exc
+        return self._check(reply)
+
+    def _check(self, reply):
+        if reply['status'] == 'busy':
+            raise InferenceBusy(f"Inference server at {self.path} is saturated")
+        if reply['status'] != 'ok':
+            raise InferenceError(reply.get('error', 'Inference failed'))
+        return reply
+
+
+# -----------------------------
+# Server (owns the model)
+# -----------------------------
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        try:
+            header = json.loads(_recv(self.request))
+            payload = _recv(self.request)
+        except (OSError, ConnectionError, ValueError):
+            return
+        _send(self.request, json.dumps(self.server.reply(header, payload)).encode())
+
+
+class InferenceServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Serves predictions on a Unix socket, one thread per connection. Single
+    images from concurrent connections are merged by predict.py's micro-batcher.
+
+    path: socket path (replaced if it exists)
+    max_pending: requests in flight at once; further ones are answered 'busy'
+                 right away instead of queueing behind the model
+    """
+
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, path: str, max_pending: int = 32):
+        self.path = path
+        self.max_pending = max_pending
+        self._slots = threading.BoundedSemaphore(max_pending)
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        super().__init__(path, _Handler)
+
+    def reply(self, header, payload):
+        from classifier.ml_models.predict import registry
+
+        if header.get('op') == 'info':
+            registry.get()
+            return {'status': 'ok', 'revision': registry.revision, 'input_size': registry.input_size}
+        if header.get('op') != 'analyze':
+            return {'status': 'error', 'error': f"Unknown op {header.get('op')!r}"}
+
+        if not self._slots.acquire(blocking=False):
+            return {'status': 'busy'}
+        try:
+            images, offset = [], 0
+            for size in header['sizes']:
+                images.append(payload[offset:offset + size])
+                offset += size
+            results = analyze_local(images, header.get('top_k', 3), header.get('selected_label'))
+            return {'status': 'ok', 'revision': registry.revision, 'results': results}
+        except Exception as exc:
+            logger.exception('Inference request failed')
+            metrics.error('inference')
+            return {'status': 'error', 'error': str(exc)}
+        finally:
+            self._slots.release()
+
+
+# -----------------------------
+# Entry points for the views
+# -----------------------------
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def _client():
+    """The InferenceClient for FOODLENS_INFERENCE_SERVER, or None to run in-process."""
+    options = getattr(settings, 'FOODLENS_INFERENCE_SERVER', {})
+    path = options.get('SOCKET')
+    if not path:
+        return None
+    timeout = options.get('TIMEOUT', 10.0)
+    with _clients_lock:
+        client = _clients.get((path, timeout))
+        if client is None:
+            client = _clients[(path, timeout)] = InferenceClient(path, timeout)
+        return client
+
+
+def _fallback_local():
+    return getattr(settings, 'FOODLENS_INFERENCE_SERVER', {}).get('FALLBACK_LOCAL', False)
+
+
+def _decode(source, input_size):
+    """returns: (RGB image, None), or (None, error dict) for an unreadable or oversized image"""
+    from classifier.ml_models.preprocessing import ImageTooLarge, decode_image
+
+    try:
+        # decodes close to model size rather than the full-resolution photo
+        with metrics.stage('decode'):
+            return decode_image(source, target_size=input_size, max_pixels=max_image_pixels()), None
+    except ImageTooLarge:
+        return None, {"error": "Image is too large"}
+    except Exception:
+        metrics.error('decode')
+        return None, {"error": "Could not read image"}
+
+
+def _encoded(source):
+    """The bytes to send to the inference server for an image given as bytes or a file path."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return source
+    with open(source, 'rb') as f:
+        return f.read()
+
+
+def analyze_local(images, top_k: int = 3, selected_label: str = None):
+    """
+    In-process inference.
+    images: encoded images as bytes or file paths
+    returns: one result dict per image, as InferenceClient.analyze() returns
+    """
+    # imported here so that URL loading (and every manage.py command) doesn't import torch
+    from classifier.ml_models import predict
+
+    outputs, decoded = [None] * len(images), []
+    for i, source in enumerate(images):
+        img, outputs[i] = _decode(source, predict.registry.input_size)
+        if img is not None:
+            decoded.append((i, img))
+
+    if len(decoded) == 1:
+        # single images go through the micro-batcher
+        analyzed = [predict.analyze(decoded[0][1], top_k=top_k, selected_label=selected_label)]
+    else:
+        analyzed = predict.analyze_batch([img for _, img in decoded], top_k=top_k, selected_label=selected_label)
+
+    for (i, _), (top_preds, segmented_result) in zip(decoded, analyzed):
+        outputs[i] = {"predictions": top_preds, "segmented_result": segmented_result}
+    return outputs
+
+
+def _local_revision() -> str:
+    """
+    Revision of the in-process model. It is only final once the model is
+    loaded (a backend or an exported artifact changes it), so this loads it.
+    """
+    from classifier.ml_models.predict import registry
+    registry.get()
+    return registry.revision
+
+
+def model_revision() -> str:
+    """Revision of the model answering predictions (used in cache keys and results)."""
+    client = _client()
+    if client is None:
+        return _local_revision()
+
+    if client.revision is None:
+        try:
+            client.info()
+        except InferenceUnavailable:
+            if not _fallback_local():
+                raise
+            return _local_revision()
+    return client.revision
+
+
+async def model_revision_async() -> str:
+    """model_revision() without blocking the event loop."""
+    client = _client()
+    if client is not None and client.revision is None:
+        try:
+            await client.info_async()
+        except InferenceUnavailable:
+            if not _fallback_local():
+                raise
+            client = None
+    if client is not None:
+        return client.revision
+
+    from classifier.ml_models.predict import registry
+    if registry.loaded:
+        return registry.revision
+    return await asyncio.to_thread(_local_revision)
+
+
+def analyze_images(images, top_k: int = 3, selected_label: str = None):
+    """
+    Classify encoded images on the inference server when one is configured,
+    in this process otherwise.
+    images: encoded images as bytes or file paths
+    returns: (revision, one {'predictions', 'segmented_result'} or {'error'} dict per image)
+    raises: InferenceBusy / InferenceUnavailable when the server can't take the request
+            (unavailable falls back to in-process inference with FALLBACK_LOCAL)
+    """
+    client = _client()
+    if client is not None:
+        try:
+            outputs = client.analyze([_encoded(source) for source in images], top_k, selected_label)
+            return client.revision, outputs
+        except InferenceUnavailable:
+            if not _fallback_local():
+                raise
+            logger.warning('Inference server unavailable, running in-process', exc_info=True)
+
+    from classifier.ml_models.predict import registry
+    outputs = analyze_local(images, top_k, selected_label)
+    return registry.revision, outputs
+
+
+async def analyze_images_async(images, top_k: int = 3, selected_label: str = None):
+    """
+    analyze_images() for async views: talks to the inference server over an
+    asyncio connection, or decodes in the default executor and awaits the
+    micro-batcher, so no thread is held while a request waits for the model.
+    """
+    client = _client()
+    if client is not None:
+        try:
+            outputs = await client.analyze_async([_encoded(source) for source in images], top_k, selected_label)
+            return client.revision, outputs
+        except InferenceUnavailable:
+            if not _fallback_local():
+                raise
+            logger.warning('Inference server unavailable, running in-process', exc_info=True)
+
+    from classifier.ml_models import predict
+
+    if len(images) != 1:
+        outputs = await asyncio.to_thread(analyze_local, images, top_k, selected_label)
+        return predict.registry.revision, outputs
+
+    img, error = await asyncio.to_thread(_decode, images[0], predict.registry.input_size)
+    if error is not None:
+        return predict.registry.revision, [error]
+    top_preds, segmented_result = await predict.analyze_async(img, top_k=top_k, selected_label=selected_label)
+    return predict.registry.revision, [{"predictions": top_preds, "segmented_result": segmented_result}]
@@ -0,0 +1,266 @@
+import json
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import CookieJar
+from urllib.error import HTTPError, URLError
+from urllib.parse import urljoin
+from urllib.request import HTTPCookieProcessor, Request, build_opener
+
+from classifier.benchmarks import sample_image, summarize
+
+# -----------------------------
+# Load generation against a running deployment
+# -----------------------------
+# Requests are sent open-loop: each one leaves at its scheduled time whether or
+# not earlier ones have finished, and its latency is counted from that time,
+# so a saturated server shows up as growing latency instead of a lower send rate.
+
+# endpoint name -> URL path
+ENDPOINTS = {
+    'predict': '/predict/',
+    'feedback': '/home/submit-feedback/',
+    'login': '/home/ajax-login/',
+    'signup': '/home/ajax-signup/',
+}
+
+DEFAULT_MIX = {'predict': 70, 'feedback': 20, 'login': 7, 'signup': 3}
+
+# page that hands out the CSRF cookie the AJAX login/signup endpoints require
+CSRF_PAGE = '/home/signup/'
+
+PASSWORD = 'loadtest-password'
+
+
+def parse_mix(value: str) -> dict:
+    """'predict=70,feedback=30' -> {'predict': 70.0, 'feedback': 30.0}"""
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise ValueError(f"Unknown endpoint {name!r} (choose from {', '.join(ENDPOINTS)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def synthesize(rate: float, duration: float, mix=None, seed: int = 0, arrival: str = 'poisson'):
+    """
+    A schedule of `rate` requests per second for `duration` seconds.
+    mix: endpoint -> relative weight (DEFAULT_MIX)
+    arrival: 'poisson' (exponential gaps, like independent users) or 'uniform'
+    returns: list of (offset seconds, {'endpoint': ...})
+    """
+    mix = mix or DEFAULT_MIX
+    rng = random.Random(seed)
+    names, weights = list(mix), list(mix.values())
+
+    schedule, offset = [], 0.0
+    while True:
+        offset += rng.expovariate(rate) if arrival == 'poisson' else 1 / rate
+        if offset >= duration:
+            return schedule
+        schedule.append((offset, {'endpoint': rng.choices(names, weights)[0]}))
+
+
+def read_trace(path: str, speed: float = 1.0):
+    """
+    A schedule from a recorded trace: one JSON object per line with
+    'endpoint' (a key of ENDPOINTS) and 'at' (seconds, relative or epoch),
+    plus optional 'produce_type' for predictions. Replayed `speed` times as
+    fast as it was recorded.
+    returns: list of (offset seconds, entry)
+    """
+    entries = []
+    with open(path) as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if entry.get('endpoint') not in ENDPOINTS or not isinstance(entry.get('at'), (int, float)):
+                raise ValueError(f"{path}:{number}: expected 'endpoint' (one of {', '.join(ENDPOINTS)}) and 'at'")
+            entries.append(entry)
+
+    entries.sort(key=lambda entry: entry['at'])
+    start = entries[0]['at'] if entries else 0
+    return [((entry['at'] - start) / speed, entry) for entry in entries]
+
+
+def _multipart(fields, files):
+    """(body, content type) for a multipart/form-data request."""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, (filename, data) in files.items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+            f'Content-Type: image/jpeg\r\n\r\n'.encode() + data + b'\r\n'
+        )
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+class Session:
+    """One visitor: a cookie jar (session and CSRF cookies) and its CSRF token."""
+
+    def __init__(self, base_url: str, timeout: float):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.cookies = CookieJar()
+        self.opener = build_opener(HTTPCookieProcessor(self.cookies))
+
+    def request(self, path, body=None, content_type=None, headers=None):
+        """returns: (status, response body); HTTP errors are returned, not raised"""
+        request = Request(urljoin(self.base_url, path), data=body, headers=headers or {})
+        if content_type:
+            request.add_header('Content-Type', content_type)
+        try:
+            with self.opener.open(request, timeout=self.timeout) as response:
+                return response.status, response.read()
+        except HTTPError as exc:
+            return exc.code, exc.read()
+
+    def post_json(self, path, payload, csrf=False):
+        headers = {'X-CSRFToken': self.csrf_token()} if csrf else {}
+        return self.request(path, json.dumps(payload).encode(), 'application/json', headers)
+
+    def csrf_token(self):
+        token = self._cookie('csrftoken')
+        if token is None:
+            self.request(CSRF_PAGE)
+            token = self._cookie('csrftoken') or ''
+        return token
+
+    def _cookie(self, name):
+        return next((cookie.value for cookie in self.cookies if cookie.name == name), None)
+
+
+class LoadTest:
+    """
+    Sends schedules of requests to a running server and collects per-endpoint
+    latency, throughput and status codes.
+
+    base_url: e.g. http://127.0.0.1:8000
+    images: encoded images to upload to /predict/ (cycled through)
+    workers: most requests in flight at once
+    timeout: seconds before a request counts as failed
+    users: accounts created up front for the login requests
+    """
+
+    def __init__(self, base_url: str, images, workers: int = 64, timeout: float = 30.0, users: int = 5):
+        self.base_url = base_url
+        self.images = list(images)
+        self.workers = workers
+        self.timeout = timeout
+        self.users = users
+
+        self._lock = threading.Lock()
+        self._image_ids = []
+        self._usernames = []
+        self._sent = 0
+
+    def setup(self):
+        """Create the login accounts and one prediction for feedback to refer to (not measured)."""
+        for _ in range(self.users):
+            username = f'loadtest-{uuid.uuid4().hex[:12]}'
+            status, _ = Session(self.base_url, self.timeout).post_json(
+                ENDPOINTS['signup'], {'username': username, 'password': PASSWORD}, csrf=True
+            )
+            if status == 200:
+                self._usernames.append(username)
+        self.send({'endpoint': 'predict'})
+
+    def send(self, entry):
+        """Send one request described by a schedule entry; returns its status (0 if it failed)."""
+        endpoint = entry['endpoint']
+        session = Session(self.base_url, self.timeout)
+        try:
+            if endpoint == 'predict':
+                status, body = self._predict(session, entry)
+            elif endpoint == 'feedback':
+                status, body = session.post_json(ENDPOINTS['feedback'], {
+                    'image_id': self._pick(self._image_ids), 'helpful': random.random() < 0.8, 'explanation': '',
+                })
+            elif endpoint == 'login':
+                status, body = session.post_json(
+                    ENDPOINTS['login'], {'username': self._pick(self._usernames), 'password': PASSWORD}, csrf=True
+                )
+            else:
+                status, body = session.post_json(
+                    ENDPOINTS['signup'],
+                    {'username': f'loadtest-{uuid.uuid4().hex[:12]}', 'password': PASSWORD}, csrf=True,
+                )
+        except (URLError, OSError):  # refused, reset, timed out
+            return 0
+        return status
+
+    def _predict(self, session, entry):
+        with self._lock:
+            data = self.images[self._sent % len(self.images)]
+            self._sent += 1
+        fields = {'produce_type': entry['produce_type']} if entry.get('produce_type') else {}
+        body, content_type = _multipart(fields, {'image': ('loadtest.jpg', data)})
+        status, body = session.request(ENDPOINTS['predict'], body, content_type)
+        if status == 200:
+            image_id = json.loads(body).get('image_id')
+            with self._lock:
+                self._image_ids.append(image_id)
+                del self._image_ids[:-1000]
+        return status, body
+
+    def _pick(self, values):
+        with self._lock:
+            return random.choice(values) if values else None
+
+    def run(self, schedule) -> dict:
+        """
+        Send every (offset, entry) of a schedule at its offset from now.
+        returns: {endpoint: summarize() plus 'statuses'}, with an 'all' entry
+        """
+        results = []  # (endpoint, status, latency)
+        start = time.perf_counter()
+
+        def fire(due, entry):
+            status = self.send(entry)
+            results.append((entry['endpoint'], status, time.perf_counter() - due))
+
+        with ThreadPoolExecutor(self.workers, thread_name_prefix='loadtest') as pool:
+            for offset, entry in schedule:
+                due = start + offset
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(fire, due, entry)
+        elapsed = time.perf_counter() - start
+
+        report = {}
+        for endpoint in [*ENDPOINTS, 'all']:
+            rows = [row for row in results if endpoint in ('all', row[0])]
+            if not rows:
+                continue
+            statuses = {}
+            for _, status, _ in rows:
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+            errors = sum(1 for _, status, _ in rows if not 200 <= status < 400)
+            report[endpoint] = {
+                **summarize([latency for _, _, latency in rows], elapsed, errors),
+                'error_rate': round(errors / len(rows), 4),
+                'statuses': statuses,
+            }
+        return report
+
+
+def saturated(report: dict, target_rate: float, max_error_rate: float = 0.01) -> bool:
+    """A step is past saturation when the server no longer keeps up with the offered rate or starts failing."""
+    overall = report.get('all')
+    if not overall:
+        return False
+    return overall['throughput'] < 0.9 * target_rate or overall['error_rate'] > max_error_rate
+
+
+def default_images(count: int = 16, sizes=((640, 480), (1280, 960))):
+    """Distinct photo-like uploads, so the prediction cache doesn't answer every request."""
+    return [sample_image(sizes[i % len(sizes)], seed=i) for i in range(count)]
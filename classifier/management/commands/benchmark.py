@@ -0,0 +1,103 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from classifier.benchmarks import BENCHMARKS, DEFAULT_CONCURRENCY, DEFAULT_SIZES, compare, run_suite
+
+
+def image_size(value):
+    try:
+        width, height = (int(part) for part in value.lower().split('x'))
+    except ValueError:
+        raise ValueError(f"{value!r} is not WIDTHxHEIGHT") from None
+    return width, height
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark preprocessing, predict(), segmented_predict(), the /predict/ view and its database writes "
+        "over image sizes and concurrency levels, against a tiny random stand-in model "
+        "unless --real-model is given. --compare BASELINE CURRENT reports regressions "
+        "between two saved runs."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--benchmark', choices=BENCHMARKS, action='append',
+                            help="Benchmark to run (repeatable). Defaults to all of them.")
+        parser.add_argument('--sizes', nargs='+', type=image_size,
+                            help="Image sizes as WIDTHxHEIGHT (default: 224x224 640x480 1920x1080 4032x3024).")
+        parser.add_argument('--concurrency', nargs='+', type=int,
+                            help="Concurrent callers per run (default: 1 4).")
+        parser.add_argument('--iterations', type=int, default=20, help="Timed calls per caller (default 20).")
+        parser.add_argument('--warmup', type=int, default=3, help="Untimed calls before each run (default 3).")
+        parser.add_argument('--real-model', action='store_true',
+                            help="Use the configured model instead of the stand-in.")
+        parser.add_argument('--output', help="Write the results as JSON to this file.")
+        parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'),
+                            help="Compare two result files instead of running.")
+        parser.add_argument('--threshold', type=float, default=0.10,
+                            help="Slowdown (fraction of p50 latency or throughput) counted as a "
+                                 "regression in --compare (default 0.10).")
+
+    def handle(self, *args, **options):
+        if options['compare']:
+            return self._compare(*options['compare'], options['threshold'])
+
+        if options['iterations'] < 1:
+            raise CommandError("--iterations must be at least 1")
+
+        self.stdout.write(f"{'benchmark':<18}{'size':>11}{'conc':>6}{'p50 ms':>10}{'p95 ms':>10}"
+                          f"{'p99 ms':>10}{'per s':>10}{'errors':>8}")
+        report = run_suite(
+            benchmarks=options['benchmark'] or BENCHMARKS,
+            sizes=options['sizes'] or DEFAULT_SIZES,
+            concurrency=options['concurrency'] or DEFAULT_CONCURRENCY,
+            iterations=options['iterations'],
+            warmup=options['warmup'],
+            stub=not options['real_model'],
+            progress=self._row,
+        )
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+    def _row(self, result):
+        self.stdout.write(
+            f"{result['benchmark']:<18}{result['size']:>11}{result['concurrency']:>6}"
+            f"{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}{result['p99_ms']:>10.2f}"
+            f"{result['throughput']:>10.1f}{result['errors']:>8}"
+        )
+
+    def _compare(self, baseline_path, current_path, threshold):
+        runs = []
+        for path in (baseline_path, current_path):
+            try:
+                with open(path) as f:
+                    runs.append(json.load(f))
+            except (OSError, ValueError) as exc:
+                raise CommandError(f"Could not read {path}: {exc}")
+
+        rows = compare(*runs, threshold=threshold)
+        if not rows:
+            raise CommandError("The two runs have no benchmark, size and concurrency in common")
+
+        self.stdout.write(f"{'benchmark':<18}{'size':>11}{'conc':>6}{'p50 before':>12}{'p50 now':>10}"
+                          f"{'p50':>9}{'per s':>9}")
+        for row in rows:
+            flag = '  REGRESSION' if row['regression'] else ''
+            self.stdout.write(
+                f"{row['benchmark']:<18}{row['size']:>11}{row['concurrency']:>6}"
+                f"{row['baseline_p50_ms']:>12.2f}{row['current_p50_ms']:>10.2f}"
+                f"{_percent(row['p50_change']):>9}{_percent(row['throughput_change']):>9}{flag}"
+            )
+
+        regressions = [row for row in rows if row['regression']]
+        if regressions:
+            raise CommandError(f"{len(regressions)} of {len(rows)} results regressed by more than {threshold:.0%}")
+        self.stdout.write(self.style.SUCCESS(f"No regressions over {threshold:.0%} in {len(rows)} results"))
+
+
+def _percent(change):
+    return '-' if change is None else f'{change:+.1%}'
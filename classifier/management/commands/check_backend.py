@@ -0,0 +1,59 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from classifier.ml_models.backend_names import BACKENDS
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare CPU inference backends against the fp32 model on a folder of sample images: "
+        "top-1 agreement, fresh/rotten agreement and latency per image."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('images', help="Directory of sample images.")
+        parser.add_argument('--backend', action='append', choices=BACKENDS[1:],
+                            help="Backend to check (repeatable). Defaults to all of them.")
+        parser.add_argument('--limit', type=int, default=256, help="Most sample images to use (default 256).")
+        parser.add_argument('--calibration-dir',
+                            help="Images to calibrate static_int8 with. Defaults to FOODLENS_CALIBRATION_DIR, "
+                                 "then to the sample images themselves (which flatters the result).")
+        parser.add_argument('--json', action='store_true', help="Print the results as JSON.")
+
+    def handle(self, *args, **options):
+        # imported here so that listing management commands doesn't import torch
+        from classifier.ml_models.backends import compare_backend
+        from classifier.ml_models.label_index import LabelIndex
+        from classifier.ml_models.predict import calibration_batch, registry
+
+        inputs = calibration_batch(options['images'], limit=options['limit'])
+        if inputs is None or not len(inputs):
+            raise CommandError(f"No readable images in {options['images']}")
+
+        calibration = calibration_batch(options['calibration_dir']) if options['calibration_dir'] else None
+        if calibration is None:
+            calibration = calibration_batch()
+        if calibration is None:
+            calibration = inputs
+
+        reference = registry.load_pretrained()
+        label_index = LabelIndex(reference.config.id2label, registry.groups)
+
+        reports = [
+            compare_backend(reference, backend, inputs, label_index, calibration=calibration)
+            for backend in options['backend'] or BACKENDS[1:]
+        ]
+
+        if options['json']:
+            self.stdout.write(json.dumps(reports, indent=2))
+            return
+
+        self.stdout.write(f"{len(inputs)} images, fp32 reference from {registry.default_revision}\n")
+        self.stdout.write(f"{'backend':<15}{'top-1 agree':>13}{'fresh/rotten agree':>20}{'ms/img':>9}{'speedup':>9}")
+        for report in reports:
+            speedup = report['reference_ms_per_image'] / report['backend_ms_per_image']
+            self.stdout.write(
+                f"{report['backend']:<15}{report['top1_agreement']:>13.2%}{report['freshness_agreement']:>20.2%}"
+                f"{report['backend_ms_per_image']:>9.2f}{speedup:>8.2f}x"
+            )
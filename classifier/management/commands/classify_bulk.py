@@ -0,0 +1,200 @@
+import json
+import multiprocessing
+import os
+import time
+from functools import partial
+from itertools import islice
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from classifier import derivatives
+from classifier.ml_models.labels import GROUPS
+from classifier.ml_models.decoding import load_pixels
+from classifier.persistence import analysis_result
+from ui.models import AnalysisResult, Image as ImageModel, Produce as ProduceModel
+from ui.storage import DerivativeStorage
+
+
+def _walk_key(name):
+    """
+    Sort key matching the order _directory_items walks in (a directory's own
+    files, then its subdirectories, each sorted), for storage name
+    comparisons on resume; plain string order puts "a/b.jpg" before "z.jpg".
+    """
+    *dirs, filename = name.split('/')
+    return tuple(dirs), filename
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-score stored images with the current model. Decoding and resizing run in a "
+        "process pool, inference runs in batches and AnalysisResult rows are bulk inserted. "
+        "Progress is checkpointed so an interrupted run can be resumed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', help="Classify the image files under this directory instead of the Image table.")
+        parser.add_argument('--produce-type', choices=sorted(GROUPS),
+                            help="Produce selection for the freshness breakdown. Defaults to the one "
+                                 "recorded in each image's latest result, if any.")
+        parser.add_argument('--batch-size', type=int, default=64, help="Images per forward (default 64).")
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help="Decode processes (default: one per core).")
+        parser.add_argument('--checkpoint', default='classify_bulk.checkpoint.json',
+                            help="File recording progress (default classify_bulk.checkpoint.json).")
+        parser.add_argument('--restart', action='store_true', help="Ignore an existing checkpoint.")
+        parser.add_argument('--limit', type=int, help="Stop after this many images.")
+
+    def handle(self, *args, **options):
+        # imported here so that listing management commands doesn't import torch
+        import torch
+        from classifier.ml_models.predict import analyze_pixels, preprocess, registry
+
+        self.source = os.path.abspath(options['dir']) if options['dir'] else 'db'
+        # stored model-size copies decode without any resizing; only usable at the model's input size
+        self.model_copies = derivatives.options()['MODEL_SIZE'] == registry.input_size
+        if options['dir'] and not os.path.isdir(self.source):
+            raise CommandError(f"{options['dir']} is not a directory")
+
+        self.checkpoint_path = options['checkpoint']
+        checkpoint = None if options['restart'] else self._read_checkpoint()
+        position, done_before = (checkpoint['last'], checkpoint['processed']) if checkpoint else (None, 0)
+        items = self._directory_items(position) if options['dir'] else self._db_items(position)
+        if options['limit']:
+            items = islice(items, options['limit'])
+
+        registry.get()
+        batch_size = options['batch_size']
+        processed = failed = 0
+        start = time.perf_counter()
+
+        # spawn rather than fork: the workers only need PIL, not a copy of this process
+        with multiprocessing.get_context('spawn').Pool(options['workers']) as pool:
+            while True:
+                batch = list(islice(items, batch_size))
+                if not batch:
+                    break
+
+                paths = [path for path, _ in batch]
+                decoded = pool.map(partial(load_pixels, size=registry.input_size), paths, chunksize=4)
+                readable = [(key, data) for (_, key), data in zip(batch, decoded) if data is not None]
+                failed += len(batch) - len(readable)
+
+                if readable:
+                    image_ids = self._image_ids([key for key, _ in readable])
+                    labels = self._selected_labels(image_ids, options['produce_type'])
+                    pixels = torch.stack([preprocess.from_bytes(data) for _, data in readable])
+                    outputs = analyze_pixels(pixels, top_k=3, selected_labels=labels)
+
+                    AnalysisResult.objects.bulk_create([
+                        analysis_result(image_id, top_preds, segmented_result, registry.revision)
+                        for image_id, (top_preds, segmented_result) in zip(image_ids, outputs)
+                    ])
+
+                processed += len(batch)
+                self._write_checkpoint(batch[-1][1], done_before + processed)
+                rate = processed / (time.perf_counter() - start)
+                self.stdout.write(f"{processed} images ({failed} unreadable), {rate:.1f} images/sec")
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"Classified {processed - failed} images in {elapsed:.1f}s "
+            f"({processed / elapsed if elapsed else 0:.1f} images/sec), {failed} unreadable"
+        ))
+
+    # -----------------------------
+    # Sources: each yields (file path, key) in a stable order; the key is
+    # what the checkpoint records (Image id or storage name)
+    # -----------------------------
+    def _db_items(self, last_id):
+        rows = (
+            ImageModel.objects.filter(deleted=False, id__gt=last_id or 0)
+            .exclude(image_path='').exclude(image_path__isnull=True)
+            .order_by('id').values_list('id', 'image_path', 'model_input_path')
+        )
+        storage = ImageModel._meta.get_field('image_path').storage
+        for image_id, name, model_copy in rows.iterator(chunk_size=2000):
+            yield storage.path(model_copy if model_copy and self.model_copies else name), image_id
+
+    def _directory_items(self, last_name):
+        media_root = os.path.abspath(settings.MEDIA_ROOT)
+        last = None if last_name is None else _walk_key(last_name)
+        # derivatives are copies of photos already walked, not photos
+        derived = ImageModel._meta.get_field('display_path').storage
+        derived = os.path.abspath(derived.path(derived.directory)) if isinstance(derived, DerivativeStorage) else None
+        for root, dirs, files in os.walk(self.source):
+            dirs[:] = sorted(name for name in dirs if os.path.join(root, name) != derived)
+            for filename in sorted(files):
+                if filename.startswith('.'):
+                    continue
+                path = os.path.join(root, filename)
+                name = os.path.relpath(path, media_root)
+                if name.startswith('..'):
+                    raise CommandError(f"{path} is outside MEDIA_ROOT ({media_root})")
+                name = name.replace(os.sep, '/')
+                if last is None or _walk_key(name) > last:
+                    yield path, name
+
+    def _image_ids(self, keys):
+        """Image ids for a batch of keys, creating rows for files the table doesn't know yet."""
+        if self.source == 'db':
+            return keys
+
+        known = dict(ImageModel.objects.filter(image_path__in=keys).values_list('image_path', 'id'))
+        missing = [name for name in keys if name not in known]
+        if missing:
+            produce, _ = ProduceModel.objects.get_or_create(name='unspecified', defaults={'category': 'unknown'})
+            storage = ImageModel._meta.get_field('image_path').storage
+            with transaction.atomic():
+                created = ImageModel.objects.bulk_create([
+                    ImageModel(produce=produce, image_path=name, status='analyzed') for name in missing
+                ])
+                # the new rows reference files that other rows may share; deleting
+                # one must not remove the file from under the rest
+                for name in missing:
+                    if getattr(storage, 'is_content_addressed', None) and storage.is_content_addressed(name):
+                        storage.retain(name, size=storage.size(name))
+            known.update((image_obj.image_path.name, image_obj.id) for image_obj in created)
+        return [known[name] for name in keys]
+
+    def _selected_labels(self, image_ids, produce_type):
+        if produce_type:
+            return [produce_type] * len(image_ids)
+
+        # reuse the selection recorded with each image's latest result
+        latest = {}
+        rows = (
+            AnalysisResult.objects.filter(image_id__in=image_ids)
+            .order_by('image_id', '-analyzed_at').values_list('image_id', 'predictions')
+        )
+        for image_id, predictions in rows:
+            if image_id not in latest:
+                segmented = (predictions or {}).get('segmented') or {}
+                latest[image_id] = segmented.get('produce_type')
+        return [latest.get(image_id) for image_id in image_ids]
+
+    # -----------------------------
+    # Checkpoint
+    # -----------------------------
+    def _read_checkpoint(self):
+        try:
+            with open(self.checkpoint_path) as f:
+                checkpoint = json.load(f)
+        except FileNotFoundError:
+            return None
+
+        if checkpoint.get('source') != self.source:
+            raise CommandError(
+                f"{self.checkpoint_path} belongs to a run over {checkpoint.get('source')}; "
+                f"use --restart or another --checkpoint"
+            )
+        self.stdout.write(f"Resuming after {checkpoint['last']} ({checkpoint['processed']} done before)")
+        return checkpoint
+
+    def _write_checkpoint(self, last, processed):
+        tmp_path = f'{self.checkpoint_path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'source': self.source, 'last': last, 'processed': processed}, f)
+        os.replace(tmp_path, self.checkpoint_path)
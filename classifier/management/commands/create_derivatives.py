@@ -0,0 +1,67 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models import Q
+
+from classifier.derivatives import create_derivatives
+from ui.models import Image as ImageModel
+
+
+def _create_in_thread(image_ids, force):
+    try:
+        return len(image_ids), create_derivatives(image_ids, force=force)
+    finally:
+        connections.close_all()  # this thread's connections
+
+
+class Command(BaseCommand):
+    help = (
+        "Write the display copy, thumbnail and model-size copy (FOODLENS_IMAGE_DERIVATIVES) "
+        "for stored images that don't have them yet. Safe to interrupt and run again."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50, help="Images per job (default 50).")
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help="Threads encoding in parallel (default: one per core; 1 runs in this thread).")
+        parser.add_argument('--force', action='store_true', help="Redo images that already have derivatives.")
+        parser.add_argument('--limit', type=int, help="Stop after this many images.")
+
+    def handle(self, *args, **options):
+        images = ImageModel.objects.filter(deleted=False).exclude(image_path='').exclude(image_path__isnull=True)
+        if not options['force']:
+            images = images.filter(Q(display_path='') | Q(display_path__isnull=True))
+        ids = images.order_by('id').values_list('id', flat=True).iterator(chunk_size=2000)
+        if options['limit']:
+            ids = islice(ids, options['limit'])
+
+        def batches():
+            while batch := list(islice(ids, options['batch_size'])):
+                yield batch
+
+        processed = created = 0
+        start = time.perf_counter()
+        if options['workers'] > 1:
+            # PIL releases the GIL while decoding and encoding, so threads scale
+            pool = ThreadPoolExecutor(options['workers'])
+            results = pool.map(lambda batch: _create_in_thread(batch, options['force']), batches())
+        else:
+            pool = None
+            results = ((len(batch), create_derivatives(batch, force=options['force'])) for batch in batches())
+
+        try:
+            for count, done in results:
+                processed, created = processed + count, created + done
+                self.stdout.write(f"{processed} images, {processed - created} unreadable")
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"Made derivatives for {created} images in {elapsed:.1f}s, {processed - created} unreadable"
+        ))
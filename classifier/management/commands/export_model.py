@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from classifier.ml_models.backend_names import BACKENDS
+
+
+class Command(BaseCommand):
+    help = (
+        "Export the classifier to a TorchScript (.pt) or ONNX (.onnx) file with its label map "
+        "embedded. Point FOODLENS_MODEL_ARTIFACT at the file to serve it without transformers."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help="Output path; the .onnx extension selects ONNX, anything else TorchScript.")
+        parser.add_argument('--backend', choices=BACKENDS, default='eager',
+                            help="Prepare the model for this backend before exporting (TorchScript only "
+                                 "for the int8 backends). static_int8 calibrates on FOODLENS_CALIBRATION_DIR.")
+
+    def handle(self, *args, **options):
+        # imported here so that listing management commands doesn't import torch
+        from classifier.ml_models.artifacts import artifact_format, export_model
+        from classifier.ml_models.backends import prepare_model
+        from classifier.ml_models.predict import calibration_batch, registry
+
+        output, backend = options['output'], options['backend']
+        if artifact_format(output) == 'onnx' and backend.endswith('int8'):
+            raise CommandError("ONNX export needs an fp32 model; quantize with TorchScript (.pt) instead")
+
+        calibration = calibration_batch() if backend == 'static_int8' else None
+        model = prepare_model(registry.load_pretrained(), backend, calibration)
+        revision = registry.default_revision if backend == 'eager' else f"{registry.default_revision}+{backend}"
+
+        export_model(model, output, revision, input_size=registry.input_size)
+        self.stdout.write(self.style.SUCCESS(f"Exported {revision} to {output} ({artifact_format(output)})"))
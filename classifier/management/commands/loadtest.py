@@ -0,0 +1,89 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from classifier.loadtest import DEFAULT_MIX, ENDPOINTS, LoadTest, default_images, parse_mix, read_trace, saturated, synthesize
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive a running FoodLens server with /predict/, feedback and AJAX login/signup "
+        "traffic, replayed from a JSONL trace or synthesized at one or more target rates, "
+        "and report throughput, latency percentiles and error rates per endpoint."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help="Server to test (default http://127.0.0.1:8000).")
+        parser.add_argument('--trace', help="JSONL trace to replay: {'at': seconds, 'endpoint': "
+                                             f"{'|'.join(ENDPOINTS)}}} per line.")
+        parser.add_argument('--speed', type=float, default=1.0, help="Replay the trace this many times faster.")
+        parser.add_argument('--rate', type=float, nargs='+', default=[10.0],
+                            help="Requests per second to synthesize; several rates run one after the other "
+                                 "to find the saturation point (default 10).")
+        parser.add_argument('--duration', type=float, default=30.0, help="Seconds per synthesized rate (default 30).")
+        parser.add_argument('--mix', type=parse_mix,
+                            help="Endpoint weights, e.g. predict=70,feedback=20,login=7,signup=3 (the default).")
+        parser.add_argument('--arrival', choices=('poisson', 'uniform'), default='poisson',
+                            help="Gaps between synthesized requests (default poisson).")
+        parser.add_argument('--images', help="Directory of images to upload instead of generated ones.")
+        parser.add_argument('--workers', type=int, default=64, help="Most requests in flight at once (default 64).")
+        parser.add_argument('--timeout', type=float, default=30.0, help="Seconds per request (default 30).")
+        parser.add_argument('--users', type=int, default=5, help="Accounts created up front for logins (default 5).")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help="Write the reports as JSON to this file.")
+
+    def handle(self, *args, **options):
+        loadtest = LoadTest(
+            options['url'], self._images(options['images']),
+            workers=options['workers'], timeout=options['timeout'], users=options['users'],
+        )
+        loadtest.setup()
+
+        if options['trace']:
+            try:
+                steps = [('trace', None, read_trace(options['trace'], options['speed']))]
+            except (OSError, ValueError) as exc:
+                raise CommandError(f"Could not read trace: {exc}")
+        else:
+            steps = [
+                (f'{rate:g}/s', rate, synthesize(rate, options['duration'], options['mix'] or DEFAULT_MIX,
+                                                 seed=options['seed'], arrival=options['arrival']))
+                for rate in options['rate']
+            ]
+
+        reports = []
+        for name, rate, schedule in steps:
+            self.stdout.write(f"{name}: {len(schedule)} requests")
+            report = loadtest.run(schedule)
+            reports.append({'step': name, 'target_rate': rate, 'endpoints': report})
+            self._print(report)
+            if rate and saturated(report, rate):
+                self.stdout.write(self.style.WARNING(f"Saturated at {name}"))
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({'url': options['url'], 'steps': reports}, f, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+    def _images(self, directory):
+        if not directory:
+            return default_images()
+        images = []
+        for name in sorted(os.listdir(directory)):
+            if name.lower().endswith(('.jpg', '.jpeg', '.png', '.webp')):
+                with open(os.path.join(directory, name), 'rb') as f:
+                    images.append(f.read())
+        if not images:
+            raise CommandError(f"No images in {directory}")
+        return images
+
+    def _print(self, report):
+        self.stdout.write(f"{'endpoint':<10}{'requests':>9}{'per s':>9}{'p50 ms':>10}{'p95 ms':>10}"
+                          f"{'p99 ms':>10}{'errors':>8}  statuses")
+        for endpoint, stats in report.items():
+            statuses = ' '.join(f'{status}:{count}' for status, count in sorted(stats['statuses'].items()))
+            self.stdout.write(
+                f"{endpoint:<10}{stats['count']:>9}{stats['throughput']:>9.1f}{stats['p50_ms']:>10.1f}"
+                f"{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}{stats['error_rate']:>8.1%}  {statuses}"
+            )
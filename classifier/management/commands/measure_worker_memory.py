@@ -0,0 +1,116 @@
+import gc
+import json
+import multiprocessing
+import os
+import queue
+
+from django.core.management.base import BaseCommand, CommandError
+
+MODES = ('preload', 'per-worker')
+
+
+def memory_usage(pid='self'):
+    """
+    Resident memory of a process in bytes: 'rss', plus 'pss' (shared pages
+    split between the processes mapping them) and 'private' when the kernel
+    provides smaps_rollup.
+    """
+    usage = {}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            fields = {'Rss:': 'rss', 'Pss:': 'pss', 'Private_Clean:': 'private', 'Private_Dirty:': 'private'}
+            for line in f:
+                name, value = line.split()[:2]
+                if name in fields:
+                    usage[fields[name]] = usage.get(fields[name], 0) + int(value) * 1024
+    except FileNotFoundError:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    usage['rss'] = int(line.split()[1]) * 1024
+    return usage
+
+
+def _worker(ready, done, image_size):
+    from PIL import Image
+    from classifier.ml_models.predict import analyze, registry
+
+    # loads the model here unless the parent already had it
+    analyze(Image.new('RGB', (image_size, image_size), (120, 160, 60)))
+    ready.put(registry.revision)
+    # stay alive until every worker has been measured, so shared pages are shared
+    done.wait()
+
+
+class Command(BaseCommand):
+    help = (
+        "Fork workers the way a preforking WSGI server does and report each one's "
+        "resident memory after a prediction, with the model loaded before the fork "
+        "(FOODLENS_PRELOAD_MODEL) and/or separately in every worker."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help="Workers to fork (default 4).")
+        parser.add_argument('--mode', choices=MODES, action='append',
+                            help="Loading mode to measure (repeatable). Defaults to both.")
+        parser.add_argument('--json', action='store_true', help="Print the results as JSON.")
+
+    def handle(self, *args, **options):
+        if not os.path.exists('/proc/self/status'):
+            raise CommandError("Measuring worker memory needs Linux /proc")
+
+        from classifier.ml_models.predict import registry
+
+        reports = [self._measure(registry, mode, options['workers']) for mode in options['mode'] or MODES]
+
+        if options['json']:
+            self.stdout.write(json.dumps(reports, indent=2))
+            return
+
+        mb = 1024 * 1024
+        for report in reports:
+            self.stdout.write(f"{report['mode']}: {report['workers']} workers, model {report['revision']}")
+            self.stdout.write(f"{'pid':>10}{'RSS MB':>10}{'PSS MB':>10}{'private MB':>12}")
+            for worker in report['per_worker']:
+                self.stdout.write(
+                    f"{worker['pid']:>10}{worker['rss'] / mb:>10.1f}"
+                    f"{worker.get('pss', 0) / mb:>10.1f}{worker.get('private', 0) / mb:>12.1f}"
+                )
+            self.stdout.write(f"{'total PSS':>10}{report['total_pss'] / mb:>20.1f}\n")
+
+    def _measure(self, registry, mode, workers):
+        # same as FOODLENS_PRELOAD_MODEL does in apps.py
+        if mode == 'preload':
+            registry.preload()
+            gc.collect()
+            gc.freeze()
+        else:
+            registry.reset()
+
+        context = multiprocessing.get_context('fork')
+        ready, done = context.Queue(), context.Event()
+        processes = [
+            context.Process(target=_worker, args=(ready, done, registry.input_size))
+            for _ in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        try:
+            try:
+                revisions = {ready.get(timeout=600) for _ in processes}
+            except queue.Empty:
+                raise CommandError("A worker failed to run its prediction")
+            per_worker = [{'pid': process.pid, **memory_usage(process.pid)} for process in processes]
+        finally:
+            done.set()
+            for process in processes:
+                process.join()
+            gc.unfreeze()
+
+        return {
+            'mode': mode,
+            'workers': workers,
+            'revision': ', '.join(sorted(revisions)),
+            'per_worker': per_worker,
+            'total_pss': sum(worker.get('pss', worker['rss']) for worker in per_worker),
+        }
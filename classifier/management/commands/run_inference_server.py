@@ -0,0 +1,90 @@
+import gc
+import os
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        "Serve predictions on a Unix socket so web workers don't run the model "
+        "themselves (see FOODLENS_INFERENCE_SERVER). With --processes N the model "
+        "is loaded once and N forked processes accept connections on the same socket."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--socket', help="Socket path. Defaults to FOODLENS_INFERENCE_SERVER['SOCKET'].")
+        parser.add_argument('--processes', type=int, default=1, help="Serving processes (default 1).")
+        parser.add_argument('--threads', type=int,
+                            help="Torch intra-op threads per process (default: cores / processes).")
+        parser.add_argument('--max-pending', type=int, default=32,
+                            help="Requests each process works on at once; more are answered busy (default 32).")
+
+    def handle(self, *args, **options):
+        # imported here so that listing management commands doesn't import torch
+        import torch
+        from classifier.inference import InferenceServer
+        from classifier.ml_models.predict import registry
+
+        path = options['socket'] or getattr(settings, 'FOODLENS_INFERENCE_SERVER', {}).get('SOCKET')
+        if not path:
+            raise CommandError("Pass --socket or set FOODLENS_INFERENCE_SERVER['SOCKET']")
+        processes = max(1, options['processes'])
+        threads = options['threads'] or max(1, (os.cpu_count() or 1) // processes)
+
+        # load once before forking so the processes share the weights (no
+        # forward here, see FOODLENS_PRELOAD_MODEL)
+        registry.get()
+        gc.collect()
+        gc.freeze()
+
+        server = InferenceServer(path, max_pending=options['max_pending'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Serving {registry.revision} on {path} with {processes} process(es) x {threads} thread(s)"
+        ))
+
+        if processes == 1:
+            torch.set_num_threads(threads)
+            self._serve(server)
+            os.unlink(path)
+            return
+
+        children = set()
+
+        def stop(signum, frame):
+            for pid in children:
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                except ProcessLookupError:
+                    pass
+            raise SystemExit(0)
+
+        signal.signal(signal.SIGTERM, stop)
+        try:
+            while True:
+                while len(children) < processes:
+                    pid = os.fork()
+                    if pid == 0:
+                        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                        torch.set_num_threads(threads)
+                        self._serve(server)
+                        os._exit(0)
+                    children.add(pid)
+                # replace processes that die
+                pid, status = os.wait()
+                children.discard(pid)
+                self.stderr.write(f"Inference process {pid} exited ({status}), restarting it")
+        except KeyboardInterrupt:
+            stop(None, None)
+        finally:
+            server.server_close()
+            os.unlink(path)
+
+    def _serve(self, server):
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
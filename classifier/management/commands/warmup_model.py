@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Load the classifier model (downloading it if needed) and run one dummy forward."
+
+    def handle(self, *args, **options):
+        # imported here so listing the management commands doesn't import torch
+        from classifier.ml_models.predict import registry
+
+        seconds = registry.warmup()
+        self.stdout.write(self.style.SUCCESS(
+            f"Loaded {registry.revision} on {registry.device} and ran a warmup forward in {seconds:.2f}s"
+        ))
@@ -0,0 +1,235 @@
+import contextvars
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+
+# -----------------------------
+# In-process metrics
+# -----------------------------
+# Stage timers, counters and batch sizes for the prediction path, exposed in
+# the Prometheus text format by the /metrics view. Kept free of Django so
+# ml_models can record into it. Every process (web worker, inference server)
+# keeps its own numbers.
+#
+# Disabled (the default), metrics.stage() hands back one shared no-op context
+# manager and nothing is recorded.
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+_NULL = nullcontext()
+
+# stage -> seconds for the request being handled, when one is being tracked
+_request_timings = contextvars.ContextVar('foodlens_request_timings', default=None)
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(names, values)) + '}'
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels=()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, *label_values, amount: float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        return self._values.get(label_values, 0)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_labels(self.labels, label_values)} {value}')
+        return lines
+
+
+class Histogram:
+    """
+    Prometheus-style histogram: per-bucket counts plus sum and count, per
+    label combination. quantile() estimates percentiles from the buckets the
+    same way PromQL's histogram_quantile() does.
+    """
+
+    def __init__(self, name: str, help: str, buckets, labels=()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        # label values -> [count per bucket (+ one for +Inf), sum]
+        self._series = {}
+
+    def observe(self, value: float, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def count(self, *label_values) -> int:
+        series = self._series.get(label_values)
+        return sum(series[0]) if series else 0
+
+    def quantile(self, q: float, *label_values):
+        """Estimated q-quantile (0 < q < 1), or None without observations."""
+        with self._lock:
+            series = self._series.get(label_values)
+            counts = list(series[0]) if series else None
+        if not counts or not sum(counts):
+            return None
+
+        rank = q * sum(counts)
+        seen, lower = 0, 0.0
+        for upper, count in zip(self.buckets, counts):
+            if count and seen + count >= rank:
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+            lower = upper
+        return self.buckets[-1]  # in the +Inf bucket; the largest finite bound is the best estimate
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def snapshot(self):
+        """{label values: {'count', 'sum', 'p50', 'p95', 'p99'}}"""
+        with self._lock:
+            keys = {label_values: series[1] for label_values, series in self._series.items()}
+        return {
+            label_values: {
+                'count': self.count(*label_values),
+                'sum': total,
+                **{f'p{int(q * 100)}': self.quantile(q, *label_values) for q in (0.5, 0.95, 0.99)},
+            }
+            for label_values, total in keys.items()
+        }
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted((label_values, list(counts), total) for label_values, (counts, total) in self._series.items())
+        for label_values, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                labels = _labels(self.labels + ('le',), label_values + (bound,))
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _labels(self.labels, label_values)
+            lines.append(f'{self.name}_sum{labels} {total}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class _StageTimer:
+    __slots__ = ('metrics', 'name', 'start')
+
+    def __init__(self, metrics, name):
+        self.metrics, self.name = metrics, name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe_stage(self.name, time.perf_counter() - self.start)
+
+
+class Metrics:
+    """
+    The metrics of this process.
+    enabled: record anything at all
+    server_timing: views add a Server-Timing header with their stage timings
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.server_timing = False
+
+        self.stage_seconds = Histogram(
+            'foodlens_stage_seconds', 'Time spent per prediction stage.', LATENCY_BUCKETS, labels=('stage',))
+        self.request_seconds = Histogram(
+            'foodlens_request_seconds', 'Time spent per prediction request.', LATENCY_BUCKETS, labels=('view',))
+        self.batch_size = Histogram(
+            'foodlens_batch_size', 'Images per model forward.', BATCH_SIZE_BUCKETS)
+        self.requests = Counter(
+            'foodlens_requests_total', 'Prediction requests by response status.', labels=('view', 'status'))
+        self.errors = Counter(
+            'foodlens_errors_total', 'Failures by where they happened.', labels=('stage',))
+
+    def configure(self, enabled: bool = False, server_timing: bool = False):
+        self.enabled = enabled
+        self.server_timing = enabled and server_timing
+
+    def stage(self, name: str):
+        """Context manager timing one stage (recorded in the histogram and the current request)."""
+        return _StageTimer(self, name) if self.enabled else _NULL
+
+    def observe_stage(self, name: str, seconds: float):
+        self.stage_seconds.observe(seconds, name)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings[name] = timings.get(name, 0.0) + seconds
+
+    def observe_batch(self, size: int):
+        if self.enabled:
+            self.batch_size.observe(size)
+
+    def error(self, stage: str):
+        if self.enabled:
+            self.errors.inc(stage)
+
+    @contextmanager
+    def request(self, view: str):
+        """
+        Track one request: yields a dict that collects stage -> seconds for
+        every stage timed while it is open (in this thread, or in tasks and
+        threads started with a copy of its context).
+        """
+        timings = {}
+        token = _request_timings.set(timings)
+        start = time.perf_counter()
+        try:
+            yield timings
+        finally:
+            _request_timings.reset(token)
+            timings['total'] = time.perf_counter() - start
+            self.request_seconds.observe(timings['total'], view)
+
+    def clear(self):
+        for metric in (self.stage_seconds, self.request_seconds, self.batch_size, self.requests, self.errors):
+            metric.clear()
+
+    def expose(self):
+        """Every metric as lines of the Prometheus text exposition format."""
+        lines = []
+        for metric in (self.requests, self.errors, self.request_seconds, self.stage_seconds, self.batch_size):
+            lines.extend(metric.expose())
+        return lines
+
+    def snapshot(self) -> dict:
+        """Percentiles per stage and view, for humans (the /metrics?format=json view)."""
+        return {
+            'stages': {stage: stats for (stage,), stats in self.stage_seconds.snapshot().items()},
+            'requests': {view: stats for (view,), stats in self.request_seconds.snapshot().items()},
+            'batch_size': self.batch_size.snapshot().get((), {}),
+        }
+
+
+def server_timing(timings) -> str:
+    """Server-Timing header value for a dict of stage -> seconds."""
+    return ', '.join(f'{name};dur={seconds * 1000:.1f}' for name, seconds in timings.items())
+
+
+metrics = Metrics()
@@ -0,0 +1,102 @@
+import json
+from types import SimpleNamespace
+
+import torch
+
+# -----------------------------
+# Exported model artifacts
+# -----------------------------
+# A TorchScript (.pt) or ONNX (.onnx) file holding the traced classifier with
+# its label map and revision embedded, so serving it needs neither the
+# HuggingFace repo nor `transformers`.
+ARTIFACT_FORMATS = ("torchscript", "onnx")
+METADATA_KEY = "foodlens.json"
+
+
+class _LogitsOnly(torch.nn.Module):
+    """Plain tensor in, logits tensor out; what gets traced/exported."""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, pixel_values):
+        return self.model(pixel_values=pixel_values).logits
+
+
+def artifact_format(path: str) -> str:
+    return "onnx" if str(path).endswith(".onnx") else "torchscript"
+
+
+def export_model(model, path: str, revision: str, input_size: int = 224):
+    """
+    Trace a loaded classifier into an artifact, format picked from the extension.
+    model: HuggingFace image classifier (possibly prepared for a backend)
+    path: output file, .onnx for ONNX, anything else for TorchScript
+    revision: recorded in the artifact and used as the served model's revision
+    """
+    metadata = json.dumps({
+        "id2label": {int(idx): label for idx, label in model.config.id2label.items()},
+        "revision": revision,
+        "input_size": input_size,
+    })
+    wrapped = _LogitsOnly(model).eval()
+    example = torch.zeros(2, 3, input_size, input_size)
+
+    if artifact_format(path) == "torchscript":
+        with torch.no_grad():
+            traced = torch.jit.freeze(torch.jit.trace(wrapped, example, check_trace=False))
+        torch.jit.save(traced, path, _extra_files={METADATA_KEY: metadata})
+        return
+
+    import onnx
+
+    torch.onnx.export(
+        wrapped, (example,), path,
+        input_names=["pixel_values"], output_names=["logits"],
+        dynamic_shapes={"pixel_values": {0: torch.export.Dim("batch")}},
+    )
+    proto = onnx.load(path)
+    onnx.helper.set_model_props(proto, {METADATA_KEY: metadata})
+    onnx.save(proto, path)
+
+
+class ArtifactModel:
+    """
+    Serves an exported artifact behind the same interface predict.py uses for
+    HuggingFace models: model.config.id2label and model(inputs).logits.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.format = artifact_format(path)
+
+        if self.format == "torchscript":
+            extra_files = {METADATA_KEY: ""}
+            self._module = torch.jit.load(path, map_location="cpu", _extra_files=extra_files)
+            metadata = json.loads(extra_files[METADATA_KEY])
+        else:
+            import onnxruntime
+
+            self._session = onnxruntime.InferenceSession(path, providers=onnxruntime.get_available_providers())
+            metadata = json.loads(self._session.get_modelmeta().custom_metadata_map[METADATA_KEY])
+
+        self.config = SimpleNamespace(id2label={int(idx): label for idx, label in metadata["id2label"].items()})
+        self.revision = metadata["revision"]
+        self.input_size = metadata["input_size"]
+
+    def to(self, device):
+        if self.format == "torchscript":
+            self._module.to(device)
+        return self
+
+    def eval(self):
+        return self
+
+    def __call__(self, pixel_values):
+        if self.format == "torchscript":
+            logits = self._module(pixel_values)
+        else:
+            outputs = self._session.run(None, {"pixel_values": pixel_values.cpu().contiguous().numpy()})
+            logits = torch.from_numpy(outputs[0])
+        return SimpleNamespace(logits=logits)
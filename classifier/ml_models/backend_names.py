@@ -0,0 +1,10 @@
+# -----------------------------
+# CPU inference backends
+# -----------------------------
+# eager          fp32, as trained
+# channels_last  fp32 with NHWC weights/inputs (helps convolutions on CPU)
+# dynamic_int8   Linear weights in int8, activations quantized on the fly
+# static_int8    Linear weights and their input activations in int8, activation
+#                ranges calibrated once on sample images
+# (implemented in classifier.ml_models.backends)
+BACKENDS = ("eager", "channels_last", "dynamic_int8", "static_int8")
@@ -0,0 +1,116 @@
+import copy
+import time
+
+import torch
+from torch import nn
+
+# the backend names live in a torch-free module so management commands can
+# offer them as choices without importing torch
+from classifier.ml_models.backend_names import BACKENDS
+
+
+class _StaticQuantized(nn.Module):
+    """Wraps one layer so eager-mode static quantization runs it in int8 and hands back floats."""
+
+    def __init__(self, layer):
+        super().__init__()
+        self.quant = torch.ao.quantization.QuantStub()
+        self.layer = layer
+        self.dequant = torch.ao.quantization.DeQuantStub()
+
+    def forward(self, x):
+        return self.dequant(self.layer(self.quant(x)))
+
+
+def _wrap_for_static(module, qconfig):
+    # wrap individual Linear layers rather than the whole model: HuggingFace
+    # models can't be FX-traced, LayerNorm/softmax have no int8 kernels, and
+    # some models read their conv stem's .weight directly
+    for name, child in module.named_children():
+        if isinstance(child, nn.Linear):
+            wrapped = _StaticQuantized(child)
+            wrapped.qconfig = qconfig
+            setattr(module, name, wrapped)
+        else:
+            _wrap_for_static(child, qconfig)
+
+
+def prepare_model(model, backend: str, calibration=None):
+    """
+    Convert an fp32 eval-mode model for a CPU inference backend (in place).
+    model: HuggingFace image classifier
+    backend: one of BACKENDS
+    calibration: (B, 3, H, W) normalized batch of representative images, required for static_int8
+    returns: the model to serve
+    """
+    if backend == "eager":
+        return model
+
+    if backend == "channels_last":
+        return model.to(memory_format=torch.channels_last)
+
+    if backend == "dynamic_int8":
+        return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+    if backend == "static_int8":
+        if calibration is None:
+            raise ValueError("static_int8 needs calibration images (set FOODLENS_CALIBRATION_DIR)")
+        qconfig = torch.ao.quantization.get_default_qconfig(torch.backends.quantized.engine)
+        _wrap_for_static(model, qconfig)
+        torch.ao.quantization.prepare(model, inplace=True)
+        with torch.no_grad():
+            model(calibration)
+        return torch.ao.quantization.convert(model, inplace=True)
+
+    raise ValueError(f"Unknown inference backend {backend!r}; expected one of {', '.join(BACKENDS)}")
+
+
+def memory_format(backend: str):
+    """Memory format inputs should be in for this backend."""
+    return torch.channels_last if backend == "channels_last" else torch.contiguous_format
+
+
+# -----------------------------
+# Accuracy check
+# -----------------------------
+def compare_backend(reference, backend: str, inputs, label_index, calibration=None, batch_size: int = 32):
+    """
+    Measure how often a backend agrees with the fp32 model, and how fast it is.
+    reference: fp32 model (left untouched; the backend runs on a copy)
+    backend: one of BACKENDS
+    inputs: (N, 3, H, W) normalized sample images
+    label_index: LabelIndex of the model
+    calibration: calibration batch for static_int8
+    returns: dict with 'top1_agreement' (same top-1 class), 'freshness_agreement'
+             (same fresh/rotten call, over every image and produce group) and
+             per-image latency in ms for both models
+    """
+    candidate = prepare_model(copy.deepcopy(reference), backend, calibration)
+    fmt = memory_format(backend)
+
+    def run(model, batch_format):
+        logits, elapsed = [], 0.0
+        with torch.no_grad():
+            for start in range(0, len(inputs), batch_size):
+                batch = inputs[start:start + batch_size].contiguous(memory_format=batch_format)
+                began = time.perf_counter()
+                logits.append(model(batch).logits)
+                elapsed += time.perf_counter() - began
+        return torch.cat(logits).softmax(dim=1), elapsed * 1000 / len(inputs)
+
+    expected, reference_ms = run(reference, torch.contiguous_format)
+    actual, backend_ms = run(candidate, fmt)
+
+    # (N, groups, 2) fresh/rotten probabilities for every produce group
+    pairs = label_index.pairs
+    expected_fresh = expected[:, pairs].argmax(dim=2)
+    actual_fresh = actual[:, pairs].argmax(dim=2)
+
+    return {
+        "backend": backend,
+        "images": len(inputs),
+        "top1_agreement": (expected.argmax(dim=1) == actual.argmax(dim=1)).float().mean().item(),
+        "freshness_agreement": (expected_fresh == actual_fresh).float().mean().item(),
+        "reference_ms_per_image": reference_ms,
+        "backend_ms_per_image": backend_ms,
+    }
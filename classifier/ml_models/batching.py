@@ -0,0 +1,99 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import torch
+
+
+class MicroBatcher:
+    """
+    Collects single-image inference requests coming from many threads and runs
+    them through the model as one stacked batch.
+
+    forward: callable taking a (B, ...) tensor and returning a (B, ...) tensor
+    max_batch_size: most requests merged into one forward
+    max_wait_ms: how long to hold a batch open waiting for more requests
+
+    When a request arrives and nothing else is queued the batch is dispatched
+    immediately, so a lone request never pays the wait window.
+    """
+
+    def __init__(self, forward, max_batch_size: int = 8, max_wait_ms: float = 5.0):
+        self.forward = forward
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._thread = None
+        self._pid = None
+
+    def submit(self, item: torch.Tensor) -> Future:
+        """Queue one (C, H, W) tensor; the future resolves to its row of the batched output."""
+        future = Future()
+        self._ensure_worker().put((item, future))
+        return future
+
+    def __call__(self, item: torch.Tensor, timeout: float = None):
+        return self.submit(item).result(timeout)
+
+    def _ensure_worker(self):
+        # The worker thread does not survive a fork, so a forked WSGI worker
+        # starts its own thread (and queue) on first use.
+        pid = os.getpid()
+        with self._lock:
+            if self._pid != pid or self._thread is None or not self._thread.is_alive():
+                if self._pid != pid:
+                    self._queue = queue.Queue()
+                self._pid = pid
+                self._thread = threading.Thread(
+                    target=self._run, args=(self._queue,), name="foodlens-batcher", daemon=True
+                )
+                self._thread.start()
+            return self._queue
+
+    def _run(self, requests):
+        while True:
+            batch = [requests.get()]
+            self._collect(requests, batch)
+            self._dispatch(batch)
+
+    def _collect(self, requests, batch):
+        # take whatever is already waiting without blocking
+        while len(batch) < self.max_batch_size:
+            try:
+                batch.append(requests.get_nowait())
+            except queue.Empty:
+                break
+
+        # idle: nobody else is waiting, run right away
+        if len(batch) == 1:
+            return
+
+        # under load: hold the batch open for a little while to fill it up
+        deadline = time.monotonic() + self.max_wait_ms / 1000.0
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(requests.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+    def _dispatch(self, batch):
+        batch = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+
+        try:
+            outputs = self.forward(torch.stack([item for item, _ in batch]))
+        except Exception as exc:
+            for _, future in batch:
+                future.set_exception(exc)
+            return
+
+        for row, (_, future) in zip(outputs, batch):
+            future.set_result(row)
@@ -0,0 +1,67 @@
+from io import BytesIO
+
+from PIL import Image
+
+# modes Image.reduce() can work on directly; anything else is converted first
+REDUCIBLE_MODES = ("L", "LA", "RGB", "RGBA", "RGBa", "CMYK", "I", "F")
+
+
+# -----------------------------
+# Decoding
+# -----------------------------
+class ImageTooLarge(ValueError):
+    pass
+
+
+def decode_image(source, target_size: int = 224, max_pixels: int = None) -> Image.Image:
+    """
+    Decode an upload straight to roughly model size instead of full resolution.
+
+    source: encoded image bytes/buffer, file-like object or path
+    target_size: side length the model will resize to
+    max_pixels: raise ImageTooLarge, from the header alone, for images with more pixels
+    returns: RGB PIL Image no smaller than target_size on its short side
+             (unless the original already was)
+
+    JPEGs are decoded with libjpeg's DCT scaling (draft mode), which skips most
+    of the work for 1/2, 1/4 and 1/8 scale. Other formats are box-reduced by
+    an integer factor right after decoding. Colorspace conversion happens last,
+    on the small image.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = BytesIO(source)
+
+    img = Image.open(source)
+    if max_pixels and img.width * img.height > max_pixels:
+        raise ImageTooLarge(f"{img.width}x{img.height} is over {max_pixels} pixels")
+
+    if img.format == "JPEG":
+        img.draft("RGB", (target_size, target_size))
+
+    img.load()
+
+    factor = min(img.width, img.height) // target_size
+    if factor >= 2:
+        if img.mode not in REDUCIBLE_MODES:
+            img = img.convert("RGB")
+        img = img.reduce(factor)
+
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+
+    return img
+
+
+def load_pixels(path, size: int = 224):
+    """
+    Decode an image file and resize it to the model input size.
+    Meant for worker processes: returns the raw RGB bytes (size * size * 3),
+    which pickle cheaply, or None if the file can't be read as an image.
+    """
+    try:
+        img = decode_image(path, target_size=size)
+    except Exception:
+        return None
+    if img.size != (size, size):
+        img = img.resize((size, size), Image.BILINEAR)
+    return img.tobytes()
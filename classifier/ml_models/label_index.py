@@ -0,0 +1,50 @@
+import torch
+
+from classifier.ml_models.labels import GROUPS
+
+
+# -----------------------------
+# Label index
+# -----------------------------
+class LabelIndex:
+    """
+    Maps every produce group to the model's (fresh_idx, rotten_idx) class
+    indices. Built once when the model is loaded; a GROUPS entry that doesn't
+    match a model class fails here instead of on every request.
+
+    id2label: model.config.id2label
+    groups: GROUPS-style mapping of produce -> [fresh class, rotten class]
+    """
+
+    def __init__(self, id2label, groups=GROUPS):
+        self.id2label = {int(idx): label for idx, label in id2label.items()}
+        label2id = {label: idx for idx, label in self.id2label.items()}
+
+        missing = [label for pair in groups.values() for label in pair if label not in label2id]
+        if missing:
+            raise ValueError(f"GROUPS names classes the model doesn't have: {', '.join(missing)}")
+
+        self.groups = list(groups)
+        self.rows = {name: row for row, name in enumerate(self.groups)}
+        # (num_groups, 2) tensor of [fresh_idx, rotten_idx]
+        self.pairs = torch.tensor([[label2id[fresh], label2id[rotten]] for fresh, rotten in groups.values()])
+
+    def pair(self, group: str):
+        """returns: (fresh_idx, rotten_idx) for one produce group"""
+        fresh_idx, rotten_idx = self.pairs[self._row(group)].tolist()
+        return fresh_idx, rotten_idx
+
+    def gather(self, probs, groups):
+        """
+        probs: (B, num_classes) probability matrix
+        groups: B produce group names, one per row of probs
+        returns: (B, 2) tensor of [fresh_prob, rotten_prob] per row
+        """
+        rows = torch.tensor([self._row(group) for group in groups], dtype=torch.long)
+        return probs.gather(1, self.pairs[rows])
+
+    def _row(self, group):
+        try:
+            return self.rows[group]
+        except KeyError:
+            raise ValueError(f"Could not find fresh/rotten classes for {group}") from None
@@ -0,0 +1,15 @@
+# -----------------------------
+# Group fruits
+# -----------------------------
+GROUPS = {
+    "apple": ["Fresh Apple(s)", "Rotten Apple(s)"],
+    "banana": ["Fresh Banana(s)", "Rotten Banana(s)"],
+    "bittergourd": ["Fresh Bittergroud(s)", "Rotten Bittergroud(s)"],
+    "capsicum": ["Fresh Capsicum(s)", "Rotten Capsicum(s)"],
+    "cucumber": ["Fresh Cucumber(s)", "Rotten Cucumber(s)"],
+    "okra": ["Fresh Okra(s)", "Rotten Okra(s)"],
+    "orange": ["Fresh Orange(s)", "Rotten Orange(s)"],
+    "potato": ["Fresh Potato(s)", "Rotten Potato(s)"],
+    "tomato": ["Fresh Tomato(s)", "Rotten Tomato(s)"],
+}
+
@@ -1,12 +1,20 @@
+import asyncio
+import os
+
 import torch
-from transformers import AutoModelForImageClassification
 from PIL import Image
-from torchvision import transforms
+
+from classifier.metrics import metrics
+from classifier.ml_models.batching import MicroBatcher
+from classifier.ml_models.labels import GROUPS
+from classifier.ml_models.preprocessing import Preprocessor, decode_image
+from classifier.ml_models.registry import ModelRegistry
 
 # -----------------------------
 # Paths / HF model
 # -----------------------------
 HF_MODEL_REPO = "dbui836/fruitLens"  # your model repo or local folder
+HF_MODEL_REVISION = os.environ.get("FOODLENS_MODEL_REVISION", "main")  # pin a commit to keep cached results valid
 
 # -----------------------------
 # Device
@@ -14,65 +22,162 @@ HF_MODEL_REPO = "dbui836/fruitLens"  # your model repo or local folder
 DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
 # -----------------------------
-# Load model
+# Inference backend
 # -----------------------------
-model = AutoModelForImageClassification.from_pretrained(
-    HF_MODEL_REPO, use_safetensors=True
-)
-model.to(DEVICE)
-model.eval()
+# eager (fp32), channels_last, dynamic_int8 or static_int8; see backends.py and
+# `manage.py check_backend` for what each costs in accuracy.
+# static_int8 calibrates on the images in FOODLENS_CALIBRATION_DIR at load.
+INFERENCE_BACKEND = os.environ.get("FOODLENS_INFERENCE_BACKEND", "eager")
+CALIBRATION_DIR = os.environ.get("FOODLENS_CALIBRATION_DIR")
+CALIBRATION_IMAGES = 64
+
+# Serve a file written by `manage.py export_model` (.pt TorchScript or .onnx)
+# instead of the HuggingFace model; transformers is then never imported.
+MODEL_ARTIFACT = os.environ.get("FOODLENS_MODEL_ARTIFACT")
 
 # -----------------------------
 # Image preprocessing
 # -----------------------------
-preprocess = transforms.Compose([
-    transforms.Resize((224, 224)),  # match your training image size
-    transforms.ToTensor(),
-    transforms.Normalize(mean=[0.485, 0.456, 0.406],  # standard ImageNet stats
-                         std=[0.229, 0.224, 0.225])
-])
+# Resize to 224x224 (match your training image size) and normalize with the
+# standard ImageNet stats, in a single uint8 -> float pass
+preprocess = Preprocessor(224)
+
+
+def calibration_batch(directory=None, limit: int = CALIBRATION_IMAGES):
+    """Normalized batch of up to `limit` sample images from a directory (default CALIBRATION_DIR)."""
+    directory = directory or CALIBRATION_DIR
+    if not directory:
+        return None
+
+    imgs = []
+    for name in sorted(os.listdir(directory)):
+        try:
+            imgs.append(decode_image(os.path.join(directory, name), target_size=preprocess.size))
+        except Exception:
+            continue
+        if len(imgs) >= limit:
+            break
+    return preprocess.batch(imgs)
 
 # -----------------------------
-# Group fruits
+# Model (loaded lazily on first use, see registry.warmup() to load it eagerly)
 # -----------------------------
-GROUPS = {
-    "apple": ["Fresh Apple(s)", "Rotten Apple(s)"],
-    "banana": ["Fresh Banana(s)", "Rotten Banana(s)"],
-    "bittergourd": ["Fresh Bittergroud(s)", "Rotten Bittergroud(s)"],
-    "capsicum": ["Fresh Capsicum(s)", "Rotten Capsicum(s)"],
-    "cucumber": ["Fresh Cucumber(s)", "Rotten Cucumber(s)"],
-    "okra": ["Fresh Okra(s)", "Rotten Okra(s)"],
-    "orange": ["Fresh Orange(s)", "Rotten Orange(s)"],
-    "potato": ["Fresh Potato(s)", "Rotten Potato(s)"],
-    "tomato": ["Fresh Tomato(s)", "Rotten Tomato(s)"],
-}
+registry = ModelRegistry(
+    HF_MODEL_REPO, DEVICE, input_size=224, hub_revision=HF_MODEL_REVISION,
+    backend=INFERENCE_BACKEND, calibration=calibration_batch, artifact=MODEL_ARTIFACT,
+)
+get_model = registry.get
 
 # -----------------------------
-# Prediction function
+# Micro-batching
 # -----------------------------
-def predict(img: Image.Image, top_k: int = 3):
+# Concurrent requests are merged into one forward of up to BATCH_MAX_SIZE
+# images, waiting at most BATCH_MAX_WAIT_MS for the batch to fill.
+# Set FOODLENS_BATCH_MAX_SIZE=1 to run every request on its own.
+BATCH_MAX_SIZE = int(os.environ.get("FOODLENS_BATCH_MAX_SIZE", "8"))
+BATCH_MAX_WAIT_MS = float(os.environ.get("FOODLENS_BATCH_MAX_WAIT_MS", "5"))
+
+# analyze_batch() splits many-image requests into forwards of at most this many images
+FORWARD_CHUNK_SIZE = int(os.environ.get("FOODLENS_FORWARD_CHUNK_SIZE", "32"))
+
+# -----------------------------
+# Forward pass
+# -----------------------------
+def _run_model(inputs):
     """
-    img: PIL Image
-    top_k: number of top predictions to return
-    returns: list of dicts with keys 'label' and 'prob'
+    inputs: (B, 3, 224, 224) preprocessed batch
+    returns: (B, num_classes) CPU tensor of softmax probabilities
     """
-    inputs = preprocess(img).unsqueeze(0).to(DEVICE)  # add batch dimension
-
-    with torch.no_grad():
-        outputs = model(inputs)
+    metrics.observe_batch(inputs.shape[0])
+    model = get_model()
+    with torch.no_grad(), metrics.stage('forward'):
+        outputs = model(inputs.to(DEVICE, memory_format=registry.memory_format))
         logits = outputs.logits
         probs = torch.softmax(logits, dim=1)
 
-    top_probs, top_indices = torch.topk(probs, top_k)
-    top_probs = top_probs.squeeze(0).cpu().tolist()
-    top_indices = top_indices.squeeze(0).cpu().tolist()
+    return probs.cpu()
+
+
+def _run_pixels(pixels):
+    """
+    pixels: (B, 3, 224, 224) uint8 batch from preprocess.pixels()
+    returns: (B, num_classes) CPU tensor of softmax probabilities
+    """
+    return _run_model(preprocess.normalize(pixels))
 
-    top_predictions = [
-        {"label": model.config.id2label[idx], "prob": prob}
-        for idx, prob in zip(top_indices, top_probs)
+
+# the batcher queues compact uint8 images and normalizes the stacked batch in one pass
+batcher = MicroBatcher(_run_pixels, max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS)
+
+
+def _probabilities(img: Image.Image):
+    """
+    img: PIL Image
+    returns: 1-D CPU tensor of softmax probabilities over every model class
+    """
+    with metrics.stage('preprocess'):
+        pixels = preprocess.pixels(img)
+
+    if BATCH_MAX_SIZE > 1:
+        return batcher(pixels)
+
+    return _run_pixels(pixels.unsqueeze(0))[0]  # add batch dimension
+
+
+def _top_k_batch(probs, top_k: int):
+    """
+    probs: (B, num_classes) probability matrix
+    returns: one [{'label', 'prob'}, ...] list (as returned by predict()) per row
+    """
+    id2label = registry.labels().id2label
+    top_probs, top_indices = torch.topk(probs, top_k, dim=1)
+
+    return [
+        [{"label": id2label[idx], "prob": prob} for idx, prob in zip(row_indices, row_probs)]
+        for row_indices, row_probs in zip(top_indices.tolist(), top_probs.tolist())
     ]
 
-    return top_predictions
+
+def _top_k(probs, top_k: int):
+    """Turn a probability vector into the [{'label', 'prob'}, ...] list returned by predict()."""
+    return _top_k_batch(probs.unsqueeze(0), top_k)[0]
+
+
+def _freshness_batch(probs, selected_labels):
+    """
+    Fresh/rotten breakdown for a whole batch in one gather.
+    probs: (B, num_classes) probability matrix
+    selected_labels: B produce selections (keys of GROUPS), one per row
+    returns: list of the dicts returned by segmented_predict()
+    """
+    pairs = registry.labels().gather(probs, selected_labels).tolist()
+
+    results = []
+    for selected_label, (fresh_prob, rotten_prob) in zip(selected_labels, pairs):
+        results.append({
+            "produce_type": selected_label,
+            "fresh_prob": fresh_prob,
+            "rotten_prob": rotten_prob,
+            "freshness_score": round(fresh_prob * 100, 2),  # 0-100
+            "status": "Fresh" if fresh_prob > rotten_prob else "Rotten",
+        })
+    return results
+
+
+def _freshness(probs, selected_label: str):
+    """Turn a probability vector into the fresh/rotten breakdown returned by segmented_predict()."""
+    return _freshness_batch(probs.unsqueeze(0), [selected_label])[0]
+
+# -----------------------------
+# Prediction function
+# -----------------------------
+def predict(img: Image.Image, top_k: int = 3):
+    """
+    img: PIL Image
+    top_k: number of top predictions to return
+    returns: list of dicts with keys 'label' and 'prob'
+    """
+    return _top_k(_probabilities(img), top_k)
 
 # -----------------------------
 # Segmented prediction function
@@ -81,51 +186,88 @@ def segmented_predict(img: Image.Image, selected_label: str):
     """
     img: PIL Image
     selected_label: produce selection input 
-    conf_threshold: required confidence level to approve input
-    returns: list of dicts with keys 'produce', 'produce_confidence', and 'freshness_predictions'
-    """
-    # Get the fresh and rotten class names for this produce
-    fresh_class, rotten_class = GROUPS[selected_label]
-    
-    # Preprocess and run inference
-    inputs = preprocess(img).unsqueeze(0).to(DEVICE)
-    
-    with torch.no_grad():
-        outputs = model(inputs)
-        logits = outputs.logits
-        probs = torch.softmax(logits, dim=1)
-    
-    # Convert to CPU for processing
-    probs = probs.squeeze(0).cpu()
-    
-    # Find indices for fresh and rotten classes
-    fresh_idx = None
-    rotten_idx = None
-    
-    for idx, label in model.config.id2label.items():
-        if label == fresh_class:
-            fresh_idx = idx
-        elif label == rotten_class:
-            rotten_idx = idx
-    
-    # Handle case where classes aren't found
-    if fresh_idx is None or rotten_idx is None:
-        raise ValueError(f"Could not find fresh/rotten classes for {selected_label}")
-    
-    # Get probabilities
-    fresh_prob = probs[fresh_idx].item()
-    rotten_prob = probs[rotten_idx].item()
-    
-    # Calculate freshness score (0-100)
-    freshness_score = fresh_prob * 100
-    
-    # Determine status
-    status = "Fresh" if fresh_prob > rotten_prob else "Rotten"
-    
-    return {
-        "produce_type": selected_label,
-        "fresh_prob": fresh_prob,
-        "rotten_prob": rotten_prob,
-        "freshness_score": round(freshness_score, 2),
-        "status": status
-    }
\ No newline at end of file
+    returns: dict with keys 'produce_type', 'fresh_prob', 'rotten_prob', 'freshness_score' and 'status'
+    """
+    return _freshness(_probabilities(img), selected_label)
+
+# -----------------------------
+# Combined prediction function
+# -----------------------------
+def analyze(img: Image.Image, top_k: int = 3, selected_label: str = None):
+    """
+    Single forward pass that serves both predict() and segmented_predict().
+    img: PIL Image
+    top_k: number of top predictions to return
+    selected_label: optional produce selection (a key of GROUPS)
+    returns: (top_predictions, segmented_result) where segmented_result is None
+             when no produce was selected
+    """
+    probs = _probabilities(img)
+
+    top_predictions = _top_k(probs, top_k)
+    segmented_result = _freshness(probs, selected_label) if selected_label else None
+
+    return top_predictions, segmented_result
+
+
+async def analyze_async(img: Image.Image, top_k: int = 3, selected_label: str = None):
+    """
+    analyze() for asyncio callers. Resizing and the forward run off the event
+    loop, and waiting on the micro-batcher doesn't hold a thread.
+    """
+    # to_thread (unlike run_in_executor) carries the request's metrics context along
+    with metrics.stage('preprocess'):
+        pixels = await asyncio.to_thread(preprocess.pixels, img)
+
+    if BATCH_MAX_SIZE > 1:
+        probs = await asyncio.wrap_future(batcher.submit(pixels))
+    else:
+        probs = (await asyncio.to_thread(_run_pixels, pixels.unsqueeze(0)))[0]
+
+    top_predictions = _top_k(probs, top_k)
+    segmented_result = _freshness(probs, selected_label) if selected_label else None
+
+    return top_predictions, segmented_result
+
+
+# -----------------------------
+# Batch prediction function
+# -----------------------------
+def analyze_batch(imgs, top_k: int = 3, selected_label: str = None):
+    """
+    analyze() for many images at once, run as real tensor batches of up to
+    FORWARD_CHUNK_SIZE images rather than one forward per image.
+    imgs: list of PIL Images
+    top_k: number of top predictions to return per image
+    selected_label: optional produce selection (a key of GROUPS) applied to every image
+    returns: list of (top_predictions, segmented_result) tuples, in input order
+    """
+    results = []
+    for start in range(0, len(imgs), FORWARD_CHUNK_SIZE):
+        chunk = imgs[start:start + FORWARD_CHUNK_SIZE]
+        with metrics.stage('preprocess'):
+            pixels = torch.stack([preprocess.pixels(img) for img in chunk])
+        results.extend(analyze_pixels(pixels, top_k, [selected_label] * len(chunk)))
+
+    return results
+
+
+def analyze_pixels(pixels, top_k: int = 3, selected_labels=None):
+    """
+    One forward over an already resized batch.
+    pixels: (B, 3, 224, 224) uint8 tensor, e.g. stacked preprocess.pixels() outputs
+    top_k: number of top predictions to return per image
+    selected_labels: optional list of B produce selections (keys of GROUPS or None)
+    returns: list of (top_predictions, segmented_result) tuples, in input order
+    """
+    probs = _run_pixels(pixels)
+    top_predictions = _top_k_batch(probs, top_k)
+
+    segmented_results = [None] * len(top_predictions)
+    rows = [row for row, label in enumerate(selected_labels or []) if label]
+    if rows:
+        segmented = _freshness_batch(probs[rows], [selected_labels[row] for row in rows])
+        for row, result in zip(rows, segmented):
+            segmented_results[row] = result
+
+    return list(zip(top_predictions, segmented_results))
@@ -0,0 +1,66 @@
+import torch
+from PIL import Image
+
+# decoding needs only PIL and lives in its own module so code that never runs
+# the model (e.g. image derivatives in the web workers) can use it without torch
+from classifier.ml_models.decoding import REDUCIBLE_MODES, ImageTooLarge, decode_image, load_pixels  # noqa: F401
+
+# standard ImageNet stats
+MEAN = (0.485, 0.456, 0.406)
+STD = (0.229, 0.224, 0.225)
+
+
+# -----------------------------
+# Tensor preprocessing
+# -----------------------------
+class Preprocessor:
+    """
+    Drop-in replacement for Compose([Resize, ToTensor, Normalize]) that stays
+    in uint8 until the last step.
+
+    The image is resized once (PIL bilinear, same as transforms.Resize) and
+    turned into a uint8 (3, size, size) tensor. ToTensor's /255 and Normalize
+    are folded into one multiply-add, (x / 255 - mean) / std == x * scale - shift,
+    written straight into the output (batch) tensor.
+
+    size: side length of the square model input
+    """
+
+    def __init__(self, size: int = 224, mean=MEAN, std=STD):
+        self.size = size
+        mean = torch.tensor(mean, dtype=torch.float32).view(3, 1, 1)
+        std = torch.tensor(std, dtype=torch.float32).view(3, 1, 1)
+        self.scale = 1.0 / (255.0 * std)
+        self.neg_shift = -mean / std
+
+    def __call__(self, img: Image.Image) -> torch.Tensor:
+        """img: RGB PIL Image; returns: normalized (3, size, size) float tensor"""
+        return self.normalize(self.pixels(img))
+
+    def pixels(self, img: Image.Image) -> torch.Tensor:
+        """img: RGB PIL Image; returns: resized (3, size, size) uint8 tensor"""
+        if img.size != (self.size, self.size):
+            img = img.resize((self.size, self.size), Image.BILINEAR)
+        return self.from_bytes(img.tobytes())
+
+    def from_bytes(self, data) -> torch.Tensor:
+        """data: raw size * size RGB bytes (see load_pixels); returns: (3, size, size) uint8 tensor"""
+        hwc = torch.frombuffer(bytearray(data), dtype=torch.uint8)
+        return hwc.view(self.size, self.size, 3).permute(2, 0, 1)
+
+    def normalize(self, pixels: torch.Tensor, out: torch.Tensor = None) -> torch.Tensor:
+        """
+        pixels: uint8 (3, H, W) or (B, 3, H, W) tensor
+        out: optional float tensor of the same shape to write into
+        returns: normalized float tensor
+        """
+        if out is None:
+            out = torch.empty(pixels.shape, dtype=torch.float32)
+        return torch.addcmul(self.neg_shift, pixels, self.scale, out=out)
+
+    def batch(self, imgs) -> torch.Tensor:
+        """imgs: RGB PIL Images; returns: normalized (B, 3, size, size) float tensor"""
+        out = torch.empty(len(imgs), 3, self.size, self.size, dtype=torch.float32)
+        for row, img in enumerate(imgs):
+            self.normalize(self.pixels(img), out=out[row])
+        return out
@@ -0,0 +1,153 @@
+import threading
+import time
+
+import torch
+
+from classifier.ml_models.artifacts import ArtifactModel
+from classifier.ml_models.backends import memory_format, prepare_model
+from classifier.ml_models.label_index import LabelIndex
+from classifier.ml_models.labels import GROUPS
+
+
+class ModelRegistry:
+    """
+    Holds the classifier model and loads it on first use instead of at import,
+    so management commands and tests that never run inference don't pay for
+    importing transformers and reading the weights.
+
+    repo: HuggingFace repo id or local folder passed to from_pretrained
+    hub_revision: branch, tag or commit of the repo to load
+    device: torch.device the model runs on
+    input_size: side length of the square images the model expects
+    groups: produce groups checked against the model's labels at load time
+    backend: inference backend the model is converted for (see backends.BACKENDS)
+    calibration: callable returning a normalized sample batch, used by static_int8
+    artifact: exported TorchScript/ONNX file to serve instead of the HuggingFace
+              model; transformers is never imported in that case
+    """
+
+    def __init__(self, repo: str, device: torch.device, input_size: int = 224, groups=GROUPS,
+                 hub_revision: str = "main", backend: str = "eager", calibration=None, artifact: str = None):
+        self.repo = repo
+        self.hub_revision = hub_revision
+        self.device = device
+        self.input_size = input_size
+        self.groups = groups
+        self.backend = backend
+        self.calibration = calibration
+        self.artifact = artifact
+        # layout inputs should be passed in for this backend
+        self.memory_format = memory_format(backend)
+        # identifies which weights produced a prediction (used in cache keys)
+        self.revision = self.default_revision
+        self.label_index = None
+
+        self._lock = threading.Lock()
+        self._model = None
+
+    @property
+    def default_revision(self) -> str:
+        return f"{self.repo}@{self.hub_revision}"
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    def get(self):
+        """Return the model, loading it if this is the first call."""
+        model = self._model
+        if model is None:
+            with self._lock:
+                if self._model is None:
+                    self._install(*self._load())
+                model = self._model
+        return model
+
+    def preload(self):
+        """
+        get() in a process that is about to fork its workers. Loading runs no
+        forward except static_int8's calibration pass, which is kept on this
+        thread so torch starts no OpenMP pool for the children to inherit
+        (a pool started before fork can deadlock them).
+        """
+        threads = torch.get_num_threads()
+        torch.set_num_threads(1)
+        try:
+            return self.get()
+        finally:
+            torch.set_num_threads(threads)
+
+    def set_model(self, model, revision: str = "custom"):
+        """Serve an already built model (tests, benchmarks, offline runs)."""
+        with self._lock:
+            self._install(model, revision)
+
+    def labels(self) -> LabelIndex:
+        """Return the label index of the loaded model, loading it if needed."""
+        self.get()
+        return self.label_index
+
+    def reset(self):
+        """Drop the loaded model; the next get() loads it again."""
+        with self._lock:
+            self._model = None
+            self.label_index = None
+            self.revision = self.default_revision
+
+    def warmup(self):
+        """
+        Load the model and run one dummy forward so lazy kernel/allocator
+        initialisation happens before the first real request.
+        returns: seconds spent
+        """
+        start = time.perf_counter()
+        model = self.get()
+        dummy = torch.zeros(1, 3, self.input_size, self.input_size, device=self.device)
+        with torch.no_grad():
+            model(dummy)
+        return time.perf_counter() - start
+
+    def load_pretrained(self):
+        """Load a fresh fp32 copy of the weights without installing it."""
+        # imported here so that importing this module stays cheap
+        from transformers import AutoModelForImageClassification
+
+        model = AutoModelForImageClassification.from_pretrained(
+            self.repo, revision=self.hub_revision, use_safetensors=True
+        )
+        model.eval()
+        return model
+
+    def _load(self):
+        """returns: (model, revision)"""
+        if self.artifact:
+            model = ArtifactModel(self.artifact)
+            return model, model.revision
+        return self.load_pretrained(), self.default_revision
+
+    def _install(self, model, revision):
+        label_index = LabelIndex(model.config.id2label, self.groups)
+
+        if isinstance(model, ArtifactModel):
+            # backends are applied before export (`manage.py export_model --backend`)
+            if self.backend != "eager":
+                raise ValueError("Exported models are served as exported; leave the inference backend at eager")
+            if model.input_size != self.input_size:
+                raise ValueError(f"{model.path} expects {model.input_size}px inputs, not {self.input_size}px")
+            self.label_index = label_index
+            self._model = model.to(self.device)
+            self.revision = revision
+            return
+
+        if self.backend.endswith("int8") and self.device.type != "cpu":
+            raise ValueError(f"The {self.backend} backend only runs on CPU")
+
+        model.to(self.device)
+        model.eval()
+        calibration = self.calibration() if self.backend == "static_int8" and self.calibration else None
+        model = prepare_model(model, self.backend, calibration)
+
+        self.label_index = label_index
+        self._model = model
+        # quantized models give slightly different answers, so they get their own revision
+        self.revision = revision if self.backend == "eager" else f"{revision}+{self.backend}"
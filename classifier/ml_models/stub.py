@@ -0,0 +1,30 @@
+import torch
+
+
+def build_stub_model(labels, seed: int = 0, image_size: int = 224):
+    """
+    Tiny randomly initialised ViT with the same interface as the real
+    classifier (config.id2label, outputs.logits). Used by tests and
+    benchmarks so they run offline and in milliseconds.
+
+    labels: class names in index order
+    seed: torch seed for the random weights
+    """
+    from transformers import ViTConfig, ViTForImageClassification
+
+    config = ViTConfig(
+        image_size=image_size,
+        patch_size=32,
+        hidden_size=32,
+        num_hidden_layers=1,
+        num_attention_heads=2,
+        intermediate_size=64,
+        num_labels=len(labels),
+        id2label={idx: label for idx, label in enumerate(labels)},
+        label2id={label: idx for idx, label in enumerate(labels)},
+    )
+
+    torch.manual_seed(seed)
+    model = ViTForImageClassification(config)
+    model.eval()
+    return model
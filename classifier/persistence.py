@@ -0,0 +1,216 @@
+import atexit
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+
+from classifier import derivatives
+from classifier.metrics import metrics
+from ui.models import AnalysisResult, Image as ImageModel
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundWriter:
+    """
+    Runs storage and database writes on a small thread pool so they stay off
+    the request's critical path.
+
+    Jobs are queued when the surrounding transaction commits. With
+    FOODLENS_ASYNC_PERSISTENCE = False they run inline instead (tests,
+    debugging).
+
+    max_workers: threads writing in parallel
+    """
+
+    def __init__(self, max_workers: int = 2):
+        self.max_workers = max_workers
+
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+
+    def submit(self, fn, *args):
+        """Run fn(*args) in the background once the current transaction commits."""
+        transaction.on_commit(lambda: self.run(fn, *args))
+
+    def run(self, fn, *args):
+        """Run fn(*args) in the background now."""
+        if not getattr(settings, 'FOODLENS_ASYNC_PERSISTENCE', True):
+            fn(*args)
+            return
+        self._get_executor().submit(self._run, fn, *args)
+
+    def wait(self):
+        """Block until every job queued so far has finished."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def _get_executor(self):
+        # worker threads don't survive a fork, so each process gets its own pool
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix='foodlens-writer')
+                self._pid = os.getpid()
+            return self._executor
+
+    @staticmethod
+    def _run(fn, *args):
+        close_old_connections()
+        try:
+            fn(*args)
+        except Exception:
+            logger.exception('Background write %s failed', getattr(fn, '__name__', fn))
+            metrics.error('background_write')
+        finally:
+            close_old_connections()
+
+
+class ResultBuffer:
+    """
+    Collects AnalysisResult rows and inserts them with bulk_create, so
+    recording results costs one INSERT per batch instead of one per request.
+
+    A batch is written when batch_size rows are waiting, every
+    flush_interval seconds, and at interpreter exit.
+
+    batch_size: rows per bulk insert
+    flush_interval: longest time (seconds) a row waits before being written
+    """
+
+    def __init__(self, batch_size: int = 50, flush_interval: float = 2.0):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._lock = threading.Lock()
+        self._pending = []
+        self._timer_pid = None
+
+    def add(self, *results):
+        """Queue AnalysisResult instances once the current transaction commits."""
+        transaction.on_commit(lambda: self._add(results))
+
+    def flush(self):
+        """Insert everything queued so far."""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if pending:
+            with metrics.stage('result_flush'):
+                AnalysisResult.objects.bulk_create(pending, batch_size=self.batch_size)
+
+    def _add(self, results):
+        asynchronous = getattr(settings, 'FOODLENS_ASYNC_PERSISTENCE', True)
+        if asynchronous:
+            self._ensure_timer()
+
+        with self._lock:
+            self._pending.extend(results)
+            full = len(self._pending) >= self.batch_size
+
+        if not asynchronous:
+            self.flush()
+        elif full:
+            writer.run(self.flush)
+
+    def _ensure_timer(self):
+        with self._lock:
+            if self._timer_pid == os.getpid():
+                return
+            # rows inherited through a fork are the parent's to write
+            self._pending = []
+            self._timer_pid = os.getpid()
+        threading.Thread(target=self._flush_periodically, name='foodlens-results', daemon=True).start()
+
+    def _flush_periodically(self):
+        while True:
+            time.sleep(self.flush_interval)
+            BackgroundWriter._run(self.flush)
+
+
+writer = BackgroundWriter(max_workers=getattr(settings, 'FOODLENS_PERSISTENCE_WORKERS', 2))
+
+results = ResultBuffer(
+    batch_size=getattr(settings, 'FOODLENS_RESULT_BATCH_SIZE', 50),
+    flush_interval=getattr(settings, 'FOODLENS_RESULT_FLUSH_SECONDS', 2.0),
+)
+atexit.register(results.flush)
+
+
+def analysis_result(image_id, top_preds, segmented_result, revision):
+    """
+    Build (but don't save) the AnalysisResult for one prediction.
+    With a produce selected the freshness fields come from the fresh/rotten
+    breakdown; otherwise from whether the top label is a Fresh or Rotten class.
+    """
+    freshness_label = freshness_score = None
+    confidence_score = top_preds[0]["prob"] if top_preds else None
+
+    if segmented_result is not None:
+        fresh_prob, rotten_prob = segmented_result["fresh_prob"], segmented_result["rotten_prob"]
+        freshness_label = 'good' if segmented_result["status"] == "Fresh" else 'bad'
+        freshness_score = round(segmented_result["freshness_score"])
+        confidence_score = max(fresh_prob, rotten_prob)
+    elif top_preds:
+        top_label = top_preds[0]["label"]
+        if top_label.startswith("Fresh"):
+            freshness_label = 'good'
+        elif top_label.startswith("Rotten"):
+            freshness_label = 'bad'
+
+    return AnalysisResult(
+        image_id=image_id,
+        freshness_score=freshness_score,
+        freshness_label=freshness_label,
+        confidence_score=confidence_score,
+        predictions={"top_k": top_preds, "segmented": segmented_result},
+        model_revision=revision,
+    )
+
+
+def store_upload(image_id, name, data):
+    """
+    Save the upload for an Image row created by predict_view and move it
+    through processing -> analyzed as the work happens.
+    data: the uploaded bytes, or a File such as uploads.Upload.content()
+    """
+    store_uploads([(image_id, name, data)])
+
+
+def store_uploads(uploads):
+    """
+    store_upload() for many rows: one UPDATE to mark them processing, the
+    file writes, then one bulk UPDATE to record paths and mark them analyzed.
+    Their derivatives (classifier.derivatives) are queued after that.
+    uploads: list of (image_id, name, bytes or File)
+    """
+    ids = [image_id for image_id, _, _ in uploads]
+    ImageModel.objects.filter(pk__in=ids).update(status='processing')
+
+    images = ImageModel.objects.in_bulk(ids)
+    try:
+        for image_id, name, data in uploads:
+            image_obj = images.get(image_id)
+            if image_obj is None:  # deleted before this job ran
+                continue
+            with metrics.stage('file_save'):
+                image_obj.image_path.save(name, data if isinstance(data, File) else ContentFile(data), save=False)
+            image_obj.status = 'analyzed'
+    finally:
+        # every upload, saved or not; a spooled one removes its temp file
+        for _, _, data in uploads:
+            if isinstance(data, File):
+                data.close()
+
+    ImageModel.objects.bulk_update(images.values(), ['image_path', 'status'])
+
+    # display copy, thumbnail and model-size copy, as a job of their own
+    if derivatives.options()['ENABLED']:
+        writer.run(derivatives.create_derivatives, ids)
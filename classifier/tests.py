@@ -1,3 +1,1135 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tarfile
+import tempfile
+import zipfile
+import threading
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+import torch
+from asgiref.sync import async_to_sync
+from PIL import Image as PILImage, ImageFile
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.management import CommandError, call_command
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import LiveServerTestCase, TestCase, override_settings
+from django.urls import path, reverse
+
+from classifier import derivatives, inference, views
+from classifier.cache import PredictionCache, prediction_cache
+from classifier.loadtest import LoadTest, read_trace, synthesize
+from classifier.metrics import Histogram, Metrics, metrics
+from classifier.inference import (
+    InferenceBusy, InferenceClient, InferenceError, InferenceServer, InferenceUnavailable, analyze_local,
+)
+from classifier.ml_models import predict
+from classifier.ml_models.artifacts import ArtifactModel, export_model
+from classifier.ml_models.backends import BACKENDS, compare_backend
+from classifier.ml_models.batching import MicroBatcher
+from classifier.ml_models.label_index import LabelIndex
+from classifier.ml_models.preprocessing import MEAN, STD, ImageTooLarge, Preprocessor, decode_image, load_pixels
+from classifier.ml_models.labels import GROUPS
+from classifier.ml_models.stub import build_stub_model
+from classifier.persistence import ResultBuffer, analysis_result, store_upload, store_uploads
+from classifier.uploads import SpooledUpload
+from ui.models import AnalysisResult, Feedback, Image as ImageModel, Produce, StoredFile
+
+LABELS = [label for pair in GROUPS.values() for label in pair]
+
+
+def make_image_bytes(size=(320, 240), color=(200, 40, 40), fmt='JPEG'):
+    buf = BytesIO()
+    PILImage.new('RGB', size, color).save(buf, format=fmt)
+    return buf.getvalue()
+
+
+class StubModelMixin:
+    """Serve a tiny random model so the tests never download the real one."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        predict.registry.set_model(build_stub_model(LABELS), revision='stub')
+
+    @classmethod
+    def tearDownClass(cls):
+        predict.registry.reset()
+        super().tearDownClass()
+
+
+class ModelRegistryTests(TestCase):
+    def test_model_is_not_loaded_at_import(self):
+        predict.registry.reset()
+        self.assertFalse(predict.registry.loaded)
+
+    def test_management_commands_import_without_torch(self):
+        # `manage.py help <command>` and Django's command discovery load these modules
+        script = (
+            "import importlib, pkgutil, sys, django\n"
+            "django.setup()\n"
+            "import classifier.management.commands as classifier_commands\n"
+            "import ui.management.commands as ui_commands\n"
+            "for package in (classifier_commands, ui_commands):\n"
+            "    for module in pkgutil.iter_modules(package.__path__):\n"
+            "        importlib.import_module(f'{package.__name__}.{module.name}')\n"
+            "        assert 'torch' not in sys.modules, module.name\n"
+        )
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': 'foodLens.settings'}
+        subprocess.run([sys.executable, '-c', script], check=True, cwd=settings.BASE_DIR, env=env)
+
+    def test_warmup_runs_a_forward(self):
+        predict.registry.set_model(build_stub_model(LABELS), revision='stub')
+        try:
+            self.assertGreaterEqual(predict.registry.warmup(), 0)
+            self.assertEqual(predict.registry.revision, 'stub')
+        finally:
+            predict.registry.reset()
+
+
+class BackendTests(TestCase):
+    def setUp(self):
+        generator = torch.Generator().manual_seed(0)
+        self.inputs = torch.randn(16, 3, 224, 224, generator=generator)
+        self.reference = build_stub_model(LABELS)
+        self.label_index = LabelIndex(self.reference.config.id2label, GROUPS)
+
+    def test_every_backend_mostly_agrees_with_fp32(self):
+        for backend in BACKENDS:
+            with self.subTest(backend=backend):
+                report = compare_backend(self.reference, backend, self.inputs, self.label_index,
+                                         calibration=self.inputs[:8])
+                self.assertEqual(report['images'], 16)
+                self.assertGreaterEqual(report['top1_agreement'], 0.8)
+                self.assertGreaterEqual(report['freshness_agreement'], 0.8)
+
+    def test_registry_serves_quantized_model(self):
+        registry = predict.ModelRegistry('stub-repo', torch.device('cpu'), backend='dynamic_int8')
+        registry.set_model(build_stub_model(LABELS), revision='stub')
+
+        self.assertEqual(registry.revision, 'stub+dynamic_int8')
+        logits = registry.get()(self.inputs[:2]).logits
+        self.assertEqual(logits.shape, (2, len(LABELS)))
+
+    def test_preload_calibrates_on_one_thread(self):
+        threads = torch.get_num_threads()
+        seen = []
+
+        def calibration():
+            seen.append(torch.get_num_threads())
+            return self.inputs[:8]
+
+        registry = predict.ModelRegistry('stub-repo', torch.device('cpu'), backend='static_int8',
+                                         calibration=calibration)
+        with mock.patch.object(registry, '_load', return_value=(build_stub_model(LABELS), 'stub')):
+            registry.preload()
+
+        self.assertEqual(seen, [1])
+        self.assertEqual(torch.get_num_threads(), threads)
+        self.assertEqual(registry.revision, 'stub+static_int8')
+
+    def test_static_int8_needs_calibration(self):
+        registry = predict.ModelRegistry('stub-repo', torch.device('cpu'), backend='static_int8')
+        with self.assertRaises(ValueError):
+            registry.set_model(build_stub_model(LABELS))
+
+
+class ArtifactTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+        self.model = build_stub_model(LABELS).eval()
+        self.inputs = torch.randn(3, 3, 224, 224, generator=torch.Generator().manual_seed(0))
+
+    def test_exported_artifacts_match_the_model(self):
+        with torch.no_grad():
+            expected = self.model(pixel_values=self.inputs).logits
+
+        for filename in ('model.pt', 'model.onnx'):
+            with self.subTest(filename=filename):
+                path = os.path.join(self.tmp, filename)
+                export_model(self.model, path, revision='stub@main')
+
+                artifact = ArtifactModel(path)
+                self.assertEqual(artifact.revision, 'stub@main')
+                self.assertEqual(artifact.config.id2label, dict(enumerate(LABELS)))
+                with torch.no_grad():
+                    torch.testing.assert_close(artifact(self.inputs).logits, expected, atol=1e-4, rtol=1e-4)
+
+    def test_registry_serves_artifact_without_transformers(self):
+        path = os.path.join(self.tmp, 'model.pt')
+        export_model(self.model, path, revision='stub@main')
+
+        script = (
+            "import sys, torch\n"
+            "from classifier.ml_models.registry import ModelRegistry\n"
+            f"registry = ModelRegistry('unused', torch.device('cpu'), artifact={path!r})\n"
+            "registry.warmup()\n"
+            "assert registry.revision == 'stub@main', registry.revision\n"
+            "assert 'transformers' not in sys.modules\n"
+        )
+        subprocess.run([sys.executable, '-c', script], check=True, cwd=settings.BASE_DIR)
+
+    def test_artifact_is_served_as_exported(self):
+        path = os.path.join(self.tmp, 'model.pt')
+        export_model(self.model, path, revision='stub@main')
+
+        registry = predict.ModelRegistry('unused', torch.device('cpu'), backend='dynamic_int8', artifact=path)
+        with self.assertRaises(ValueError):
+            registry.get()
+
+    def test_export_command_writes_quantized_torchscript(self):
+        path = os.path.join(self.tmp, 'model.pt')
+        with mock.patch.object(predict.registry, 'load_pretrained', return_value=self.model):
+            call_command('export_model', path, backend='dynamic_int8', stdout=StringIO())
+
+        artifact = ArtifactModel(path)
+        self.assertEqual(artifact.revision, f'{predict.registry.default_revision}+dynamic_int8')
+        self.assertEqual(artifact(self.inputs).logits.shape, (3, len(LABELS)))
+
+
+class MeasureWorkerMemoryCommandTests(TestCase):
+    def tearDown(self):
+        predict.registry.reset()
+
+    def test_reports_memory_per_worker_for_each_mode(self):
+        out = StringIO()
+        with mock.patch.object(predict.registry, '_load', return_value=(build_stub_model(LABELS), 'stub')):
+            call_command('measure_worker_memory', workers=2, json=True, stdout=out)
+
+        reports = json.loads(out.getvalue())
+        self.assertEqual([report['mode'] for report in reports], ['preload', 'per-worker'])
+        for report in reports:
+            self.assertEqual(len(report['per_worker']), 2)
+            self.assertTrue(all(worker['rss'] > 0 for worker in report['per_worker']))
+            self.assertGreater(report['total_pss'], 0)
+
+
+class BenchmarkCommandTests(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def test_writes_one_result_per_benchmark_size_and_concurrency(self):
+        output = os.path.join(self.tmpdir, 'run.json')
+        call_command(
+            'benchmark', benchmark=['preprocess', 'predict', 'segmented_predict'], sizes=[(64, 48), (320, 240)],
+            concurrency=[1, 2], iterations=2, warmup=0, output=output, stdout=StringIO(),
+        )
+
+        with open(output) as f:
+            report = json.load(f)
+        self.assertEqual(report['environment']['model'], 'stub')
+        self.assertEqual(len(report['results']), 3 * 2 * 2)
+        for result in report['results']:
+            self.assertEqual(result['count'], 2 * result['concurrency'])
+            self.assertEqual(result['errors'], 0)
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+
+    def test_compare_flags_regressions(self):
+        result = {'benchmark': 'predict', 'size': '224x224', 'concurrency': 1, 'p50_ms': 10.0, 'throughput': 100.0}
+        paths = []
+        for name, p50 in (('baseline', 10.0), ('current', 10.5), ('slower', 15.0)):
+            paths.append(os.path.join(self.tmpdir, f'{name}.json'))
+            with open(paths[-1], 'w') as f:
+                json.dump({'results': [{**result, 'p50_ms': p50}]}, f)
+
+        out = StringIO()
+        call_command('benchmark', compare=paths[:2], stdout=out)
+        self.assertIn('No regressions', out.getvalue())
+
+        with self.assertRaisesMessage(CommandError, '1 of 1 results regressed'):
+            call_command('benchmark', compare=[paths[0], paths[2]], stdout=StringIO())
+
+
+class DatabaseProfileTests(TestCase):
+    def test_sqlite_transactions_wait_for_the_write_lock(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest("SQLite profile only")
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 20 * 1000)
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+        self.assertEqual(connection.transaction_mode, 'IMMEDIATE')
+
+    def test_predict_writes_under_parallel_load(self):
+        # a separate process, so the benchmark gets a database file (WAL mode
+        # on SQLite) rather than this test run's in-memory one; it inherits
+        # FOODLENS_DATABASE, so running the suite with postgres covers that profile
+        with tempfile.TemporaryDirectory() as tmpdir:
+            output = os.path.join(tmpdir, 'writes.json')
+            subprocess.run(
+                [sys.executable, 'manage.py', 'benchmark', '--benchmark', 'writes', '--concurrency', '1', '8',
+                 '--iterations', '25', '--warmup', '1', '--output', output],
+                check=True, cwd=settings.BASE_DIR, capture_output=True,
+            )
+            with open(output) as f:
+                report = json.load(f)
+
+        self.assertEqual(report['environment']['database'], settings.DATABASES['default']['ENGINE'].rsplit('.', 1)[-1])
+        for result in report['results']:
+            self.assertEqual(result['errors'], 0, result)
+            self.assertEqual(result['count'], 25 * result['concurrency'])
+            self.assertGreater(result['throughput'], 0)
+
+
+class LabelIndexTests(TestCase):
+    def setUp(self):
+        self.index = LabelIndex(dict(enumerate(LABELS)), GROUPS)
+
+    def test_pairs_match_group_labels(self):
+        fresh_idx, rotten_idx = self.index.pair('okra')
+        self.assertEqual([LABELS[fresh_idx], LABELS[rotten_idx]], GROUPS['okra'])
+
+    def test_gather_picks_each_rows_group(self):
+        probs = torch.rand(3, len(LABELS))
+        groups = ['apple', 'tomato', 'apple']
+
+        gathered = self.index.gather(probs, groups)
+
+        for row, group in enumerate(groups):
+            fresh_idx, rotten_idx = self.index.pair(group)
+            self.assertEqual(gathered[row].tolist(), [probs[row, fresh_idx].item(), probs[row, rotten_idx].item()])
+
+    def test_group_missing_from_model_fails_at_load(self):
+        labels = [label.replace('Bittergroud', 'Bittergourd') for label in LABELS]
+        with self.assertRaises(ValueError):
+            predict.registry.set_model(build_stub_model(labels))
+        self.assertFalse(predict.registry.loaded)
+
+    def test_unknown_group(self):
+        with self.assertRaises(ValueError):
+            self.index.pair('durian')
+
+
+class MicroBatcherTests(TestCase):
+    def test_concurrent_requests_get_their_own_rows(self):
+        batch_sizes = []
+
+        def forward(batch):
+            batch_sizes.append(batch.shape[0])
+            return batch.flatten(1).sum(dim=1, keepdim=True)
+
+        batcher = MicroBatcher(forward, max_batch_size=4, max_wait_ms=20)
+        results = {}
+
+        def worker(i):
+            results[i] = batcher(torch.full((3, 2, 2), float(i)), timeout=5).item()
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(16)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(results, {i: 12.0 * i for i in range(16)})
+        self.assertTrue(all(size <= 4 for size in batch_sizes))
+
+    def test_forward_errors_reach_every_caller(self):
+        def forward(batch):
+            raise RuntimeError('boom')
+
+        batcher = MicroBatcher(forward)
+        with self.assertRaises(RuntimeError):
+            batcher(torch.zeros(3, 2, 2), timeout=5)
+
+
+class DecodeImageTests(TestCase):
+    def test_large_jpeg_is_decoded_near_target_size(self):
+        img = decode_image(make_image_bytes(size=(4000, 3000)), target_size=224)
+        self.assertEqual(img.mode, 'RGB')
+        self.assertGreaterEqual(min(img.size), 224)
+        self.assertLessEqual(min(img.size), 2 * 224)
+
+    def test_other_formats_are_reduced_then_converted(self):
+        buf = BytesIO()
+        PILImage.new('LA', (1000, 900)).save(buf, format='PNG')
+
+        img = decode_image(buf.getvalue(), target_size=224)
+
+        self.assertEqual(img.mode, 'RGB')
+        self.assertEqual(img.size, (250, 225))
+
+    def test_pixel_limit_is_checked_before_decoding(self):
+        with mock.patch.object(ImageFile.ImageFile, 'load') as load:
+            with self.assertRaises(ImageTooLarge):
+                decode_image(make_image_bytes(size=(400, 300)), max_pixels=400 * 300 - 1)
+        load.assert_not_called()
+
+    def test_small_images_are_left_alone(self):
+        img = decode_image(make_image_bytes(size=(100, 80)), target_size=224)
+        self.assertEqual(img.size, (100, 80))
+
+
+class PreprocessorTests(TestCase):
+    def setUp(self):
+        from torchvision import transforms
+
+        # the torchvision pipeline Preprocessor replaced
+        self.reference = transforms.Compose([
+            transforms.Resize((224, 224)),
+            transforms.ToTensor(),
+            transforms.Normalize(mean=MEAN, std=STD),
+        ])
+        self.preprocess = Preprocessor(224)
+        generator = torch.Generator().manual_seed(0)
+        self.images = [
+            PILImage.frombytes('RGB', size, torch.randint(0, 256, (size[0] * size[1] * 3,), dtype=torch.uint8,
+                                                          generator=generator).numpy().tobytes())
+            for size in [(640, 480), (224, 224), (150, 300)]
+        ]
+
+    def test_matches_torchvision_pipeline(self):
+        for img in self.images:
+            torch.testing.assert_close(self.preprocess(img), self.reference(img), atol=1e-5, rtol=0)
+
+    def test_batch_matches_single_images(self):
+        batch = self.preprocess.batch(self.images)
+
+        self.assertEqual(batch.shape, (3, 3, 224, 224))
+        for row, img in enumerate(self.images):
+            torch.testing.assert_close(batch[row], self.reference(img), atol=1e-5, rtol=0)
+
+
+class PredictionCacheTests(TestCase):
+    def test_key_depends_on_bytes_revision_and_produce(self):
+        key = PredictionCache.key(b'abc', 'rev1', 'apple')
+        self.assertEqual(key, PredictionCache.key(b'abc', 'rev1', 'apple'))
+        self.assertNotEqual(key, PredictionCache.key(b'abd', 'rev1', 'apple'))
+        self.assertNotEqual(key, PredictionCache.key(b'abc', 'rev2', 'apple'))
+        self.assertNotEqual(key, PredictionCache.key(b'abc', 'rev1', None))
+
+    def test_lru_evicts_least_recently_used(self):
+        cache = PredictionCache(max_entries=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.stats(), {'entries': 2, 'hits': 2, 'shared_hits': 0, 'misses': 1})
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_shared_tier_fills_other_processes(self):
+        PredictionCache(backend='default').set('k', {'x': 1})
+
+        other = PredictionCache(backend='default')
+        self.assertEqual(other.get('k'), {'x': 1})
+        self.assertEqual(other.stats()['shared_hits'], 1)
+
+
+class ResultBufferTests(TestCase):
+    def setUp(self):
+        produce = Produce.objects.create(name='apple', category='fruit')
+        self.image = ImageModel.objects.create(produce=produce)
+        self.top_preds = [{'label': 'Rotten Apple(s)', 'prob': 0.7}, {'label': 'Fresh Apple(s)', 'prob': 0.2}]
+
+    @override_settings(FOODLENS_ASYNC_PERSISTENCE=True)
+    def test_rows_are_written_in_one_bulk_insert(self):
+        buffer = ResultBuffer(batch_size=100, flush_interval=3600)
+        with self.captureOnCommitCallbacks(execute=True):
+            buffer.add(*[analysis_result(self.image.id, self.top_preds, None, 'stub') for _ in range(20)])
+        self.assertEqual(AnalysisResult.objects.count(), 0)
+
+        with self.assertNumQueries(1):
+            buffer.flush()
+        self.assertEqual(AnalysisResult.objects.count(), 20)
+
+    def test_result_from_top_label(self):
+        result = analysis_result(self.image.id, self.top_preds, None, 'stub')
+        self.assertEqual(result.freshness_label, 'bad')
+        self.assertIsNone(result.freshness_score)
+        self.assertEqual(result.confidence_score, 0.7)
+
+    def test_result_from_segmented_prediction(self):
+        segmented = {'produce_type': 'apple', 'fresh_prob': 0.2, 'rotten_prob': 0.7,
+                     'freshness_score': 20.0, 'status': 'Rotten'}
+        result = analysis_result(self.image.id, self.top_preds, segmented, 'stub')
+        self.assertEqual((result.freshness_label, result.freshness_score), ('bad', 20))
+        self.assertEqual(result.predictions['segmented'], segmented)
+
+
+class StoreUploadsTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.produce = Produce.objects.create(name='unspecified', category='unknown')
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def spooled(self, data):
+        path = os.path.join(self.media_root, f'upload-{len(os.listdir(self.media_root))}.tmp')
+        with open(path, 'wb') as f:
+            f.write(data)
+        return SpooledUpload(path, 'apple.jpg')
+
+    def test_rows_deleted_before_the_job_are_skipped(self):
+        kept = ImageModel.objects.create(produce=self.produce)
+        deleted = ImageModel.objects.create(produce=self.produce)
+        uploads = [
+            (deleted.id, 'a.jpg', self.spooled(make_image_bytes(color=(1, 2, 3)))),
+            (kept.id, 'b.jpg', self.spooled(make_image_bytes(color=(4, 5, 6)))),
+        ]
+        deleted.delete()
+
+        with override_settings(FOODLENS_IMAGE_DERIVATIVES={'ENABLED': False}):
+            store_uploads(uploads)
+
+        kept.refresh_from_db()
+        self.assertEqual(kept.status, 'analyzed')
+        self.assertTrue(kept.image_path.storage.exists(kept.image_path.name))
+        self.assertFalse(any(os.path.exists(upload.path) for _, _, upload in uploads))
+
+
+class PredictTests(StubModelMixin, TestCase):
+    def setUp(self):
+        self.img = PILImage.open(BytesIO(make_image_bytes())).convert('RGB')
+
+    def test_analyze_matches_separate_calls(self):
+        top_preds, segmented = predict.analyze(self.img, top_k=3, selected_label='banana')
+
+        self.assertEqual(top_preds, predict.predict(self.img, top_k=3))
+        self.assertEqual(segmented, predict.segmented_predict(self.img, 'banana'))
+        self.assertIn(segmented['status'], ('Fresh', 'Rotten'))
+
+    def test_analyze_without_selection(self):
+        top_preds, segmented = predict.analyze(self.img, top_k=3)
+        self.assertEqual(len(top_preds), 3)
+        self.assertIsNone(segmented)
+
+
+class PredictViewTests(StubModelMixin, TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root, FOODLENS_ASYNC_PERSISTENCE=False)
+        self.settings_override.enable()
+        prediction_cache.clear()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def post_image(self, **extra):
+        data = {'image': BytesIO(make_image_bytes()), **extra}
+        data['image'].name = 'apple.jpg'
+        # uploads are stored once the request's transaction commits
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse('predict'), data)
+
+    def test_predict_returns_predictions_and_saves_image(self):
+        resp = self.post_image(produce_type='apple')
+
+        self.assertEqual(resp.status_code, 200)
+        body = resp.json()
+        self.assertEqual(len(body['predictions']), 3)
+        self.assertEqual(body['segmented_result']['produce_type'], 'apple')
+
+        image_obj = ImageModel.objects.get(id=body['image_id'])
+        self.assertEqual(image_obj.status, 'analyzed')
+        self.assertTrue(image_obj.image_path.storage.exists(image_obj.image_path.name))
+
+        result = AnalysisResult.objects.get(image=image_obj)
+        self.assertEqual(result.predictions['top_k'], body['predictions'])
+        self.assertEqual(result.model_revision, 'stub')
+
+    def test_cache_key_uses_the_revision_of_the_loaded_model(self):
+        # before loading, the registry only knows the hub revision; a backend
+        # or an exported artifact replaces it once the model is loaded
+        predict.registry.reset()
+        loaded = (build_stub_model(LABELS), 'exported@abc')
+        try:
+            with mock.patch.object(predict.registry, '_load', return_value=loaded):
+                self.assertEqual(self.post_image().status_code, 200)
+        finally:
+            predict.registry.set_model(build_stub_model(LABELS), revision='stub')
+
+        self.assertIsNotNone(prediction_cache.get(PredictionCache.key(make_image_bytes(), 'exported@abc')))
+        self.assertIsNone(prediction_cache.get(PredictionCache.key(make_image_bytes(), predict.registry.default_revision)))
+
+    def test_upload_is_stored_after_the_response(self):
+        data = {'image': BytesIO(make_image_bytes())}
+        data['image'].name = 'apple.jpg'
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            body = self.client.post(reverse('predict'), data).json()
+
+        self.assertEqual(ImageModel.objects.get(id=body['image_id']).status, 'pending')
+        self.assertEqual(len(callbacks), 2)  # upload + analysis result
+
+    def test_repeat_upload_is_served_from_cache(self):
+        first = self.post_image(produce_type='apple').json()
+
+        with mock.patch.object(predict, 'analyze') as analyze:
+            second = self.post_image(produce_type='apple').json()
+
+        analyze.assert_not_called()
+        self.assertEqual(second['predictions'], first['predictions'])
+        self.assertNotEqual(second['image_id'], first['image_id'])
+        self.assertEqual(prediction_cache.stats()['hits'], 1)
+
+    def test_unknown_produce_type_is_ignored(self):
+        resp = self.post_image(produce_type='durian')
+        self.assertIsNone(resp.json()['segmented_result'])
+
+    def test_missing_image(self):
+        resp = self.client.post(reverse('predict'))
+        self.assertEqual(resp.status_code, 400)
+
+    def test_unreadable_image(self):
+        data = {'image': BytesIO(b'not an image')}
+        data['image'].name = 'apple.jpg'
+        self.assertEqual(self.client.post(reverse('predict'), data).status_code, 400)
+
+    def test_oversized_uploads_are_rejected_before_decoding(self):
+        with mock.patch.object(predict, 'decode_image') as decode, \
+                mock.patch('classifier.ml_models.preprocessing.decode_image') as decode_direct:
+            with self.settings(FOODLENS_MAX_UPLOAD_BYTES=1000):
+                too_many_bytes = self.post_image()
+            with self.settings(FOODLENS_MAX_IMAGE_PIXELS=320 * 240 - 1):
+                too_many_pixels = self.post_image()
+
+        self.assertEqual(too_many_bytes.status_code, 413)
+        self.assertEqual(too_many_pixels.status_code, 413)
+        decode.assert_not_called()
+        decode_direct.assert_not_called()
+        self.assertFalse(ImageModel.objects.exists())
+
+    @override_settings(FILE_UPLOAD_MAX_MEMORY_SIZE=0)
+    def test_upload_spooled_to_disk_is_moved_into_storage(self):
+        spool_dir = tempfile.mkdtemp(dir=self.media_root)
+        image_bytes = make_image_bytes()
+        with self.settings(FILE_UPLOAD_TEMP_DIR=spool_dir):
+            body = self.post_image(produce_type='apple').json()
+
+        image_obj = ImageModel.objects.get(id=body['image_id'])
+        with image_obj.image_path.open('rb') as f:
+            self.assertEqual(f.read(), image_bytes)
+        self.assertEqual(os.listdir(spool_dir), [])  # request temp file and our link are both gone
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class AsyncPredictViewTests(StubModelMixin, TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root, FOODLENS_ASYNC_PERSISTENCE=False)
+        self.settings_override.enable()
+        prediction_cache.clear()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    async def post_image(self, image_bytes, **extra):
+        data = {'image': BytesIO(image_bytes), **extra}
+        data['image'].name = 'apple.jpg'
+        return await self.async_client.post('/predict/', data)
+
+    def test_async_view_answers_like_predict_view(self):
+        image_bytes = make_image_bytes()
+        # run from this thread so the view's sync_to_async calls share its transaction
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            resp = async_to_sync(self.post_image)(image_bytes, produce_type='apple')
+
+        self.assertEqual(resp.status_code, 200)
+        body = resp.json()
+        expected_top, expected_seg = predict.analyze(decode_image(image_bytes), selected_label='apple')
+        self.assertEqual(body['predictions'], expected_top)
+        self.assertEqual(body['segmented_result'], expected_seg)
+        self.assertEqual(len(callbacks), 2)  # upload + analysis result
+
+        image_obj = ImageModel.objects.get(id=body['image_id'])
+        self.assertEqual(image_obj.status, 'analyzed')
+        result = AnalysisResult.objects.get(image=image_obj)
+        self.assertEqual(result.model_revision, 'stub')
+
+    async def test_unreadable_image(self):
+        resp = await self.post_image(b'not an image')
+        self.assertEqual(resp.status_code, 400)
+
+    async def test_missing_image(self):
+        resp = await self.async_client.post('/predict/')
+        self.assertEqual(resp.status_code, 400)
+
+    async def test_inference_error(self):
+        with mock.patch.object(inference, 'analyze_images_async', side_effect=InferenceError('out of memory')):
+            resp = await self.post_image(make_image_bytes())
+        self.assertEqual((resp.status_code, resp.json()), (500, {'error': 'Prediction failed'}))
+
+
+class MetricsTests(TestCase):
+    def test_histogram_quantiles_interpolate_within_buckets(self):
+        histogram = Histogram('latency', 'test', buckets=(0.1, 0.2, 0.4))
+        for value in [0.05] * 50 + [0.15] * 45 + [0.3] * 5:
+            histogram.observe(value)
+
+        self.assertEqual(histogram.count(), 100)
+        self.assertAlmostEqual(histogram.quantile(0.5), 0.1)
+        self.assertAlmostEqual(histogram.quantile(0.95), 0.2)
+        self.assertAlmostEqual(histogram.quantile(0.99), 0.36)
+        self.assertIsNone(Histogram('empty', 'test', buckets=(1,)).quantile(0.5))
+
+    def test_exposition_is_cumulative(self):
+        histogram = Histogram('latency', 'test', buckets=(0.1, 0.2), labels=('stage',))
+        histogram.observe(0.05, 'decode')
+        histogram.observe(0.15, 'decode')
+        histogram.observe(5, 'decode')
+
+        lines = histogram.expose()
+        self.assertIn('latency_bucket{stage="decode",le="0.1"} 1', lines)
+        self.assertIn('latency_bucket{stage="decode",le="0.2"} 2', lines)
+        self.assertIn('latency_bucket{stage="decode",le="+Inf"} 3', lines)
+        self.assertIn('latency_count{stage="decode"} 3', lines)
+
+    def test_disabled_metrics_record_nothing(self):
+        disabled = Metrics()
+        with disabled.stage('forward'), disabled.stage('decode'):
+            pass
+        disabled.observe_batch(4)
+
+        self.assertIs(disabled.stage('forward'), disabled.stage('decode'))
+        self.assertEqual(disabled.stage_seconds.count('forward'), 0)
+        self.assertEqual(disabled.batch_size.count(), 0)
+
+    def test_request_collects_its_stages(self):
+        enabled = Metrics()
+        enabled.configure(enabled=True)
+        with enabled.request('predict') as timings:
+            with enabled.stage('decode'):
+                pass
+        with enabled.stage('forward'):  # outside any request
+            pass
+
+        self.assertEqual(set(timings), {'decode', 'total'})
+        self.assertEqual(enabled.request_seconds.count('predict'), 1)
+        self.assertEqual(enabled.stage_seconds.count('forward'), 1)
+
+
+class MetricsViewTests(StubModelMixin, TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root, FOODLENS_ASYNC_PERSISTENCE=False)
+        self.settings_override.enable()
+        prediction_cache.clear()
+        metrics.clear()
+        metrics.configure(enabled=True, server_timing=True)
+
+    def tearDown(self):
+        metrics.configure(enabled=False)
+        metrics.clear()
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def post_image(self):
+        data = {'image': BytesIO(make_image_bytes())}
+        data['image'].name = 'apple.jpg'
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse('predict'), data)
+
+    def test_predict_reports_server_timing(self):
+        resp = self.post_image()
+
+        self.assertEqual(resp.status_code, 200)
+        stages = {part.split(';')[0] for part in resp['Server-Timing'].split(', ')}
+        self.assertTrue({'parse', 'cache', 'inference', 'decode', 'preprocess', 'db', 'total'} <= stages)
+        self.assertEqual(metrics.requests.value('predict', '200'), 1)
+        self.assertEqual(metrics.stage_seconds.count('forward'), 1)
+        self.assertEqual(metrics.batch_size.count(), 1)
+
+    def test_metrics_endpoint(self):
+        self.post_image()
+        self.post_image()  # served from the cache
+        self.client.post(reverse('predict'))
+
+        body = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('foodlens_requests_total{view="predict",status="200"} 2', body)
+        self.assertIn('foodlens_requests_total{view="predict",status="400"} 1', body)
+        self.assertIn('foodlens_stage_seconds_count{stage="forward"} 1', body)
+        self.assertIn('foodlens_prediction_cache_hits_total 1', body)
+
+        stats = self.client.get(reverse('metrics'), {'format': 'json'}).json()
+        self.assertEqual(stats['requests']['predict']['count'], 3)
+        self.assertIsNotNone(stats['stages']['inference']['p99'])
+
+    def test_disabled(self):
+        metrics.configure(enabled=False)
+
+        self.assertNotIn('Server-Timing', self.post_image())
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 404)
+        self.assertEqual(metrics.requests.value('predict', '200'), 0)
+
+
+class InferenceServerTests(StubModelMixin, TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+        self.path = os.path.join(self.tmp, 'inference.sock')
+        self.server = InferenceServer(self.path, max_pending=2)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        self.media_root = tempfile.mkdtemp(dir=self.tmp)
+        self.settings_override = override_settings(
+            MEDIA_ROOT=self.media_root, FOODLENS_ASYNC_PERSISTENCE=False,
+            FOODLENS_INFERENCE_SERVER={'SOCKET': self.path, 'TIMEOUT': 5.0},
+        )
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        prediction_cache.clear()
+
+    def test_server_matches_in_process_inference(self):
+        images = [make_image_bytes(), b'not an image', make_image_bytes(color=(10, 200, 10))]
+        client = InferenceClient(self.path)
+
+        self.assertEqual(client.info()['revision'], 'stub')
+        results = client.analyze(images, top_k=3, selected_label='apple')
+
+        self.assertEqual(results, json.loads(json.dumps(analyze_local(images, 3, 'apple'))))
+        self.assertIn('error', results[1])
+
+    def test_async_client_matches_sync_client(self):
+        images = [make_image_bytes(), make_image_bytes(color=(10, 200, 10))]
+        client = InferenceClient(self.path)
+
+        self.assertEqual(async_to_sync(client.analyze_async)(images, 3, 'tomato'), client.analyze(images, 3, 'tomato'))
+        with self.assertRaises(InferenceUnavailable):
+            async_to_sync(InferenceClient(os.path.join(self.tmp, 'missing.sock')).info_async)()
+
+    def test_saturated_server_answers_busy(self):
+        for _ in range(2):
+            self.server._slots.acquire()
+        self.addCleanup(lambda: [self.server._slots.release() for _ in range(2)])
+
+        with self.assertRaises(InferenceBusy):
+            InferenceClient(self.path).analyze([make_image_bytes()])
+
+        data = {'image': BytesIO(make_image_bytes())}
+        data['image'].name = 'apple.jpg'
+        resp = self.client.post(reverse('predict'), data)
+        self.assertEqual(resp.status_code, 503)
+        self.assertEqual(resp['Retry-After'], '1')
+
+    def test_server_error_is_a_json_500(self):
+        data = {'image': BytesIO(make_image_bytes())}
+        data['image'].name = 'apple.jpg'
+        with mock.patch.object(inference, 'analyze_local', side_effect=RuntimeError('out of memory')), \
+                self.assertLogs('classifier.inference', 'ERROR'):
+            with self.assertRaises(InferenceError):
+                InferenceClient(self.path).analyze([make_image_bytes()])
+
+            data['image'].seek(0)
+            resp = self.client.post(reverse('predict'), data)
+            data['image'].seek(0)
+            batch = self.client.post(reverse('predict_batch'), {'images': [data['image']]})
+
+        self.assertEqual((resp.status_code, resp.json()), (500, {'error': 'Prediction failed'}))
+        self.assertEqual((batch.status_code, batch.json()), (500, {'error': 'Prediction failed'}))
+        self.assertFalse(ImageModel.objects.exists())
+
+    def test_missing_server_is_unavailable(self):
+        with self.assertRaises(InferenceUnavailable):
+            InferenceClient(os.path.join(self.tmp, 'missing.sock')).info()
+
+    def test_predict_view_uses_the_server(self):
+        data = {'image': BytesIO(make_image_bytes())}
+        data['image'].name = 'apple.jpg'
+        with mock.patch.object(inference, 'analyze_local', wraps=inference.analyze_local) as local:
+            with self.captureOnCommitCallbacks(execute=True):
+                resp = self.client.post(reverse('predict'), data)
+
+        self.assertEqual(resp.status_code, 200)
+        local.assert_called_once()  # by the server thread, reached through the socket
+        result = AnalysisResult.objects.get(image_id=resp.json()['image_id'])
+        self.assertEqual(result.model_revision, 'stub')
+
+
+class LoadTestTests(StubModelMixin, LiveServerTestCase):
+    # the live server shares one in-memory SQLite connection between its
+    # threads, so these tests keep a single request in flight
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(
+            MEDIA_ROOT=self.media_root, FOODLENS_ASYNC_PERSISTENCE=False,
+            PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+        )
+        self.settings_override.enable()
+        prediction_cache.clear()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def test_synthesized_mix_reaches_every_endpoint(self):
+        schedule = synthesize(rate=40, duration=1, mix={'predict': 1, 'feedback': 1, 'login': 1, 'signup': 1})
+        loadtest = LoadTest(self.live_server_url, [make_image_bytes()], workers=1, users=2)
+        loadtest.setup()
+
+        report = loadtest.run(schedule)
+
+        self.assertEqual(report['all']['count'], len(schedule))
+        self.assertEqual(set(report), {'predict', 'feedback', 'login', 'signup', 'all'})
+        for endpoint, stats in report.items():
+            self.assertEqual(stats['statuses'], {'200': stats['count']}, endpoint)
+        self.assertEqual(User.objects.filter(username__startswith='loadtest-').count(), 2 + report['signup']['count'])
+
+    def test_replays_trace_in_order(self):
+        path = os.path.join(self.media_root, 'trace.jsonl')
+        with open(path, 'w') as f:
+            f.write('{"at": 1700000000.5, "endpoint": "feedback"}\n')
+            f.write('{"at": 1700000000.0, "endpoint": "predict", "produce_type": "apple"}\n')
+
+        schedule = read_trace(path, speed=2)
+        self.assertEqual([(offset, entry['endpoint']) for offset, entry in schedule], [(0, 'predict'), (0.25, 'feedback')])
+
+        loadtest = LoadTest(self.live_server_url, [make_image_bytes()], workers=1, users=0)
+        loadtest.setup()
+        report = loadtest.run(schedule)
+        self.assertEqual(report['all']['error_rate'], 0)
+        self.assertEqual(Feedback.objects.count(), 1)
+
+    def test_command_writes_a_report_per_rate(self):
+        output = os.path.join(self.media_root, 'report.json')
+        call_command('loadtest', url=self.live_server_url, rate=[5, 10], duration=0.5, workers=1, users=1,
+                     output=output, stdout=StringIO())
+
+        with open(output) as f:
+            steps = json.load(f)['steps']
+        self.assertEqual([step['step'] for step in steps], ['5/s', '10/s'])
+        self.assertTrue(all(step['endpoints']['all']['error_rate'] == 0 for step in steps))
+
+
+class PredictBatchViewTests(StubModelMixin, TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root, FOODLENS_ASYNC_PERSISTENCE=False)
+        self.settings_override.enable()
+        prediction_cache.clear()
+        self.images = [make_image_bytes(color=(i * 40, 100, 50)) for i in range(3)]
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def post(self, *args, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse('predict_batch'), *args, **kwargs)
+
+    def named(self, data, name):
+        f = BytesIO(data)
+        f.name = name
+        return f
+
+    def test_multipart_images_are_classified_in_one_batch(self):
+        files = [self.named(data, f'frame{i}.jpg') for i, data in enumerate(self.images)]
+
+        with mock.patch.object(predict, '_run_model', wraps=predict._run_model) as run_model:
+            resp = self.post({'images': files, 'produce_type': 'tomato'})
+
+        self.assertEqual(resp.status_code, 200)
+        body = resp.json()['results']
+        self.assertEqual([r['name'] for r in body], ['frame0.jpg', 'frame1.jpg', 'frame2.jpg'])
+        self.assertTrue(all(r['segmented_result']['produce_type'] == 'tomato' for r in body))
+        self.assertEqual(run_model.call_count, 1)
+        self.assertEqual(ImageModel.objects.filter(status='analyzed').count(), 3)
+        self.assertEqual(AnalysisResult.objects.count(), 3)
+
+    def test_zip_archive_upload(self):
+        buf = BytesIO()
+        with zipfile.ZipFile(buf, 'w') as archive:
+            for i, data in enumerate(self.images):
+                archive.writestr(f'crate/frame{i}.jpg', data)
+
+        resp = self.post({'archive': self.named(buf.getvalue(), 'crate.zip')})
+
+        self.assertEqual(len(resp.json()['results']), 3)
+
+    @override_settings(DATA_UPLOAD_MAX_MEMORY_SIZE=4096)
+    def test_zip_body_larger_than_data_upload_max_memory_size(self):
+        buf = BytesIO()
+        with zipfile.ZipFile(buf, 'w', zipfile.ZIP_STORED) as archive:
+            for i in range(4):
+                archive.writestr(f'frame{i}.png', make_image_bytes(color=(i * 60, 0, 0), fmt='PNG'))
+                archive.writestr(f'noise{i}.bin', os.urandom(2048))
+        self.assertGreater(len(buf.getvalue()), settings.DATA_UPLOAD_MAX_MEMORY_SIZE)
+
+        resp = self.post(buf.getvalue(), content_type='application/zip')
+
+        self.assertEqual(resp.status_code, 200)
+        results = resp.json()['results']
+        self.assertEqual(sum(r['image_id'] is not None for r in results), 4)
+
+    def test_streamed_tar_body_reports_unreadable_members(self):
+        buf = BytesIO()
+        with tarfile.open(fileobj=buf, mode='w:gz') as archive:
+            for name, data in [('a.jpg', self.images[0]), ('notes.txt', b'not an image')]:
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                archive.addfile(info, BytesIO(data))
+
+        resp = self.post(buf.getvalue(), content_type='application/gzip')
+
+        a, notes = resp.json()['results']
+        self.assertIsNotNone(a['image_id'])
+        self.assertEqual(notes, {'name': 'notes.txt', 'image_id': None, 'error': 'Could not read image'})
+        self.assertEqual(ImageModel.objects.count(), 1)
+
+    @override_settings(FOODLENS_BATCH_MAX_IMAGES=2)
+    def test_too_many_images(self):
+        files = [self.named(data, f'frame{i}.jpg') for i, data in enumerate(self.images)]
+        self.assertEqual(self.post({'images': files}).status_code, 413)
+
+
+class ClassifyBulkCommandTests(StubModelMixin, TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.checkpoint = os.path.join(self.media_root, 'checkpoint.json')
+
+        produce = Produce.objects.create(name='unspecified', category='unknown')
+        self.images = []
+        for i in range(5):
+            image_obj = ImageModel(produce=produce, status='analyzed')
+            image_obj.image_path.save(f'img{i}.jpg', ContentFile(make_image_bytes(color=(i * 50, 0, 0))))
+            self.images.append(image_obj)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def classify(self, **options):
+        call_command('classify_bulk', workers=1, batch_size=2, checkpoint=self.checkpoint,
+                     stdout=StringIO(), **options)
+
+    def test_rescoring_the_table_resumes_from_checkpoint(self):
+        self.classify(limit=3, produce_type='apple')
+        self.assertEqual(AnalysisResult.objects.count(), 3)
+
+        self.classify(produce_type='apple')
+
+        self.assertEqual(
+            sorted(AnalysisResult.objects.values_list('image_id', flat=True)),
+            [image_obj.id for image_obj in self.images],
+        )
+        self.assertTrue(all(r.predictions['segmented'] for r in AnalysisResult.objects.all()))
+
+    def test_directory_creates_rows_for_unknown_files(self):
+        os.makedirs(os.path.join(self.media_root, 'scans'))
+        with open(os.path.join(self.media_root, 'scans', 'new.jpg'), 'wb') as f:
+            f.write(make_image_bytes())
+
+        self.classify(dir=os.path.join(self.media_root, 'scans'))
+
+        new_image = ImageModel.objects.get(image_path='scans/new.jpg')
+        self.assertEqual(AnalysisResult.objects.get().image, new_image)
+
+    def test_rows_created_for_stored_files_hold_a_reference(self):
+        storage = ImageModel._meta.get_field('image_path').storage
+        # a file another reference holds, e.g. a pending upload not yet attached to its row
+        held = storage.save('held.jpg', ContentFile(make_image_bytes(color=(0, 0, 200))))
+
+        self.classify(dir=os.path.join(self.media_root, 'cas'))
+        self.assertEqual(StoredFile.objects.get(name=held).refcount, 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ImageModel.objects.exclude(pk__in=[image_obj.pk for image_obj in self.images]).delete()
+
+        self.assertEqual(StoredFile.objects.get(name=held).refcount, 1)
+        for name in [held, *(image_obj.image_path.name for image_obj in self.images)]:
+            self.assertTrue(storage.exists(name))
+
+    def test_directory_walk_leaves_out_derivatives(self):
+        call_command('create_derivatives', workers=1, batch_size=2, stdout=StringIO())
+        self.assertTrue(ImageModel.objects.exclude(display_path='').exists())
+
+        for directory in ('cas', ''):  # the content-addressed tree, or all of MEDIA_ROOT
+            self.classify(dir=os.path.join(self.media_root, directory), restart=True)
+
+            self.assertEqual(ImageModel.objects.count(), len(self.images))
+            self.assertEqual(
+                sorted(AnalysisResult.objects.values_list('image_id', flat=True)),
+                [image_obj.id for image_obj in self.images],
+            )
+            AnalysisResult.objects.all().delete()
+
+    def test_directory_resume_follows_the_walk_order(self):
+        scans = os.path.join(self.media_root, 'scans')
+        for name in ('z.jpg', 'a/b.jpg', 'a/x/d.jpg', 'a-b/c.jpg'):
+            os.makedirs(os.path.dirname(os.path.join(scans, name)), exist_ok=True)
+            with open(os.path.join(scans, name), 'wb') as f:
+                f.write(make_image_bytes())
+
+        # walked as z.jpg, a/b.jpg, a/x/d.jpg, a-b/c.jpg; interrupted after each step
+        for limit in (1, 2, None):
+            self.classify(dir=scans, limit=limit)
+
+        scored = AnalysisResult.objects.values_list('image__image_path', flat=True)
+        self.assertEqual(sorted(scored), ['scans/a-b/c.jpg', 'scans/a/b.jpg', 'scans/a/x/d.jpg', 'scans/z.jpg'])
+
+    def test_model_copies_score_like_the_originals(self):
+        self.classify(produce_type='apple')
+        from_originals = {r.image_id: r.predictions for r in AnalysisResult.objects.all()}
+        AnalysisResult.objects.all().delete()
+
+        call_command('create_derivatives', workers=1, batch_size=2, stdout=StringIO())
+        for image_obj in self.images:  # only the copies are left to read
+            os.remove(image_obj.image_path.path)
+        self.classify(produce_type='apple', restart=True)
+
+        self.assertEqual({r.image_id: r.predictions for r in AnalysisResult.objects.all()}, from_originals)
+
+
+class DerivativesTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root, FOODLENS_ASYNC_PERSISTENCE=False)
+        self.settings_override.enable()
+        self.produce = Produce.objects.create(name='unspecified', category='unknown')
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def test_render_caps_sizes_and_keeps_model_pixels_exact(self):
+        original = make_image_bytes(size=(3000, 2000))
+        rendered = derivatives.render(BytesIO(original), {**derivatives.options(), 'DISPLAY_SIZE': 1200})
+
+        sizes = {field: PILImage.open(BytesIO(data)).size for field, (_, data) in rendered.items()}
+        self.assertEqual(sizes, {'display_path': (1200, 800), 'thumbnail_path': (256, 171), 'model_input_path': (224, 224)})
+        self.assertLess(len(rendered['display_path'][1]), len(original))
+        model_input = PILImage.open(BytesIO(rendered['model_input_path'][1])).convert('RGB')
+        self.assertEqual(model_input.tobytes(), load_pixels(BytesIO(original), size=224))
+
+    def test_stored_uploads_get_derivatives(self):
+        image_obj = ImageModel.objects.create(produce=self.produce)
+        store_upload(image_obj.id, 'apple.jpg', make_image_bytes(size=(640, 480)))
+
+        image_obj.refresh_from_db()
+        for field in derivatives.DERIVATIVE_FIELDS:
+            self.assertTrue(getattr(image_obj, field).name.endswith('.webp'), field)
+        with image_obj.thumbnail_path.open('rb') as f:
+            self.assertEqual(PILImage.open(f).size, (256, 192))
+
+    def test_unreadable_originals_are_skipped(self):
+        image_obj = ImageModel(produce=self.produce)
+        image_obj.image_path.save('broken.jpg', ContentFile(b'not an image'))
+
+        self.assertEqual(derivatives.create_derivatives([image_obj.id]), 0)
+        image_obj.refresh_from_db()
+        self.assertFalse(image_obj.display_path)
+
+
+# URLconf for AsyncPredictViewTests
+urlpatterns = [path('predict/', views.predict_view_async, name='predict')]
@@ -0,0 +1,159 @@
+import hashlib
+import os
+import tempfile
+import uuid
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.base import ContentFile
+from PIL import Image
+
+
+class UploadRejected(Exception):
+    """An upload over FOODLENS_MAX_UPLOAD_BYTES / FOODLENS_MAX_IMAGE_PIXELS, or not an image."""
+
+    def __init__(self, message, status=413):
+        super().__init__(message)
+        self.status = status
+
+
+def max_upload_bytes():
+    return getattr(settings, 'FOODLENS_MAX_UPLOAD_BYTES', 20 * 1024 * 1024)
+
+
+def max_image_pixels():
+    return getattr(settings, 'FOODLENS_MAX_IMAGE_PIXELS', 64 * 1000 * 1000)
+
+
+def check_content_length(request, max_bytes):
+    """Reject a request whose declared body is over max_bytes before any of it is parsed."""
+    try:
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        length = 0
+    if length > max_bytes:
+        raise UploadRejected(f"Uploads are limited to {max_bytes} bytes")
+
+
+def spool_body(request, max_bytes):
+    """
+    Copy a raw request body into a seekable file, kept in memory up to
+    FILE_UPLOAD_MAX_MEMORY_SIZE and on disk past it. Unlike request.body this
+    isn't capped at DATA_UPLOAD_MAX_MEMORY_SIZE; max_bytes bounds it instead
+    (also for bodies sent without a Content-Length).
+    """
+    spooled = tempfile.SpooledTemporaryFile(max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
+    size = 0
+    while chunk := request.read(64 * 1024):
+        size += len(chunk)
+        if size > max_bytes:
+            spooled.close()
+            raise UploadRejected(f"Uploads are limited to {max_bytes} bytes")
+        spooled.write(chunk)
+    spooled.seek(0)
+    return spooled
+
+
+def upload_bytes(uploaded_file) -> bytes:
+    """An upload's bytes; for one Django kept in memory, its buffer's own bytes object (no copy)."""
+    if hasattr(uploaded_file, 'temporary_file_path'):
+        uploaded_file.seek(0)
+        return uploaded_file.read()
+    # BytesIO.getvalue() hands back its buffer without a copy
+    return uploaded_file.file.getvalue()
+
+
+class SpooledUpload(File):
+    """
+    A hard link to an upload's temp file that outlives the request. Storage
+    backends with a temporary_file_path() fast path (FileSystemStorage) move it
+    into place instead of copying; close() removes whatever is left.
+    """
+
+    def __init__(self, path, name):
+        super().__init__(open(path, 'rb'), name)
+        self.path = path
+
+    def temporary_file_path(self):
+        return self.path
+
+    def close(self):
+        super().close()
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:  # moved into storage
+            pass
+
+
+class Upload:
+    """
+    One uploaded image, read once and then shared by the cache key, the
+    decoder and storage.
+
+    Small uploads (held in memory by Django) are taken as the upload buffer's
+    own bytes object without copying. Uploads Django spooled to disk stay on
+    disk: they are hashed in chunks, decoded from the path and moved (not
+    copied) into storage.
+    """
+
+    def __init__(self, uploaded_file):
+        self.name = uploaded_file.name
+        self.size = uploaded_file.size
+
+        if hasattr(uploaded_file, 'temporary_file_path'):
+            self.path, self.data = uploaded_file.temporary_file_path(), None
+            with open(self.path, 'rb') as f:
+                self.digest = hashlib.file_digest(f, 'sha256').hexdigest()
+        else:
+            self.path, self.data = None, upload_bytes(uploaded_file)
+            self.digest = hashlib.sha256(self.data).hexdigest()
+
+    @classmethod
+    def from_request(cls, uploaded_file, max_bytes=None, max_pixels=None):
+        """Read an upload, rejecting it on size or pixel count before anything decodes it."""
+        max_bytes = max_upload_bytes() if max_bytes is None else max_bytes
+        if uploaded_file.size > max_bytes:
+            raise UploadRejected(f"Uploads are limited to {max_bytes} bytes")
+
+        upload = cls(uploaded_file)
+        upload.check_pixels(max_image_pixels() if max_pixels is None else max_pixels)
+        return upload
+
+    @property
+    def source(self):
+        """What decode_image() reads: the bytes, or the temp file path."""
+        return self.data if self.data is not None else self.path
+
+    def read(self) -> bytes:
+        if self.data is not None:
+            return self.data
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+    def check_pixels(self, max_pixels):
+        """Parse just the image header and reject images over max_pixels."""
+        try:
+            with Image.open(self.path or BytesIO(self.data)) as img:
+                width, height = img.size
+        except Image.DecompressionBombError:
+            raise UploadRejected(f"Images are limited to {max_pixels} pixels") from None
+        except Exception:
+            raise UploadRejected("Could not read image", status=400) from None
+        if width * height > max_pixels:
+            raise UploadRejected(f"Images are limited to {max_pixels} pixels")
+
+    def content(self):
+        """A File for storage that stays valid after the request (and its temp file) is gone."""
+        if self.data is not None:
+            return ContentFile(self.data, self.name)
+
+        spool_dir = settings.FILE_UPLOAD_TEMP_DIR or tempfile.gettempdir()
+        spool_path = os.path.join(spool_dir, f'foodlens-{uuid.uuid4().hex}.upload')
+        try:
+            os.link(self.path, spool_path)
+        except OSError:  # no hard links here; pay for one copy
+            with open(self.path, 'rb') as src, open(spool_path, 'wb') as dst:
+                while chunk := src.read(1024 * 1024):
+                    dst.write(chunk)
+        return SpooledUpload(spool_path, self.name)
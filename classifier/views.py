@@ -1,49 +1,406 @@
-from django.http import JsonResponse
-from PIL import Image as PILImage
-from io import BytesIO
-from classifier.ml_models.predict import predict, segmented_predict, GROUPS  # import your function
+import functools
+import os
+import tarfile
+import zipfile
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.http import Http404, HttpResponse, JsonResponse
+from classifier import inference
+from classifier.cache import prediction_cache
+from classifier.metrics import metrics, server_timing
+from classifier.ml_models.labels import GROUPS
+from classifier.persistence import analysis_result, results, store_upload, store_uploads, writer
+from classifier.uploads import (
+    Upload, UploadRejected, check_content_length, max_upload_bytes, spool_body, upload_bytes,
+)
 from django.views.decorators.csrf import csrf_exempt
-from django.core.files.base import ContentFile
 from ui.models import Image as ImageModel, Produce as ProduceModel
 
+# allowance for multipart boundaries, headers and form fields around the image(s)
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+def _service_unavailable():
+    """503 for a saturated or unreachable inference server; clients should retry shortly."""
+    response = JsonResponse({"error": "Prediction service is busy, please retry"}, status=503)
+    response['Retry-After'] = '1'
+    return response
+
+
+def _inference_failed():
+    """500 for an inference server that answered with an error (it logs the traceback)."""
+    return JsonResponse({"error": "Prediction failed"}, status=500)
+
+
+def _instrumented(view_name):
+    """
+    Count a view's responses by status and time it (FOODLENS_METRICS). With
+    SERVER_TIMING the stages timed during the request are returned in a
+    Server-Timing header. Disabled, the view is called straight through.
+    """
+    def finish(response, timings):
+        metrics.requests.inc(view_name, str(response.status_code))
+        if metrics.server_timing:
+            response['Server-Timing'] = server_timing(timings)
+        return response
+
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @functools.wraps(view)
+            async def wrapper(request, *args, **kwargs):
+                if not metrics.enabled:
+                    return await view(request, *args, **kwargs)
+                try:
+                    with metrics.request(view_name) as timings:
+                        response = await view(request, *args, **kwargs)
+                except Exception:
+                    metrics.requests.inc(view_name, '500')
+                    raise
+                return finish(response, timings)
+        else:
+            @functools.wraps(view)
+            def wrapper(request, *args, **kwargs):
+                if not metrics.enabled:
+                    return view(request, *args, **kwargs)
+                try:
+                    with metrics.request(view_name) as timings:
+                        response = view(request, *args, **kwargs)
+                except Exception:
+                    metrics.requests.inc(view_name, '500')
+                    raise
+                return finish(response, timings)
+        return wrapper
+    return decorator
+
+
+def _read_upload(request):
+    """
+    (Upload, selected produce) for a predict request, or None without an image.
+    raises: UploadRejected for bodies, files or images over the limits
+    """
+    # multipart framing and the produce field add a little to the file itself
+    check_content_length(request, max_upload_bytes() + MULTIPART_OVERHEAD)
+    if "image" not in request.FILES:
+        return None
+    upload = Upload.from_request(request.FILES["image"])
+
+    # If user selected a produce type, also get the segmented prediction;
+    # both come out of the same forward pass
+    selected_produce = request.POST.get('produce_type')
+    if selected_produce not in GROUPS:
+        selected_produce = None
+
+    return upload, selected_produce
+
+
 @csrf_exempt
+@_instrumented('predict')
 def predict_view(request):
-    if request.method == "POST" and "image" in request.FILES:
-        uploaded_file = request.FILES["image"]  # InMemoryUploadedFile
+    try:
+        with metrics.stage('parse'):
+            upload = _read_upload(request) if request.method == "POST" else None
+    except UploadRejected as exc:
+        return JsonResponse({"error": str(exc)}, status=exc.status)
+    if upload is None:
+        return JsonResponse({"error": "No image uploaded"}, status=400)
+    upload, selected_produce = upload
+
+    try:
+        # re-uploads of the same photo reuse the earlier result
+        revision = inference.model_revision()
+        cache_key = prediction_cache.digest_key(upload.digest, revision, selected_produce)
+        with metrics.stage('cache'):
+            output = prediction_cache.get(cache_key)
 
-        # read bytes so we can both save the file and open with PIL
-        data = uploaded_file.read()
-        img = PILImage.open(BytesIO(data)).convert("RGB")
+        # run inference first; storing the upload doesn't need to hold up the response
+        if output is None:
+            with metrics.stage('inference'):
+                revision, (output,) = inference.analyze_images(
+                    [upload.source], top_k=3, selected_label=selected_produce
+                )
+            if "error" in output:
+                return JsonResponse(output, status=400)
+            # keyed by the revision that answered, in case it changed since the lookup
+            prediction_cache.set(prediction_cache.digest_key(upload.digest, revision, selected_produce), output)
+    except (inference.InferenceBusy, inference.InferenceUnavailable):
+        return _service_unavailable()
+    except inference.InferenceError:
+        return _inference_failed()
+    top_preds, segmented_result = output["predictions"], output["segmented_result"]
 
+    with metrics.stage('db'):
         # ensure there's at least one Produce to attach (app expects a produce FK)
         produce, _ = ProduceModel.objects.get_or_create(name='unspecified', defaults={'category': 'unknown'})
 
-        # create and save Image model instance
+        # one insert so the client gets an image_id for feedback; the file and
+        # the status updates are written in the background
         image_obj = ImageModel.objects.create(
             produce=produce,
             user=request.user if request.user.is_authenticated else None,
-            status='processing'
+            status='pending'
         )
-        # save the uploaded image file into the Image.image_path field
-        image_obj.image_path.save(uploaded_file.name, ContentFile(data))
-        image_obj.status = 'analyzed'
-        image_obj.save()
-
-        # Get top 3 predictions
-        top_preds = predict(img, top_k=3)
-
-        # If user selected a produce type, get segmented prediction
-        selected_produce = request.POST.get('produce_type')
-        segmented_result = None
-
-        if selected_produce and selected_produce in GROUPS:
-            segmented_result = segmented_predict(img, selected_produce)
-        
-        return JsonResponse({
-            "predictions": top_preds,
-            "segmented_result": segmented_result,
-            "available_produce": list(GROUPS.keys()),
-            "image_id": image_obj.id,
-        })
-    
-    return JsonResponse({"error": "No image uploaded"}, status=400)
\ No newline at end of file
+    _record_prediction(image_obj.id, upload, top_preds, segmented_result, revision)
+
+    return JsonResponse({
+        "predictions": top_preds,
+        "segmented_result": segmented_result,
+        "available_produce": list(GROUPS.keys()),
+        "image_id": image_obj.id,
+    })
+
+
+def _record_prediction(image_id, upload, top_preds, segmented_result, revision):
+    """Queue the upload and its AnalysisResult to be written once the request's transaction commits."""
+    writer.submit(store_upload, image_id, upload.name, upload.content())
+    results.add(analysis_result(image_id, top_preds, segmented_result, revision))
+
+
+@csrf_exempt
+@_instrumented('predict')
+async def predict_view_async(request):
+    """
+    predict_view for ASGI deployments (FOODLENS_ASYNC_PREDICT). Same request
+    and response; parsing the upload runs in a worker thread, inference and the
+    shared cache tier are awaited and the rows are written with the async ORM,
+    so a request waiting on the model doesn't hold a thread.
+    """
+    if request.method != "POST":
+        return JsonResponse({"error": "No image uploaded"}, status=400)
+
+    try:
+        with metrics.stage('parse'):
+            upload = await sync_to_async(_read_upload, thread_sensitive=False)(request)
+    except UploadRejected as exc:
+        return JsonResponse({"error": str(exc)}, status=exc.status)
+    if upload is None:
+        return JsonResponse({"error": "No image uploaded"}, status=400)
+    upload, selected_produce = upload
+
+    try:
+        # re-uploads of the same photo reuse the earlier result
+        revision = await inference.model_revision_async()
+        cache_key = prediction_cache.digest_key(upload.digest, revision, selected_produce)
+        with metrics.stage('cache'):
+            output = await prediction_cache.aget(cache_key)
+
+        if output is None:
+            with metrics.stage('inference'):
+                revision, (output,) = await inference.analyze_images_async(
+                    [upload.source], top_k=3, selected_label=selected_produce
+                )
+            if "error" in output:
+                return JsonResponse(output, status=400)
+            # keyed by the revision that answered, in case it changed since the lookup
+            await prediction_cache.aset(prediction_cache.digest_key(upload.digest, revision, selected_produce), output)
+    except (inference.InferenceBusy, inference.InferenceUnavailable):
+        return _service_unavailable()
+    except inference.InferenceError:
+        return _inference_failed()
+    top_preds, segmented_result = output["predictions"], output["segmented_result"]
+
+    with metrics.stage('db'):
+        produce, _ = await ProduceModel.objects.aget_or_create(name='unspecified', defaults={'category': 'unknown'})
+        user = await request.auser()
+        image_obj = await ImageModel.objects.acreate(
+            produce=produce,
+            user=user if user.is_authenticated else None,
+            status='pending'
+        )
+    # on_commit bookkeeping is sync-only; the writes themselves still happen in the background
+    await sync_to_async(_record_prediction)(image_obj.id, upload, top_preds, segmented_result, revision)
+
+    return JsonResponse({
+        "predictions": top_preds,
+        "segmented_result": segmented_result,
+        "available_produce": list(GROUPS.keys()),
+        "image_id": image_obj.id,
+    })
+
+
+ARCHIVE_CONTENT_TYPES = ('application/zip', 'application/x-tar', 'application/gzip', 'application/x-gtar')
+
+
+class TooManyImages(Exception):
+    pass
+
+
+def _read_archive(fileobj, max_images, max_bytes):
+    """
+    fileobj: zip or (optionally compressed) tar archive
+    returns: list of (name, bytes) for every regular file in it
+    raises: UploadRejected for a member over max_bytes (before reading it)
+    Tars are read as a stream; zips need a seekable file.
+    """
+    members = []
+    seekable = getattr(fileobj, 'seekable', lambda: False)()
+
+    def add(name, size, read):
+        name = os.path.basename(name)
+        if not name or name.startswith('.'):  # skip macOS resource forks and dotfiles
+            return
+        if len(members) >= max_images:
+            raise TooManyImages()
+        if size > max_bytes:
+            raise UploadRejected(f"{name} is over the {max_bytes} byte limit")
+        members.append((name, read()))
+
+    if seekable and zipfile.is_zipfile(fileobj):
+        fileobj.seek(0)
+        with zipfile.ZipFile(fileobj) as archive:
+            for info in archive.infolist():
+                if not info.is_dir():
+                    add(info.filename, info.file_size, lambda: archive.read(info))
+        return members
+
+    if seekable:
+        fileobj.seek(0)
+    try:
+        with tarfile.open(fileobj=fileobj, mode='r|*') as archive:
+            for member in archive:
+                if member.isfile():
+                    add(member.name, member.size, archive.extractfile(member).read)
+    except tarfile.TarError as exc:
+        raise ValueError(f"Unreadable archive: {exc}") from None
+    return members
+
+
+def _batch_uploads(request, max_images):
+    """Collect (name, bytes) for every image in a batch request."""
+    max_bytes = max_upload_bytes()
+    max_request_bytes = max_bytes * max_images + MULTIPART_OVERHEAD
+    check_content_length(request, max_request_bytes)
+
+    content_type = request.content_type
+    if content_type in ARCHIVE_CONTENT_TYPES:
+        # archive posted as the raw request body; zips are read from the end,
+        # so they are spooled (not request.body, which stops at DATA_UPLOAD_MAX_MEMORY_SIZE)
+        if content_type != 'application/zip':
+            return _read_archive(request, max_images, max_bytes)
+        with spool_body(request, max_request_bytes) as body:
+            return _read_archive(body, max_images, max_bytes)
+
+    if 'archive' in request.FILES:
+        return _read_archive(request.FILES['archive'], max_images, max_bytes)
+
+    files = request.FILES.getlist('images')
+    if len(files) > max_images:
+        raise TooManyImages()
+    for f in files:
+        if f.size > max_bytes:
+            raise UploadRejected(f"{f.name} is over the {max_bytes} byte limit")
+    return [(f.name, upload_bytes(f)) for f in files]
+
+
+@csrf_exempt
+@_instrumented('predict_batch')
+def predict_batch_view(request):
+    """
+    Classify many images in one request.
+    Accepts multipart 'images' (repeated), a multipart 'archive' (zip/tar), or
+    a zip/tar archive as the request body, plus an optional 'produce_type'
+    (form field or query parameter) applied to every image.
+    Returns one result per image, in upload order.
+    """
+    if request.method != "POST":
+        return JsonResponse({"error": "Invalid method"}, status=405)
+
+    max_images = getattr(settings, 'FOODLENS_BATCH_MAX_IMAGES', 64)
+    try:
+        with metrics.stage('parse'):
+            uploads = _batch_uploads(request, max_images)
+    except TooManyImages:
+        return JsonResponse({"error": f"At most {max_images} images per request"}, status=413)
+    except UploadRejected as exc:
+        return JsonResponse({"error": str(exc)}, status=exc.status)
+    except ValueError as exc:
+        return JsonResponse({"error": str(exc)}, status=400)
+
+    if not uploads:
+        return JsonResponse({"error": "No image uploaded"}, status=400)
+
+    selected_produce = request.POST.get('produce_type') or request.GET.get('produce_type')
+    if selected_produce not in GROUPS:
+        selected_produce = None
+
+    try:
+        # serve what we can from the cache
+        revision = inference.model_revision()
+        with metrics.stage('cache'):
+            cache_keys = [prediction_cache.key(data, revision, selected_produce) for _, data in uploads]
+            outputs = [prediction_cache.get(key) for key in cache_keys]
+
+        # one batched inference for every image not in the cache
+        to_run = [i for i, output in enumerate(outputs) if output is None]
+        if to_run:
+            looked_up = revision
+            with metrics.stage('inference'):
+                revision, batch_outputs = inference.analyze_images(
+                    [uploads[i][1] for i in to_run], top_k=3, selected_label=selected_produce
+                )
+            if revision != looked_up:  # cache under the revision that answered
+                cache_keys = [prediction_cache.key(data, revision, selected_produce) for _, data in uploads]
+            for i, output in zip(to_run, batch_outputs):
+                outputs[i] = output
+                if "error" not in output:
+                    prediction_cache.set(cache_keys[i], output)
+    except (inference.InferenceBusy, inference.InferenceUnavailable):
+        return _service_unavailable()
+    except inference.InferenceError:
+        return _inference_failed()
+
+    with metrics.stage('db'):
+        # ensure there's at least one Produce to attach (app expects a produce FK)
+        produce, _ = ProduceModel.objects.get_or_create(name='unspecified', defaults={'category': 'unknown'})
+
+        # one bulk insert for the rows; files, statuses and results are written in the background
+        readable = [i for i, output in enumerate(outputs) if "error" not in output]
+        image_objs = ImageModel.objects.bulk_create([
+            ImageModel(
+                produce=produce,
+                user=request.user if request.user.is_authenticated else None,
+                status='pending',
+            )
+            for _ in readable
+        ])
+    writer.submit(store_uploads, [(image_obj.id, *uploads[i]) for image_obj, i in zip(image_objs, readable)])
+    results.add(*[
+        analysis_result(image_obj.id, outputs[i]["predictions"], outputs[i]["segmented_result"], revision)
+        for image_obj, i in zip(image_objs, readable)
+    ])
+
+    image_ids = {i: image_obj.id for image_obj, i in zip(image_objs, readable)}
+    return JsonResponse({
+        "results": [
+            {"name": name, "image_id": image_ids.get(i), **output}
+            for i, ((name, _), output) in enumerate(zip(uploads, outputs))
+        ],
+        "available_produce": list(GROUPS.keys()),
+    })
+
+
+def metrics_view(request):
+    """
+    This process's metrics (FOODLENS_METRICS) in the Prometheus text format,
+    or as p50/p95/p99 per stage with ?format=json. 404 while metrics are off.
+    """
+    if not metrics.enabled:
+        raise Http404("Metrics are disabled")
+
+    cache_stats = prediction_cache.stats()
+    if request.GET.get('format') == 'json':
+        return JsonResponse({**metrics.snapshot(), 'prediction_cache': cache_stats})
+
+    lines = metrics.expose()
+    for name in ('hits', 'shared_hits', 'misses'):
+        lines += [
+            f'# HELP foodlens_prediction_cache_{name}_total Prediction cache {name.replace("_", " ")}.',
+            f'# TYPE foodlens_prediction_cache_{name}_total counter',
+            f'foodlens_prediction_cache_{name}_total {cache_stats[name]}',
+        ]
+    lines += [
+        '# HELP foodlens_prediction_cache_entries Results held in the in-process prediction cache.',
+        '# TYPE foodlens_prediction_cache_entries gauge',
+        f'foodlens_prediction_cache_entries {cache_stats["entries"]}',
+    ]
+    return HttpResponse('\n'.join(lines) + '\n', content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -39,6 +40,7 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'ui',
+    'classifier',
 ]
 
 MIDDLEWARE = [
@@ -74,12 +76,48 @@ WSGI_APPLICATION = 'foodLens.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# FOODLENS_DATABASE (environment) picks the database profile; both keep
+# connections open for FOODLENS_CONN_MAX_AGE seconds instead of reconnecting
+# on every request (set it to 0 under ASGI).
+#
+# sqlite (default): db.sqlite3 in WAL mode, so readers and the one writer
+# don't block each other, with synchronous=NORMAL (commits don't fsync; a
+# power cut can lose the last transactions but not corrupt the file).
+# Transactions take the write lock when they begin (IMMEDIATE) and wait up to
+# 'timeout' seconds for it, instead of failing with "database is locked" when
+# two of them try to upgrade from reading to writing at once.
+#
+# postgres: POSTGRES_DB, POSTGRES_USER, POSTGRES_PASSWORD, POSTGRES_HOST and
+# POSTGRES_PORT, for many concurrent writers (needs psycopg installed).
+FOODLENS_DATABASE = os.environ.get('FOODLENS_DATABASE', 'sqlite')
+FOODLENS_CONN_MAX_AGE = int(os.environ.get('FOODLENS_CONN_MAX_AGE', 60))
+
+if FOODLENS_DATABASE == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('POSTGRES_DB', 'foodlens'),
+            'USER': os.environ.get('POSTGRES_USER', 'foodlens'),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+            'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+            'CONN_MAX_AGE': FOODLENS_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            'CONN_MAX_AGE': FOODLENS_CONN_MAX_AGE,
+            'OPTIONS': {
+                'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL',
+                'transaction_mode': 'IMMEDIATE',
+                'timeout': 20,
+            },
+        }
     }
-}
 
 
 # Password validation
@@ -119,7 +157,104 @@ USE_TZ = True
 STATIC_URL = 'static/'
 STATICFILES_DIRS = [BASE_DIR / "static"]
 
+# Uploads and their derivatives. Under DEBUG they are served at MEDIA_URL by
+# foodLens.urls; in production point the web server at MEDIA_ROOT instead.
+MEDIA_URL = 'media/'
+MEDIA_ROOT = os.environ.get('FOODLENS_MEDIA_ROOT', BASE_DIR / 'media')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# FoodLens classifier
+# The model is loaded on the first prediction; set this to load it (and run a
+# dummy forward) when Django starts instead. `manage.py warmup_model` does the
+# same thing on demand, e.g. to pre-download the weights during a deploy.
+FOODLENS_WARMUP_ON_STARTUP = False
+
+# Load the weights in the process Django starts in, without a forward. Under a
+# forking server started with gunicorn --preload (or uwsgi without lazy-apps)
+# every worker then shares the master's copy instead of loading its own.
+# `manage.py measure_worker_memory` shows the per-worker difference.
+FOODLENS_PRELOAD_MODEL = False
+
+# Results are cached per (image bytes, model revision, produce type). MAX_ENTRIES
+# sizes the per-process LRU (0 disables it); BACKEND names a CACHES alias to
+# share results between workers, kept for TIMEOUT seconds.
+FOODLENS_PREDICTION_CACHE = {
+    'MAX_ENTRIES': 256,
+    'BACKEND': None,
+    'TIMEOUT': 60 * 60,
+}
+
+# predict_view answers as soon as inference is done; saving the upload and
+# updating Image.status happen on a background thread pool of this size.
+# Set FOODLENS_ASYNC_PERSISTENCE to False to do the writes inline.
+FOODLENS_ASYNC_PERSISTENCE = True
+FOODLENS_PERSISTENCE_WORKERS = 2
+
+# Every prediction is recorded as an AnalysisResult. Rows are buffered and
+# written with one bulk insert per FOODLENS_RESULT_BATCH_SIZE rows, or after
+# FOODLENS_RESULT_FLUSH_SECONDS, whichever comes first.
+FOODLENS_RESULT_BATCH_SIZE = 50
+FOODLENS_RESULT_FLUSH_SECONDS = 2.0
+
+# Uploads are rejected (413) before anything decodes them when the file is
+# over FOODLENS_MAX_UPLOAD_BYTES or its header declares more than
+# FOODLENS_MAX_IMAGE_PIXELS pixels. Requests whose Content-Length is already
+# over the limit are refused before the body is parsed.
+FOODLENS_MAX_UPLOAD_BYTES = 20 * 1024 * 1024
+FOODLENS_MAX_IMAGE_PIXELS = 64 * 1000 * 1000
+
+# Serve /predict/ with the async view, for ASGI deployments (foodLens.asgi).
+# Under WSGI leave this off: each request would pay for its own event loop.
+FOODLENS_ASYNC_PREDICT = False
+
+# Most images accepted by /predict/batch/ in one request (keep this below
+# DATA_UPLOAD_MAX_NUMBER_FILES, 100 by default, for multipart uploads).
+FOODLENS_BATCH_MAX_IMAGES = 64
+
+# Run inference in a separate `manage.py run_inference_server` process instead
+# of the web workers, reached over this Unix socket. Requests the server is too
+# busy for (or that don't finish within TIMEOUT seconds) get a 503 with
+# Retry-After; with FALLBACK_LOCAL an unreachable server makes the web worker
+# run the model itself instead. SOCKET = None runs inference in-process.
+FOODLENS_INFERENCE_SERVER = {
+    'SOCKET': None,
+    'TIMEOUT': 10.0,
+    'FALLBACK_LOCAL': False,
+}
+
+# Per-stage latency histograms (parse, cache, decode, preprocess, forward, db,
+# ...), batch sizes and request/error counters, served in the Prometheus text
+# format at /metrics (and as percentiles at /metrics?format=json). Each process
+# keeps its own numbers. SERVER_TIMING also returns a request's stage timings
+# in a Server-Timing header, which browsers show in their network panel.
+FOODLENS_METRICS = {
+    'ENABLED': False,
+    'SERVER_TIMING': False,
+}
+
+# Store uploads under the SHA-256 of their bytes (cas/ab/cd/<hash>.jpg) so
+# identical photos are kept once; files are reference counted and removed
+# with the last Image row using them. Uploads saved under the older
+# uploads/%Y/%m/%d/ paths stay readable; `manage.py migrate_uploads` moves them.
+FOODLENS_CONTENT_ADDRESSED_UPLOADS = True
+
+# After an upload is stored, a background job writes smaller copies of it on
+# the Image row: display_path (longest side capped at DISPLAY_SIZE),
+# thumbnail_path (THUMBNAIL_SIZE) and model_input_path (the MODEL_SIZE pixels
+# the model reads, lossless, used by classify_bulk). FORMAT is WEBP or AVIF.
+# They are content-addressed under cas/derived/, apart from the originals.
+# `manage.py create_derivatives` fills them in for older uploads (--force
+# moves copies made before they had their own directory).
+FOODLENS_IMAGE_DERIVATIVES = {
+    'ENABLED': True,
+    'FORMAT': 'WEBP',
+    'QUALITY': 80,
+    'DISPLAY_SIZE': 1600,
+    'THUMBNAIL_SIZE': 256,
+    'MODEL_SIZE': 224,
+}
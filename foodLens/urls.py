@@ -14,6 +14,8 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
+from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path, include
 from classifier import views
@@ -23,5 +25,12 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('', ui_views.home, name='landing'),  # Signup page as landing page
     path('home/', include('ui.urls')),  # Home and other pages under /home/
-    path('predict/', views.predict_view, name='predict'),
+    path('predict/', views.predict_view_async if settings.FOODLENS_ASYNC_PREDICT else views.predict_view,
+         name='predict'),
+    path('predict/batch/', views.predict_batch_view, name='predict_batch'),
+    path('metrics', views.metrics_view, name='metrics'),
 ]
+
+# uploads and their derivatives; served by the web server in production
+if settings.DEBUG:
+    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -1,5 +1,54 @@
 from django.contrib import admin
-from .models import Produce, Image, AnalysisResult, Feedback
+from django.utils.html import format_html
+from .models import Produce, Image, AnalysisResult, Feedback, StoredFile
+from .pagination import VIEW_VARS, EstimatedCountPaginator, KeysetChangeList
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+	"""
+	Changelists for tables that grow without bound: capped/estimated counts
+	instead of COUNT(*) over the table, keyset pages in the default
+	newest-first order, and raw id inputs instead of <select>s of every
+	related row on the change form.
+	"""
+	paginator = EstimatedCountPaginator
+	show_full_result_count = False
+
+	def get_changelist(self, request, **kwargs):
+		return KeysetChangeList
+
+	def get_paginator(self, request, queryset, per_page, orphans=0, allow_empty_first_page=True):
+		# the default view (no filter, search or date in the query string) is
+		# about the whole table even when a default filter narrows it
+		unfiltered = True if set(request.GET) <= VIEW_VARS else None
+		return self.paginator(queryset, per_page, orphans, allow_empty_first_page, unfiltered=unfiltered)
+
+
+class LiveImageFilter(admin.SimpleListFilter):
+	"""Soft-deleted images are hidden unless asked for (the listing indexes cover live images)."""
+	title = 'deleted'
+	parameter_name = 'deleted'
+
+	def lookups(self, request, model_admin):
+		return (('yes', 'Yes'), ('all', 'All'))
+
+	def choices(self, changelist):
+		yield {
+			'selected': self.value() is None,
+			'query_string': changelist.get_query_string(remove=[self.parameter_name]),
+			'display': 'No',
+		}
+		for lookup, title in self.lookup_choices:
+			yield {
+				'selected': self.value() == lookup,
+				'query_string': changelist.get_query_string({self.parameter_name: lookup}),
+				'display': title,
+			}
+
+	def queryset(self, request, queryset):
+		if self.value() == 'all':
+			return queryset
+		return queryset.filter(deleted=self.value() == 'yes')
 
 
 @admin.register(Produce)
@@ -8,15 +57,38 @@ class ProduceAdmin(admin.ModelAdmin):
 
 
 @admin.register(Image)
-class ImageAdmin(admin.ModelAdmin):
-	list_display = ('id', 'produce', 'user', 'upload_timestamp', 'status')
+class ImageAdmin(LargeTableAdmin):
+	list_display = ('id', 'thumbnail', 'produce', 'user', 'upload_timestamp', 'status')
+	list_select_related = ('produce', 'user')
+	list_filter = (LiveImageFilter, 'status')
+	date_hierarchy = 'upload_timestamp'
+	raw_id_fields = ('produce', 'user')
+
+	@admin.display(description='Preview')
+	def thumbnail(self, obj):
+		# listings load the small derivative, never the original upload
+		if not obj.thumbnail_path:
+			return '-'
+		return format_html('<img src="{}" alt="" style="height: 48px">', obj.thumbnail_path.url)
 
 
 @admin.register(AnalysisResult)
-class AnalysisResultAdmin(admin.ModelAdmin):
+class AnalysisResultAdmin(LargeTableAdmin):
 	list_display = ('id', 'image', 'freshness_label', 'confidence_score', 'analyzed_at')
+	# the image column is Image.__str__, which names the produce
+	list_select_related = ('image__produce',)
+	date_hierarchy = 'analyzed_at'
+	raw_id_fields = ('image',)
 
 
 @admin.register(Feedback)
-class FeedbackAdmin(admin.ModelAdmin):
+class FeedbackAdmin(LargeTableAdmin):
 	list_display = ('id', 'image', 'user', 'is_helpful', 'session_key', 'created_at')
+	list_select_related = ('image__produce', 'user')
+	date_hierarchy = 'created_at'
+	raw_id_fields = ('image', 'user')
+
+
+@admin.register(StoredFile)
+class StoredFileAdmin(LargeTableAdmin):
+	list_display = ('id', 'name', 'size', 'refcount', 'created_at')
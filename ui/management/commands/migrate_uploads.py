@@ -0,0 +1,80 @@
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count
+
+from ui.models import Image as ImageModel, StoredFile
+from ui.storage import ContentAddressedStorage
+
+
+class _LocalFile(File):
+    """A file already on local disk; ContentAddressedStorage hard-links it instead of copying."""
+
+    def __init__(self, path, name):
+        super().__init__(open(path, 'rb'), name)
+        self.path = path
+
+    def temporary_file_path(self):
+        return self.path
+
+
+class Command(BaseCommand):
+    help = (
+        "Move uploads stored under date paths (uploads/%Y/%m/%d/) into content-addressed "
+        "storage, keeping one copy of identical files, and point their Image rows at them. "
+        "Safe to interrupt and run again."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Report what would move without changing anything.")
+        parser.add_argument('--keep-originals', action='store_true', help="Leave the date-path files in place.")
+        parser.add_argument('--batch-size', type=int, default=500, help="Files per database query (default 500).")
+
+    def handle(self, *args, **options):
+        storage = ImageModel._meta.get_field('image_path').storage
+        if not isinstance(storage, ContentAddressedStorage):
+            raise CommandError("Image uploads are not content-addressed (FOODLENS_CONTENT_ADDRESSED_UPLOADS is off)")
+
+        legacy = (
+            ImageModel.objects.exclude(image_path='').exclude(image_path__isnull=True)
+            .exclude(image_path__startswith=f'{storage.prefix}/')
+            .values('image_path').annotate(rows=Count('id')).order_by('image_path')
+        )
+
+        moved = rows_updated = duplicates = missing = freed = 0
+        last = ''
+        while True:
+            batch = list(legacy.filter(image_path__gt=last)[:options['batch_size']].values_list('image_path', 'rows'))
+            if not batch:
+                break
+            last = batch[-1][0]
+
+            for name, rows in batch:
+                if not storage.exists(name):
+                    missing += 1
+                    continue
+                size = storage.size(name)
+                if options['dry_run']:
+                    moved, rows_updated = moved + 1, rows_updated + rows
+                    continue
+
+                with _LocalFile(storage.path(name), name) as f, transaction.atomic():
+                    new_name = storage.save(name, f)
+                    # more than the reference just added: the bytes were already stored
+                    duplicate = StoredFile.objects.get(name=new_name).refcount > 1
+                    if rows > 1:
+                        storage.retain(new_name, rows - 1)
+                    ImageModel.objects.filter(image_path=name).update(image_path=new_name)
+
+                if not options['keep_originals']:
+                    storage.delete(name)
+                moved, rows_updated = moved + 1, rows_updated + rows
+                if duplicate:
+                    duplicates += 1
+                    freed += size
+
+        verb = "Would move" if options['dry_run'] else "Moved"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {moved} files for {rows_updated} images; {duplicates} were duplicates of stored files "
+            f"({freed / (1024 * 1024):.1f} MB saved), {missing} missing"
+        ))
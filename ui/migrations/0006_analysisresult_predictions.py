@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-18 08:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ui', '0005_merge_0004_alter_image_image_path_0004_userprofile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='analysisresult',
+            name='model_revision',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='analysisresult',
+            name='predictions',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:20
+
+import ui.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ui', '0006_analysisresult_predictions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('size', models.BigIntegerField(default=0)),
+                ('refcount', models.PositiveIntegerField(default=1)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='image',
+            name='image_path',
+            field=models.ImageField(blank=True, null=True, storage=ui.storage.upload_storage, upload_to='uploads/%Y/%m/%d/'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:23
+
+import ui.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ui', '0007_storedfile_alter_image_image_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='display_path',
+            field=models.ImageField(blank=True, null=True, storage=ui.storage.upload_storage, upload_to='derivatives/%Y/%m/%d/'),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='model_input_path',
+            field=models.ImageField(blank=True, null=True, storage=ui.storage.upload_storage, upload_to='derivatives/%Y/%m/%d/'),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='thumbnail_path',
+            field=models.ImageField(blank=True, null=True, storage=ui.storage.upload_storage, upload_to='derivatives/%Y/%m/%d/'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:29
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ui', '0008_image_derivatives'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='feedback',
+            index=models.Index(condition=models.Q(('session_key__isnull', False)), fields=['session_key', '-created_at'], name='feedback_session_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='feedback',
+            index=models.Index(fields=['user', '-created_at'], name='feedback_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='image',
+            index=models.Index(condition=models.Q(('deleted', False)), fields=['user', '-upload_timestamp'], name='image_user_live_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='image',
+            index=models.Index(condition=models.Q(('deleted', False)), fields=['-upload_timestamp'], name='image_live_uploaded_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='image',
+            index=models.Index(fields=['status', 'upload_timestamp'], name='image_status_uploaded_idx'),
+        ),
+    ]
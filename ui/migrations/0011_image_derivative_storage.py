@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-18 10:10
+
+import ui.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ui', '0010_admin_date_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='image',
+            name='display_path',
+            field=models.ImageField(blank=True, null=True, storage=ui.storage.derivative_storage, upload_to='derivatives/%Y/%m/%d/'),
+        ),
+        migrations.AlterField(
+            model_name='image',
+            name='model_input_path',
+            field=models.ImageField(blank=True, null=True, storage=ui.storage.derivative_storage, upload_to='derivatives/%Y/%m/%d/'),
+        ),
+        migrations.AlterField(
+            model_name='image',
+            name='thumbnail_path',
+            field=models.ImageField(blank=True, null=True, storage=ui.storage.derivative_storage, upload_to='derivatives/%Y/%m/%d/'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.7 on 2026-10-18 10:11
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ui', '0012_image_live_idx'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='feedback',
+            name='feedback_user_created_idx',
+        ),
+    ]
@@ -1,11 +1,13 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
 from django.core.validators import MinValueValidator, MaxValueValidator
 
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
+from .storage import derivative_storage, upload_storage
+
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
     show_instruction_popup = models.BooleanField(default=True)  # True = show on first load
@@ -47,8 +49,17 @@ class Image(models.Model):
         null=True,
         blank=True,
     )
-    # store uploaded image files using Django's ImageField so we can call `.save()` on it
-    image_path = models.ImageField(upload_to='uploads/%Y/%m/%d/', null=True, blank=True)
+    # store uploaded image files using Django's ImageField so we can call `.save()` on it;
+    # new files are named by content hash (ui.storage), upload_to only applies
+    # with FOODLENS_CONTENT_ADDRESSED_UPLOADS off
+    image_path = models.ImageField(upload_to='uploads/%Y/%m/%d/', storage=upload_storage, null=True, blank=True)
+    # smaller copies made off the request path (classifier.derivatives): a
+    # size-capped WebP for display, a thumbnail for listings and the model-size
+    # pixels (lossless) that re-scoring can read instead of the original;
+    # content-addressed apart from the originals (ui.storage.DerivativeStorage)
+    display_path = models.ImageField(upload_to='derivatives/%Y/%m/%d/', storage=derivative_storage, null=True, blank=True)
+    thumbnail_path = models.ImageField(upload_to='derivatives/%Y/%m/%d/', storage=derivative_storage, null=True, blank=True)
+    model_input_path = models.ImageField(upload_to='derivatives/%Y/%m/%d/', storage=derivative_storage, null=True, blank=True)
     upload_timestamp = models.DateTimeField(auto_now_add=True)
     status = models.CharField(
         max_length=20,
@@ -57,10 +68,42 @@ class Image(models.Model):
     )
     deleted = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            # a user's history: live images, newest first
+            models.Index(fields=['user', '-upload_timestamp'], condition=models.Q(deleted=False),
+                         name='image_user_live_idx'),
+            # the admin listing, which pages live images by primary key (ui.pagination.KeysetChangeList)
+            models.Index(fields=['-id'], condition=models.Q(deleted=False), name='image_live_idx'),
+            # rows by processing status (e.g. still waiting on the background writer)
+            models.Index(fields=['status', 'upload_timestamp'], name='image_status_uploaded_idx'),
+        ]
+
     def __str__(self):
         return f"Image {self.id} for {self.produce.name}"
 
 
+# content-addressed files can be shared between rows; drop this row's
+# references once its delete has committed
+@receiver(post_delete, sender=Image)
+def release_image_file(sender, instance, **kwargs):
+    for field in (instance.image_path, instance.display_path, instance.thumbnail_path, instance.model_input_path):
+        storage, name = field.storage, field.name
+        if name and getattr(storage, 'is_content_addressed', None) and storage.is_content_addressed(name):
+            transaction.on_commit(lambda storage=storage, name=name: storage.delete(name))
+
+
+class StoredFile(models.Model):
+    """A file in ui.storage.ContentAddressedStorage and how many references it has."""
+    name = models.CharField(max_length=255, unique=True)
+    size = models.BigIntegerField(default=0)
+    refcount = models.PositiveIntegerField(default=1)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.refcount} references)"
+
+
 class AnalysisResult(models.Model):
     FRESHNESS_LABELS = [
         ('good', 'Good'),
@@ -80,10 +123,13 @@ class AnalysisResult(models.Model):
     )
     defects_detected = models.JSONField(null=True, blank=True)  # Django can store JSON natively
     confidence_score = models.FloatField(null=True)
-    analyzed_at = models.DateTimeField(auto_now_add=True)
+    # raw model output (top-k labels and probabilities) and the weights that produced it
+    predictions = models.JSONField(null=True, blank=True)
+    model_revision = models.CharField(max_length=255, blank=True, default='')
+    analyzed_at = models.DateTimeField(auto_now_add=True, db_index=True)
 
     def __str__(self):
-        return f"Analysis for Image {self.image.id}"
+        return f"Analysis for Image {self.image_id}"
 
 
 class Review(models.Model):
@@ -122,7 +168,14 @@ class Feedback(models.Model):
     explanation = models.TextField(blank=True, null=True)
     # store session key so we can track anonymous visitors across requests
     session_key = models.CharField(max_length=40, null=True, blank=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            # feedback left by one visitor, newest first
+            models.Index(fields=['session_key', '-created_at'], condition=models.Q(session_key__isnull=False),
+                         name='feedback_session_idx'),
+        ]
 
     def __str__(self):
-        return f"Feedback {self.id} for Image {self.image.id} - helpful={self.is_helpful}"
+        return f"Feedback {self.id} for Image {self.image_id} - helpful={self.is_helpful}"
@@ -0,0 +1,130 @@
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import (
+    ALL_VAR, IS_FACETS_VAR, IS_POPUP_VAR, ORDER_VAR, PAGE_VAR, TO_FIELD_VAR, ChangeList,
+)
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Max
+from django.utils.functional import cached_property
+
+# query string parameters of the keyset links: the pk of the last row on the
+# page (older rows follow) or of the first (newer rows follow)
+AFTER_VAR = 'after'
+BEFORE_VAR = 'before'
+
+# query string parameters that page or sort a changelist without filtering it
+VIEW_VARS = {ALL_VAR, IS_FACETS_VAR, IS_POPUP_VAR, ORDER_VAR, PAGE_VAR, TO_FIELD_VAR, AFTER_VAR, BEFORE_VAR}
+
+
+def estimated_count(queryset):
+    """
+    Cheap row count of the queryset's whole table: the planner's estimate on
+    PostgreSQL, the highest primary key on SQLite (deleted rows make it an
+    overestimate). None where there is no cheap estimate.
+    """
+    connection = connections[queryset.db]
+    model = queryset.model
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [model._meta.db_table])
+            row = cursor.fetchone()
+        return row[0] if row and row[0] >= 0 else None  # -1: never analyzed
+    if connection.vendor == 'sqlite':
+        return model._default_manager.using(queryset.db).aggregate(highest=Max('pk'))['highest'] or 0
+    return None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Counts at most count_limit rows, so a changelist never runs COUNT(*) over
+    a whole large table. Past the limit the count of an unfiltered list is the
+    table estimate (count_is_estimate), and of a filtered one count_limit + 1
+    (shown as "more than count_limit").
+
+    unfiltered: whether the list is (about) the whole table; by default when
+                its query has no WHERE. LargeTableAdmin also passes it for a
+                list narrowed only by its default filters (hiding soft-deleted
+                images), which the table estimate still describes.
+    """
+
+    count_limit = 10000
+
+    def __init__(self, object_list, per_page, orphans=0, allow_empty_first_page=True, unfiltered=None):
+        super().__init__(object_list, per_page, orphans, allow_empty_first_page)
+        self.unfiltered = not object_list.query.where if unfiltered is None else unfiltered
+
+    @cached_property
+    def count(self):
+        capped = self.object_list.order_by()[:self.count_limit + 1].count()
+        if capped <= self.count_limit:
+            return capped
+        if self.unfiltered:
+            return max(estimated_count(self.object_list) or 0, capped)
+        return capped
+
+    @property
+    def count_is_exact(self):
+        return self.count <= self.count_limit
+
+    @property
+    def count_is_estimate(self):
+        return not self.count_is_exact and self.unfiltered
+
+
+class KeysetChangeList(ChangeList):
+    """
+    Pages a changelist in its default newest-first (-pk) order by primary key
+    (WHERE pk < last seen ... LIMIT n) instead of OFFSET, so the hundredth
+    page costs the same as the first. Sorting by a column falls back to
+    numbered pages.
+    """
+
+    def __init__(self, request, *args, **kwargs):
+        self.after = self._key(request, AFTER_VAR)
+        self.before = self._key(request, BEFORE_VAR)
+        super().__init__(request, *args, **kwargs)
+
+    @staticmethod
+    def _key(request, name):
+        value = request.GET.get(name)
+        if value is None:
+            return None
+        try:
+            return int(value)
+        except ValueError:
+            raise IncorrectLookupParameters(f'{name} must be a primary key')
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(AFTER_VAR, None)
+        lookup_params.pop(BEFORE_VAR, None)
+        return lookup_params
+
+    def get_query_string(self, new_params=None, remove=None):
+        # sorting, filter and facet links start again from the newest rows
+        return super().get_query_string(new_params, [*(remove or []), AFTER_VAR, BEFORE_VAR])
+
+    def get_results(self, request):
+        super().get_results(request)
+        self.keyset = self.queryset.query.order_by == ('-pk',) and not (self.show_all and self.can_show_all)
+        self.newer_url = self.older_url = None
+        if not self.keyset:
+            return
+
+        size = self.list_per_page
+        if self.before is not None:
+            rows = list(self.queryset.filter(pk__gt=self.before).order_by('pk')[:size + 1])
+            more_newer, more_older = len(rows) > size, True
+            rows = rows[:size][::-1]
+        else:
+            queryset = self.queryset if self.after is None else self.queryset.filter(pk__lt=self.after)
+            rows = list(queryset[:size + 1])
+            more_newer, more_older = self.after is not None, len(rows) > size
+            rows = rows[:size]
+
+        self.result_list = rows
+        self.multi_page = more_newer or more_older
+        if rows and more_newer:
+            self.newer_url = self.get_query_string({BEFORE_VAR: rows[0].pk, AFTER_VAR: None})
+        if rows and more_older:
+            self.older_url = self.get_query_string({AFTER_VAR: rows[-1].pk, BEFORE_VAR: None})
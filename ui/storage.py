@@ -0,0 +1,137 @@
+import hashlib
+import os
+import shutil
+import uuid
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Stores every file under the SHA-256 of its bytes, sharded into two levels
+    of hash-prefix directories (cas/ab/cd/abcd....jpg), so identical uploads
+    are written once and no directory grows past a few hundred entries.
+
+    Each save() of the same bytes adds a reference (ui.models.StoredFile) and
+    delete() drops one; the file is removed with its last reference. Names
+    outside the prefix (the older uploads/%Y/%m/%d/ files) are read and
+    deleted like in FileSystemStorage.
+    """
+
+    prefix = 'cas'
+    # subdirectory of the prefix this storage's files are sharded under ('' for the prefix itself)
+    namespace = ''
+
+    @property
+    def directory(self) -> str:
+        return f'{self.prefix}/{self.namespace}' if self.namespace else self.prefix
+
+    def content_name(self, digest: str, name: str = '') -> str:
+        """Storage name for bytes with this SHA-256 hex digest; name only contributes its extension."""
+        extension = os.path.splitext(name)[1].lower()
+        return f'{self.directory}/{digest[:2]}/{digest[2:4]}/{digest}{extension}'
+
+    def is_content_addressed(self, name: str) -> bool:
+        return bool(name) and name.startswith(f'{self.prefix}/')
+
+    def get_available_name(self, name, max_length=None):
+        # the name is derived from the content in _save(); nothing to probe for
+        return name
+
+    def _save(self, name, content):
+        digest, size = self._digest(content)
+        name = self.content_name(digest, name)
+        # reference first, so a concurrent delete of the last reference can't
+        # remove the file between the existence check and returning the name
+        self.retain(name, size=size)
+        if not self.exists(name):
+            self._write(name, content)
+        return name
+
+    def delete(self, name):
+        if not self.is_content_addressed(name):
+            return super().delete(name)
+
+        from ui.models import StoredFile
+
+        with transaction.atomic():
+            if StoredFile.objects.filter(name=name, refcount__lte=1).delete()[0]:
+                super().delete(name)
+            else:
+                StoredFile.objects.filter(name=name).update(refcount=F('refcount') - 1)
+
+    def retain(self, name: str, count: int = 1, size: int = None):
+        """Add count references to a stored file (save() adds one itself)."""
+        from ui.models import StoredFile
+
+        if StoredFile.objects.filter(name=name).update(refcount=F('refcount') + count):
+            return
+        try:
+            with transaction.atomic():
+                StoredFile.objects.create(name=name, size=size or 0, refcount=count)
+        except IntegrityError:  # stored concurrently
+            StoredFile.objects.filter(name=name).update(refcount=F('refcount') + count)
+
+    @staticmethod
+    def _digest(content):
+        """returns: (SHA-256 hex digest, size in bytes) of a File's content"""
+        if hasattr(content, 'temporary_file_path'):
+            with open(content.temporary_file_path(), 'rb') as f:
+                return hashlib.file_digest(f, 'sha256').hexdigest(), os.fstat(f.fileno()).st_size
+        digest, size = hashlib.sha256(), 0
+        for chunk in content.chunks():
+            digest.update(chunk)
+            size += len(chunk)
+        return digest.hexdigest(), size
+
+    def _write(self, name, content):
+        path = self.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # write beside the target and rename into place: readers never see a
+        # partial file, and two writers of the same name write the same bytes
+        tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        try:
+            if hasattr(content, 'temporary_file_path'):
+                try:
+                    os.link(content.temporary_file_path(), tmp_path)
+                except OSError:  # another filesystem
+                    shutil.copyfile(content.temporary_file_path(), tmp_path)
+            else:
+                with open(tmp_path, 'wb') as f:
+                    for chunk in content.chunks():
+                        f.write(chunk)
+            if self.file_permissions_mode is not None:
+                os.chmod(tmp_path, self.file_permissions_mode)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+
+def upload_storage():
+    """Storage for Image.image_path: content-addressed unless FOODLENS_CONTENT_ADDRESSED_UPLOADS is off."""
+    if getattr(settings, 'FOODLENS_CONTENT_ADDRESSED_UPLOADS', True):
+        return ContentAddressedStorage()
+    return default_storage
+
+
+class DerivativeStorage(ContentAddressedStorage):
+    """
+    ContentAddressedStorage for the smaller copies of uploads, sharded under
+    cas/derived/ rather than among the originals, so walking the uploads
+    (classify_bulk --dir) doesn't take them for photos. References are
+    counted in the same StoredFile table.
+    """
+
+    namespace = 'derived'
+
+
+def derivative_storage():
+    """Storage for the Image derivative fields, content-addressed like upload_storage()."""
+    if getattr(settings, 'FOODLENS_CONTENT_ADDRESSED_UPLOADS', True):
+        return DerivativeStorage()
+    return default_storage
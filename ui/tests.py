@@ -1,3 +1,321 @@
-from django.test import TestCase
+import hashlib
+import importlib
+import os
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import clear_url_caches, reverse
+
+import foodLens.urls
+
+from .admin import ImageAdmin
+from .models import AnalysisResult, Feedback, Image as ImageModel, Produce, StoredFile
+from .pagination import EstimatedCountPaginator
+from .storage import ContentAddressedStorage
+
+
+class StorageTestCase(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.produce = Produce.objects.create(name='test', category='test')
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def image(self, name, data):
+        image = ImageModel(produce=self.produce)
+        image.image_path.save(name, ContentFile(data))
+        return image
+
+    def files(self):
+        return sorted(
+            os.path.relpath(os.path.join(root, name), self.media_root)
+            for root, _, names in os.walk(self.media_root) for name in names
+        )
+
+
+class ContentAddressedStorageTests(StorageTestCase):
+    def test_identical_uploads_are_stored_once(self):
+        first = self.image('Banana.JPG', b'same bytes')
+        second = self.image('other.jpg', b'same bytes')
+        third = self.image('apple.jpg', b'other bytes')
+
+        digest = hashlib.sha256(b'same bytes').hexdigest()
+        self.assertEqual(first.image_path.name, f'cas/{digest[:2]}/{digest[2:4]}/{digest}.jpg')
+        self.assertEqual(second.image_path.name, first.image_path.name)
+        self.assertNotEqual(third.image_path.name, first.image_path.name)
+        self.assertEqual(len(self.files()), 2)
+        self.assertEqual(StoredFile.objects.get(name=first.image_path.name).refcount, 2)
+        with first.image_path.open('rb') as f:
+            self.assertEqual(f.read(), b'same bytes')
+
+    def test_file_is_removed_with_its_last_reference(self):
+        first = self.image('a.jpg', b'shared')
+        second = self.image('b.jpg', b'shared')
+        name = first.image_path.name
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(first.image_path.storage.exists(name))
+        self.assertEqual(StoredFile.objects.get(name=name).refcount, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(first.image_path.storage.exists(name))
+        self.assertFalse(StoredFile.objects.filter(name=name).exists())
+
+    def test_spooled_upload_is_linked_into_place(self):
+        upload = TemporaryUploadedFile('big.jpg', 'image/jpeg', 0, None)
+        upload.write(b'spooled bytes')
+        upload.flush()
+
+        image = ImageModel(produce=self.produce)
+        image.image_path.save('big.jpg', upload)
+        upload.close()
+
+        with image.image_path.open('rb') as f:
+            self.assertEqual(f.read(), b'spooled bytes')
+        self.assertEqual(StoredFile.objects.get(name=image.image_path.name).size, len(b'spooled bytes'))
+
+    def test_date_path_files_stay_readable(self):
+        os.makedirs(os.path.join(self.media_root, 'uploads/2025/11/25'))
+        with open(os.path.join(self.media_root, 'uploads/2025/11/25/Banana.webp'), 'wb') as f:
+            f.write(b'legacy')
+        image = ImageModel.objects.create(produce=self.produce, image_path='uploads/2025/11/25/Banana.webp')
+
+        with image.image_path.open('rb') as f:
+            self.assertEqual(f.read(), b'legacy')
+        self.assertIsInstance(image.image_path.storage, ContentAddressedStorage)
+
+
+class MediaServingTests(StorageTestCase):
+    def test_admin_thumbnails_are_served_under_debug(self):
+        admin = User.objects.create_superuser('moderator')
+        image = ImageModel.objects.create(produce=self.produce)
+        image.thumbnail_path.save('apple.thumb.webp', ContentFile(b'thumbnail'))
+        url = image.thumbnail_path.url
+        self.assertTrue(url.startswith(settings.MEDIA_URL))
+
+        self.client.force_login(admin)
+        self.assertContains(self.client.get(reverse('admin:ui_image_changelist')), f'src="{url}"')
+
+        # media routes are only added when DEBUG is on at import
+        try:
+            with override_settings(DEBUG=True):
+                importlib.reload(foodLens.urls)
+                clear_url_caches()
+                response = self.client.get(url)
+                self.assertEqual(b''.join(response.streaming_content), b'thumbnail')
+        finally:
+            importlib.reload(foodLens.urls)
+            clear_url_caches()
+
+
+class MigrateUploadsCommandTests(StorageTestCase):
+    def legacy(self, name, data, rows=1):
+        path = os.path.join(self.media_root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return [ImageModel.objects.create(produce=self.produce, image_path=name) for _ in range(rows)]
+
+    def test_moves_and_deduplicates_date_path_files(self):
+        stored = self.image('stored.webp', b'banana')
+        duplicates = self.legacy('uploads/2025/11/25/Banana.webp', b'banana', rows=2)
+        unique = self.legacy('uploads/2025/11/26/Apple.jpg', b'apple')
+        missing = ImageModel.objects.create(produce=self.produce, image_path='uploads/2025/11/27/gone.jpg')
+
+        out = StringIO()
+        call_command('migrate_uploads', batch_size=1, stdout=out)
+
+        self.assertIn('Moved 2 files for 3 images; 1 were duplicates', out.getvalue())
+        self.assertIn('1 missing', out.getvalue())
+        for image in duplicates:
+            image.refresh_from_db()
+            self.assertEqual(image.image_path.name, stored.image_path.name)
+        self.assertEqual(StoredFile.objects.get(name=stored.image_path.name).refcount, 3)
+
+        unique[0].refresh_from_db()
+        self.assertTrue(unique[0].image_path.name.startswith('cas/'))
+        with unique[0].image_path.open('rb') as f:
+            self.assertEqual(f.read(), b'apple')
+
+        missing.refresh_from_db()
+        self.assertEqual(missing.image_path.name, 'uploads/2025/11/27/gone.jpg')
+        self.assertFalse(any(name.startswith('uploads') for name in self.files()))
+
+    def test_dry_run_changes_nothing(self):
+        self.legacy('uploads/2025/11/25/Banana.webp', b'banana')
+
+        out = StringIO()
+        call_command('migrate_uploads', dry_run=True, stdout=out)
+
+        self.assertIn('Would move 1 files for 1 images', out.getvalue())
+        self.assertEqual(self.files(), ['uploads/2025/11/25/Banana.webp'])
+        self.assertFalse(StoredFile.objects.exists())
+
+
+class QueryPlanTests(TestCase):
+    """The listing queries should be answered from an index, without sorting the table."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('planner')
+        produce = Produce.objects.create(name='test', category='test')
+        image = ImageModel.objects.create(produce=produce, user=cls.user)
+        Feedback.objects.create(image=image, user=cls.user, session_key='abc')
+
+    def assertUsesIndex(self, query, index_name):
+        """query: a queryset, or the SQL of a query a view ran"""
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:  # tiny test tables would otherwise be scanned
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        plan = self.explain(query) if isinstance(query, str) else query.explain()
+        self.assertIn(index_name, plan)
+        self.assertNotIn('TEMP B-TREE', plan)  # SQLite sorting the rows itself
+
+    @staticmethod
+    def explain(sql):
+        prefix = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+        with connection.cursor() as cursor:
+            cursor.execute(prefix + sql)
+            return '\n'.join(' '.join(map(str, row)) for row in cursor.fetchall())
+
+    def test_history_of_a_user(self):
+        self.assertUsesIndex(
+            ImageModel.objects.filter(user=self.user, deleted=False).order_by('-upload_timestamp')[:20],
+            'image_user_live_idx',
+        )
+
+    def test_admin_listing(self):
+        self.client.force_login(User.objects.create_superuser('moderator'))
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('admin:ui_image_changelist'))
+
+        # the page of rows (the others are the capped count and the date hierarchy)
+        page, = [
+            query['sql'] for query in queries.captured_queries
+            if 'FROM "ui_image"' in query['sql'] and 'ORDER BY' in query['sql'] and 'LIMIT' in query['sql']
+        ]
+        self.assertUsesIndex(page, 'image_live_idx')
+
+    def test_images_by_status(self):
+        self.assertUsesIndex(
+            ImageModel.objects.filter(status='pending').order_by('upload_timestamp'),
+            'image_status_uploaded_idx',
+        )
+
+    def test_feedback_of_a_session(self):
+        self.assertUsesIndex(
+            Feedback.objects.filter(session_key='abc').order_by('-created_at'),
+            'feedback_session_idx',
+        )
+
+
+class AdminChangelistTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('moderator')
+        cls.produce = Produce.objects.create(name='apple', category='fruit')
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def add_images(self, count, **fields):
+        images = [ImageModel.objects.create(produce=self.produce, user=self.admin, **fields) for _ in range(count)]
+        for image in images:
+            AnalysisResult.objects.create(image=image, freshness_label='good')
+            Feedback.objects.create(image=image, user=self.admin, session_key='abc', is_helpful=True)
+        return images
+
+    def changelist(self, model_name, query=''):
+        response = self.client.get(f"{reverse(f'admin:ui_{model_name}_changelist')}{query}")
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_query_count_does_not_grow_with_rows(self):
+        self.add_images(2)
+        counts = {}
+        for model_name in ('image', 'analysisresult', 'feedback'):
+            with CaptureQueriesContext(connection) as queries:
+                self.changelist(model_name)
+            counts[model_name] = len(queries)
+
+        self.add_images(20)
+        for model_name, count in counts.items():
+            with self.assertNumQueries(count):
+                self.changelist(model_name)
+
+    def test_pages_by_primary_key(self):
+        images = self.add_images(25)
+        newest_first = [image.pk for image in reversed(images)]
+
+        with mock.patch.object(ImageAdmin, 'list_per_page', 10), CaptureQueriesContext(connection) as queries:
+            first = self.changelist('image')
+            second = self.changelist('image', first.context['cl'].older_url)
+            third = self.changelist('image', second.context['cl'].older_url)
+            back = self.changelist('image', third.context['cl'].newer_url)
+
+        pages = [[image.pk for image in response.context['cl'].result_list] for response in (first, second, third, back)]
+        self.assertEqual(pages, [newest_first[:10], newest_first[10:20], newest_first[20:], newest_first[10:20]])
+        self.assertIsNone(first.context['cl'].newer_url)
+        self.assertIsNone(third.context['cl'].older_url)
+        self.assertFalse(any('OFFSET' in query['sql'] for query in queries.captured_queries))
+
+    def test_soft_deleted_images_are_hidden_by_default(self):
+        live = self.add_images(1)[0]
+        gone = self.add_images(1, deleted=True)[0]
+
+        self.assertEqual(list(self.changelist('image').context['cl'].result_list), [live])
+        self.assertEqual(list(self.changelist('image', '?deleted=yes').context['cl'].result_list), [gone])
+        self.assertEqual(len(self.changelist('image', '?deleted=all').context['cl'].result_list), 2)
+
+    def test_large_tables_show_capped_counts(self):
+        self.add_images(8)
+        year = ImageModel.objects.first().upload_timestamp.year
+
+        with mock.patch.object(EstimatedCountPaginator, 'count_limit', 5):
+            unfiltered = self.changelist('analysisresult')
+            filtered = self.changelist('analysisresult', f'?analyzed_at__year={year}')
+
+        self.assertContains(unfiltered, 'About 8 analysis results')
+        self.assertContains(filtered, 'More than 5 analysis results')
+        self.assertContains(self.changelist('analysisresult'), '8 analysis results')
+
+    def test_default_live_view_shows_the_estimate(self):
+        self.add_images(7)
+        self.add_images(1, deleted=True)
+
+        with mock.patch.object(EstimatedCountPaginator, 'count_limit', 5):
+            live = self.changelist('image')
+            newest_first = self.changelist('image', '?o=-1')
+            deleted = self.changelist('image', '?deleted=yes')
+            by_status = self.changelist('image', '?status__exact=pending')
+
+        self.assertContains(live, 'About 8 images')  # the table estimate, soft-deleted rows included
+        self.assertContains(newest_first, 'About 8 images')
+        self.assertContains(deleted, '1 image')
+        self.assertContains(by_status, 'More than 5 images')
+
+    def test_plain_changelists_show_exact_counts(self):
+        Produce.objects.create(name='pear', category='fruit')
+        Produce.objects.create(name='plum', category='fruit')
+
+        response = self.changelist('produce')
+
+        self.assertContains(response, '3 produces')
+        self.assertNotContains(response, 'More than')
+        self.assertNotContains(response, 'About')
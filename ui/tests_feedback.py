@@ -1,4 +1,7 @@
-from django.test import TestCase, Client
+import shutil
+import tempfile
+
+from django.test import TestCase, Client, override_settings
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.urls import reverse
 
@@ -8,12 +11,19 @@ from django.contrib.auth.models import User
 
 class FeedbackEndpointTests(TestCase):
     def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
         self.client = Client()
         self.produce = Produce.objects.create(name='test', category='test')
         # create a small fake image file for the Image.image_path field
         img_file = SimpleUploadedFile('test.jpg', b'fake-image-content', content_type='image/jpeg')
         self.image = ImageModel.objects.create(produce=self.produce, image_path=img_file, status='analyzed')
 
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
     def test_anonymous_feedback_creates_entry_with_session(self):
         # ensure session exists
         session = self.client.session